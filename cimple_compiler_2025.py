@@ -1,11 +1,33 @@
 ﻿import re
 import os
 import sys
+import io
+import json
+import time
+import mmap
+import struct
+import socket
+import asyncio
+import hashlib
+import array
+import heapq
+import argparse
+import operator
+import itertools
+import contextlib
+import collections
+import concurrent.futures
+
+try:
+    import numpy as np
+except ImportError:                # Only the batch interpreter needs NumPy
+    np = None
 
 ###################################### SYMBOL TABLE CLASSES #########################################
 class Entity:
     def __init__(self, name):
         self.name = name
+        self.level = 0             # Nesting level of the declaring scope, set by add_entity
 
 class Variable(Entity):
     def __init__(self, name, datatype, offset):
@@ -17,27 +39,52 @@ class TemporaryVariable(Variable):
     def __init__(self, name, datatype="int", offset=0):
         super().__init__(name, datatype, offset)
 
+class Parameter(Variable):
+    def __init__(self, name, datatype, offset, mode):
+        super().__init__(name, datatype, offset)
+        self.mode = mode           # "in" or "inout"
+
+class Subprogram(Entity):
+    def __init__(self, name, kind):
+        super().__init__(name)
+        self.kind = kind           # "function" or "procedure"
+        self.parameters = []       # Parameter entities in declaration order
+        self.scope = None          # Scope of the body, kept after it is closed
+
+# Every frame starts with the return address, the saved display entry of its level and the
+# address for a function's result; parameters and locals follow at increasing offsets
+FRAME_HEADER = 12
+
 class Scope:
     def __init__(self, parent=None):
         self.parent = parent
+        self.level = parent.level + 1 if parent else 0   # Static nesting level, main is 0
         self.entities = {}         # Maps names to Entity instances
-        self.offset_counter = 0    # For allocating memory offsets
+        self.offset_counter = FRAME_HEADER   # For allocating memory offsets
 
     def add_entity(self, entity):
         if entity.name in self.entities:
             raise ValueError(f"Duplicate declaration: {entity.name}")
+        entity.level = self.level
         self.entities[entity.name] = entity
 
+    def allocate_offset(self):
+        offset = self.offset_counter
+        self.offset_counter += 4
+        return offset
+
     def find_entity(self, name):
-        if name in self.entities:
-            return self.entities[name]
-        elif self.parent:
-            return self.parent.find_entity(name)
+        scope = self
+        while scope is not None:
+            if name in scope.entities:
+                return scope.entities[name]
+            scope = scope.parent
         return None
 
 class SymbolTable:
     def __init__(self):
         self.scopes = []
+        self.subprograms = {}      # Maps subprogram names to Subprogram entities
 
     def open_scope(self):
         parent = self.scopes[-1] if self.scopes else None
@@ -57,10 +104,12 @@ class SymbolTable:
     def lookup(self, name):
         return self.current_scope().find_entity(name)
 
+    def declare_subprogram(self, subprogram):
+        self.declare(subprogram)
+        self.subprograms[subprogram.name] = subprogram
+
     def allocate_offset(self):
-        offset = self.current_scope().offset_counter
-        self.current_scope().offset_counter += 4
-        return offset
+        return self.current_scope().allocate_offset()
 
     def print_table(self):
         print("\n=== Symbol Table ===")
@@ -73,7 +122,30 @@ class SymbolTable:
         if self.scopes:
             print_scope(self.current_scope())
 
+###################################### QUAD OPERANDS #########################################
+# Operands stay strings, so the .int text and name-keyed lookups are unchanged, but they are
+# resolved once by the parser: constants carry their value and names carry their entity.
+class Operand(str):
+    pass
+
+class Constant(Operand):
+    def __new__(cls, value):
+        operand = super().__new__(cls, str(value))
+        operand.value = int(value)
+        return operand
+
+class VariableRef(Operand):
+    def __new__(cls, name, entity=None):
+        operand = super().__new__(cls, name)
+        operand.entity = entity
+        return operand
+
+class Temporary(VariableRef):
+    pass
+
 ###################################### LEXICAL ANALYSIS #########################################
+LEX_CHUNK_SIZE = 1 << 20   # Characters per chunk of the parallel lexer
+
 class Token:
     def __init__(self, recognized_string, family, line_number):
         self.recognized_string = recognized_string
@@ -97,11 +169,13 @@ class LexerFSM:
         self.tokens = []
         self.current_line = 1
 
-    def tokenize(self):
-        with open(self.file_path, 'r', encoding='utf-8') as file:
-            text = file.read()
+    def tokenize(self, text=None, in_comment=False):
+        # `in_comment` starts the text inside a #...# comment, for a chunk of a larger text
+        if text is None:
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                text = file.read()
 
-        state = self.START
+        state = self.COMMENT if in_comment else self.START
         i = 0
         lexeme = ""
         while i < len(text):
@@ -191,6 +265,62 @@ class LexerFSM:
                 raise ValueError(f"Error on line {self.current_line}: Unknown operator '{lexeme}'")
         return self.tokens
 
+    def tokenize_parallel(self, text=None, jobs=2, chunk_size=LEX_CHUNK_SIZE):
+        # Same tokens as tokenize(), with chunks of the text lexed in a process pool
+        if text is None:
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                text = file.read()
+        if jobs <= 1 or len(text) <= chunk_size:
+            return self.tokenize(text)
+        chunks = lex_chunks(text, chunk_size, self.current_line)
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            results = list(pool.map(lex_chunk, [(self.file_path,) + chunk for chunk in chunks]))
+        # Errors are reported by the first chunk that has one, which is the first in the text
+        for strings, families, lines, line, error in results:
+            if error is not None:
+                raise ValueError(error)
+            self.tokens += map(Token, strings, [TOKEN_FAMILIES[code] for code in families], lines)
+            self.current_line = line
+        return self.tokens
+
+def lex_chunks(text, chunk_size, first_line=1):
+    # Splits the text into (text, in_comment, first line) chunks.  A chunk ends at a blank (space,
+    # tab, CR or newline) at or after chunk_size characters, so no token can span two chunks,
+    # whatever the state there.  Every "#" opens or closes a comment, since the lexer ends any
+    # other token before it, so a chunk starts in a comment after an odd number of them.  The
+    # lexer does not count newlines inside comments, so neither does the first line of a chunk.
+    blank = re.compile(r"[ \t\r\n]")
+    chunks = []
+    start = 0
+    in_comment = False
+    line = first_line
+    while start < len(text):
+        match = blank.search(text, min(start + chunk_size, len(text)))
+        end = match.start() if match else len(text)
+        chunks.append((text[start:end], in_comment, line))
+        for number, piece in enumerate(text[start:end].split("#")):
+            if (number % 2 == 1) == in_comment:
+                line += piece.count("\n")
+        in_comment ^= text.count("#", start, end) % 2 == 1
+        start = end
+    return chunks
+
+TOKEN_FAMILIES = ["IDENTIFIER", "KEYWORD", "NUMBER", "OPERATOR", "SYMBOL"]
+
+def lex_chunk(chunk):
+    # Tokens of one chunk as (strings, family codes, line numbers), which cost much less to send
+    # back than Token objects, then the line after the chunk and the error message, if any
+    file_path, text, in_comment, line = chunk
+    lexer = LexerFSM(file_path)
+    lexer.current_line = line
+    try:
+        tokens = lexer.tokenize(text, in_comment)
+    except ValueError as error:
+        return None, None, None, None, str(error)
+    codes = {family: code for code, family in enumerate(TOKEN_FAMILIES)}
+    return ([token.recognized_string for token in tokens], bytes(codes[token.family] for token in tokens),
+            array.array("l", [token.line_number for token in tokens]), lexer.current_line, None)
+
 ###################################### SYNTAX ANALYSIS #########################################
 class Parser:
     def __init__(self, tokens, intermediate):
@@ -204,8 +334,12 @@ class Parser:
     def new_temp(self):
         temp_name = self.intermediate.newtemp()
         offset = self.symbol_table.allocate_offset()
-        self.symbol_table.declare(TemporaryVariable(temp_name, "int", offset))
-        return temp_name
+        entity = TemporaryVariable(temp_name, "int", offset)
+        self.symbol_table.declare(entity)
+        return Temporary(temp_name, entity)
+
+    def variable_ref(self, name):
+        return VariableRef(name, self.symbol_table.lookup(name))
 
     def match(self, expected_family, expected_value=None):
         if self.current_token is None:
@@ -226,6 +360,7 @@ class Parser:
         self.match("IDENTIFIER")
         self.declarations()
         self.subprograms()
+        self.intermediate.main_block = self.intermediate.nextquad()
         self.intermediate.genquad("begin_block", prog_name, "_", "_")
         self.statements()
         self.intermediate.genquad("halt", "_", "_", "_")
@@ -267,42 +402,49 @@ class Parser:
             func_name = self.current_token.recognized_string
             self.match("IDENTIFIER")
             self.intermediate.genquad("begin_block", func_name, "_", "_")
+            subprogram = Subprogram(func_name, "function")
+            self.symbol_table.declare_subprogram(subprogram)
+            self.symbol_table.open_scope()
             self.match("SYMBOL", "(")
-            self.formalparlist()
+            self.formalparlist(subprogram)
             self.match("SYMBOL", ")")
-            self.symbol_table.open_scope()
             self.block()
             self.intermediate.genquad("end_block", func_name, "_", "_")
-            self.symbol_table.close_scope()
+            subprogram.scope = self.symbol_table.close_scope()
         elif self.current_token.recognized_string == "procedure":
             self.match("KEYWORD", "procedure")
             proc_name = self.current_token.recognized_string
             self.match("IDENTIFIER")
             self.intermediate.genquad("begin_block", proc_name, "_", "_")
+            subprogram = Subprogram(proc_name, "procedure")
+            self.symbol_table.declare_subprogram(subprogram)
+            self.symbol_table.open_scope()
             self.match("SYMBOL", "(")
-            self.formalparlist()
+            self.formalparlist(subprogram)
             self.match("SYMBOL", ")")
-            self.symbol_table.open_scope()
             self.block()
             self.intermediate.genquad("end_block", proc_name, "_", "_")
-            self.symbol_table.close_scope()
+            subprogram.scope = self.symbol_table.close_scope()
         else:
             raise SyntaxError("Expected 'function' or 'procedure' in subprogram.")
 
-    def formalparlist(self):
+    def formalparlist(self, subprogram):
         if self.current_token and self.current_token.recognized_string in ("in", "inout"):
-            self.formalparitem()
+            self.formalparitem(subprogram)
             while self.current_token and self.current_token.recognized_string == ",":
                 self.match("SYMBOL", ",")
-                self.formalparitem()
+                self.formalparitem(subprogram)
 
-    def formalparitem(self):
-        if self.current_token.recognized_string == "in":
-            self.match("KEYWORD", "in")
-            self.match("IDENTIFIER")
-        elif self.current_token.recognized_string == "inout":
-            self.match("KEYWORD", "inout")
+    def formalparitem(self, subprogram):
+        if self.current_token.recognized_string in ("in", "inout"):
+            mode = self.current_token.recognized_string
+            self.match("KEYWORD", mode)
+            par_name = self.current_token.recognized_string
             self.match("IDENTIFIER")
+            offset = self.symbol_table.allocate_offset()
+            parameter = Parameter(par_name, "int", offset, mode)
+            self.symbol_table.declare(parameter)
+            subprogram.parameters.append(parameter)
         else:
             raise SyntaxError("Expected formal parameter starting with 'in' or 'inout'.")
 
@@ -345,7 +487,7 @@ class Parser:
             pass
 
     def assignStat(self):
-        lhs = self.current_token.recognized_string
+        lhs = self.variable_ref(self.current_token.recognized_string)
         self.match("IDENTIFIER")
         self.match("OPERATOR", ":=")
         result = self.expression()
@@ -369,7 +511,7 @@ class Parser:
     def inputStat(self):
         self.match("KEYWORD", "input")
         self.match("SYMBOL", "(")
-        input_var = self.current_token.recognized_string
+        input_var = self.variable_ref(self.current_token.recognized_string)
         self.match("IDENTIFIER")
         self.intermediate.genquad("in", input_var, "_", "_")
         self.match("SYMBOL", ")")
@@ -390,7 +532,7 @@ class Parser:
             return ("in", value)
         elif self.current_token.recognized_string == "inout":
             self.match("KEYWORD", "inout")
-            identifier = self.current_token.recognized_string
+            identifier = self.variable_ref(self.current_token.recognized_string)
             self.match("IDENTIFIER")
             return ("inout", identifier)
         else:
@@ -477,7 +619,7 @@ class Parser:
         self.match("KEYWORD", "incase")
         flag = self.new_temp()
         firstCondQuad = self.intermediate.nextquad()
-        self.intermediate.genquad(":=", 0, "_", flag)
+        self.intermediate.genquad(":=", Constant(0), "_", flag)
         while self.current_token and self.current_token.recognized_string == "case":
             self.match("KEYWORD", "case")
             if self.current_token.recognized_string == "(":
@@ -488,10 +630,10 @@ class Parser:
                 cond = self.condition()
             self.intermediate.backpatch(cond["true"], self.intermediate.nextquad())
             self.statements()
-            self.intermediate.genquad(":=", 1, "_", flag)
+            self.intermediate.genquad(":=", Constant(1), "_", flag)
             self.intermediate.backpatch(cond["false"], self.intermediate.nextquad())
         self.match("KEYWORD", "default")
-        self.intermediate.genquad("=", 1, flag, firstCondQuad)
+        self.intermediate.genquad("=", Constant(1), flag, firstCondQuad)
         self.statements()
 
     def boolfactor(self):
@@ -589,11 +731,11 @@ class Parser:
                 self.intermediate.genquad("call", ident, "_", "_")
                 result = temp
             else:
-                result = ident
+                result = self.variable_ref(ident)
         elif self.current_token.family == "NUMBER":
             value = self.current_token.recognized_string
             self.match("NUMBER")
-            result = value
+            result = Constant(value)
         elif self.current_token.recognized_string == "(":
             self.match("SYMBOL", "(")
             result = self.expression()
@@ -602,7 +744,7 @@ class Parser:
             raise SyntaxError("Unexpected token in factor")
         if unary == "-":
             temp = self.new_temp()
-            self.intermediate.genquad("*", result, "-1", temp)
+            self.intermediate.genquad("*", result, Constant(-1), temp)
             result = temp
         return result
 
@@ -617,6 +759,7 @@ class IntermediateCodeGenerator:
         self.quads = []
         self.temp_count = 0
         self.next_quad_index = 1  # Quads numbered from 1
+        self.main_block = None    # Index of the main program's begin_block once it is emitted
 
     def nextquad(self):
         return self.next_quad_index
@@ -649,188 +792,5215 @@ class IntermediateCodeGenerator:
             print(f"{quad[0]}: {quad[1]}, {quad[2]}, {quad[3]}, {quad[4]}")
 
 ###################################### WRITE INTERMEDIATE CODE TO FILE #########################################
-def write_int_file(intermediate, input_path):
+def output_path_for(input_path, output_folder, extension):
     base_name = os.path.basename(input_path)
     name_without_ext = os.path.splitext(base_name)[0]
-    output_filename = f"{name_without_ext}.int"
-    output_folder = "int"
     os.makedirs(output_folder, exist_ok=True)
-    output_path = os.path.join(output_folder, output_filename)
+    return os.path.join(output_folder, f"{name_without_ext}{extension}")
+
+def format_quads(quads):
+    return "".join(f"{quad[0]}: {quad[1]}, {quad[2]}, {quad[3]}, {quad[4]}\n" for quad in quads)
+
+def format_int(intermediate):
+    return format_quads(intermediate.quads)
+
+def write_int_file(intermediate, input_path):
+    output_path = output_path_for(input_path, "int", ".int")
     with open(output_path, "w", encoding="utf-8") as f:
-        for quad in intermediate.quads:
-            f.write(f"{quad[0]}: {quad[1]}, {quad[2]}, {quad[3]}, {quad[4]}\n")
+        f.write(format_int(intermediate))
     print(f"Intermediate code written to {output_path}")
 
-###################################### ASSEMBLY CODE GENERATION #########################################
-def get_offset(symbol_table, name):
-    for scope in symbol_table.scopes:
-        if name in scope.entities:
-            return scope.entities[name].offset
-    return 0
-def write_asm_file(intermediate, symbol_table, input_path):
-    def get_offset_local(symbol_table, name):
-        for scope in symbol_table.scopes:
-            if name in scope.entities:
-                return scope.entities[name].offset
-        return 0
+###################################### QUAD INTERPRETER AND PROFILES #########################################
+INTERPRETER_MAX_STEPS = 10_000_000
+INTERPRETER_MAX_DEPTH = 10_000
+PROFILE_VERSION = 1
 
-    def is_number(value):
-        return value.isdigit() or (value.startswith('-') and value[1:].isdigit())
+class InterpreterError(Exception):
+    pass
 
-    def load_operand(reg, operand, label=""):
-        if is_number(operand):
-            return [f"{label} li {reg}, {operand}"]
+class Frame:
+    def __init__(self, scope, static_link=None):
+        self.scope = scope
+        self.static_link = static_link   # Frame of the enclosing subprogram's activation
+        self.cells = {}                  # id(entity) -> [value]; inout parameters share a cell
+
+class QuadInterpreter:
+    # Runs quads directly with one frame per activation, so programs can be executed (and
+    # profiled) independently of the code generator.  Counts are kept per quad position.
+    # With a MemoTable, calls to pure recursive functions are answered from the table.
+    def __init__(self, intermediate, symbol_table, inputs=(), max_steps=INTERPRETER_MAX_STEPS, memo=None):
+        self.quads = intermediate.quads
+        self.symbol_table = symbol_table
+        self.inputs = iter(inputs)
+        self.max_steps = max_steps
+        self.memo = memo
+        self.memoized = memoizable_functions(self.quads, symbol_table) if memo is not None else set()
+        self.steps = 0
+        self.output = []
+        self.counts = [0] * len(self.quads)
+        self.taken = [0] * len(self.quads)
+        self.positions = {quad[0]: position for position, quad in enumerate(self.quads)}
+        self.regions = {}
+        self.main_region = None
+        for region in subprogram_regions(self.quads):
+            self.regions.setdefault(region.name, region)
+            if region.is_main:
+                self.main_region = region
+        self.entity_scopes = {}
+        for scope in collect_scopes(symbol_table):
+            for entity in scope.entities.values():
+                self.entity_scopes[id(entity)] = scope
+        self.loose_cells = {}            # Names without an entity in the symbol table
+
+    def new_cell(self):
+        return [0]
+
+    def cell(self, operand, frame):
+        entity = getattr(operand, "entity", None)
+        scope = self.entity_scopes.get(id(entity)) if entity is not None else None
+        if scope is None:
+            cells, key = self.loose_cells, str(operand)
         else:
-            offset = get_offset_local(symbol_table, operand)
-            return [f"{label} lw {reg}, -{offset}(sp)"]
+            while frame is not None and frame.scope is not scope:
+                frame = frame.static_link
+            if frame is None:
+                raise InterpreterError(f"'{operand}' is not accessible here")
+            cells, key = frame.cells, id(entity)
+        if key not in cells:
+            cells[key] = self.new_cell()
+        return cells[key]
 
-    base_name = os.path.basename(input_path)
-    name_without_ext = os.path.splitext(base_name)[0]
-    output_filename = f"{name_without_ext}.asm"
-    output_folder = "asm"
-    os.makedirs(output_folder, exist_ok=True)
-    output_path = os.path.join(output_folder, output_filename)
-    asm_lines = []
+    def value(self, operand, frame):
+        if isinstance(operand, Constant):
+            return operand.value
+        return self.cell(operand, frame)[0]
 
-    asm_lines.append("    la sp, _stack")
-    asm_lines.append("    addi sp, sp, 1024")
-    asm_lines.append("    j Lmain")
-    main_label_emitted = False
+    def enclosing_frame(self, subprogram, frame):
+        parent = subprogram.scope.parent if subprogram.scope is not None else None
+        while frame is not None and frame.scope is not parent:
+            frame = frame.static_link
+        return frame
 
-    for quad in intermediate.quads:
-        index, op, x, y, z = quad
-        label = f"L{index}:"
+    def run(self):
+        if self.main_region is None:
+            raise InterpreterError("No main program")
+        quads, counts, taken, positions = self.quads, self.counts, self.taken, self.positions
+        frame = Frame(self.symbol_table.scopes[0])
+        counts[self.main_region.begin] += 1
+        pc = self.main_region.start
+        calls = []                       # (return position, caller frame, result cell, memo key)
+        pars = []
+        while True:
+            if not 0 <= pc < len(quads):
+                raise InterpreterError("Execution ran past the end of the program")
+            self.steps += 1
+            if self.steps > self.max_steps:
+                raise InterpreterError(f"Step limit of {self.max_steps} exceeded")
+            counts[pc] += 1
+            index, op, x, y, z = quads[pc]
+            pc += 1
+            if op in ARITHMETIC_OPS:
+                a, b = self.value(x, frame), self.value(y, frame)
+                if op == "/" and b == 0:
+                    raise InterpreterError(f"Quad {index}: division by zero")
+                self.cell(z, frame)[0] = fold_arithmetic(op, a, b)
+            elif op == ":=":
+                self.cell(z, frame)[0] = self.value(x, frame)
+            elif op in RELOPS:
+                a, b = self.value(x, frame), self.value(y, frame)
+                if {"=": a == b, "<>": a != b, "<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b}[op]:
+                    taken[pc - 1] += 1
+                    pc = positions[z]
+            elif op == "jump":
+                taken[pc - 1] += 1
+                pc = positions[z]
+            elif op == "in":
+                try:
+                    self.cell(x, frame)[0] = wrap_int32(int(next(self.inputs)))
+                except StopIteration:
+                    raise InterpreterError("input: no more values") from None
+            elif op == "out":
+                self.output.append(self.value(x, frame))
+            elif op == "par":
+                pars.append((y, x, frame))
+            elif op == "call":
+                subprogram = self.symbol_table.subprograms.get(x)
+                region = self.regions.get(x)
+                if subprogram is None or region is None:
+                    raise InterpreterError(f"Quad {index}: call to undefined subprogram '{x}'")
+                if len(calls) >= INTERPRETER_MAX_DEPTH:
+                    raise InterpreterError("Call depth limit exceeded")
+                callee = Frame(subprogram.scope, self.enclosing_frame(subprogram, frame))
+                result = None
+                arguments = []
+                for mode, operand, owner in pars:
+                    if mode == "ret":
+                        result = self.cell(operand, owner)
+                    elif mode == "ref":
+                        arguments.append(self.cell(operand, owner))
+                    else:
+                        arguments.append([self.value(operand, owner)])
+                pars = []
+                key = None
+                if x in self.memoized and result is not None:
+                    key = (x,) + tuple(argument[0] for argument in arguments)
+                    value = self.memo.lookup(key)
+                    if value is not None:
+                        result[0] = value
+                        continue
+                for parameter, argument in zip(subprogram.parameters, arguments):
+                    callee.cells[id(parameter)] = argument
+                calls.append((pc, frame, result, key))
+                counts[region.begin] += 1
+                frame, pc = callee, region.start
+            elif op in ("retv", "end_block"):
+                if op == "retv" and calls and calls[-1][2] is not None:
+                    calls[-1][2][0] = self.value(x, frame)
+                    if calls[-1][3] is not None:
+                        self.memo.store(calls[-1][3], calls[-1][2][0])
+                if not calls:
+                    return self
+                pc, frame, result, key = calls.pop()
+            elif op == "halt":
+                return self
 
-        if op == "begin_block":
-            if not main_label_emitted and (x == "main" or x == name_without_ext):
-                asm_lines.append(f"Lmain: # begin_block {x}")
-                main_label_emitted = True
+    def profile(self):
+        counts = {quad[0]: count for quad, count in zip(self.quads, self.counts) if count}
+        taken = {quad[0]: count for quad, count in zip(self.quads, self.taken) if count}
+        return ExecutionProfile(counts, taken)
+
+def interpret_quads(intermediate, symbol_table, inputs=(), max_steps=INTERPRETER_MAX_STEPS, memo=None):
+    return QuadInterpreter(intermediate, symbol_table, inputs, max_steps, memo).run()
+
+class ExecutionProfile:
+    # Execution counts keyed by quad index.  Passes that renumber quads call renumber() with the
+    # index map from replace_quads; quads they create inherit counts from the quads they copy.
+    def __init__(self, counts=None, taken=None):
+        self.counts = dict(counts or {})   # quad index -> times executed (begin_block: entries)
+        self.taken = dict(taken or {})     # jump quad index -> times the jump was taken
+
+    def count(self, index):
+        return self.counts.get(index, 0)
+
+    def taken_count(self, index):
+        return self.taken.get(index, 0)
+
+    def inherit(self, target, source, scale=1.0):
+        self.counts[target] = round(self.count(source) * scale)
+        if source in self.taken:
+            self.taken[target] = round(self.taken[source] * scale)
+
+    def renumber(self, index_map):
+        self.counts = {index_map[index]: count for index, count in self.counts.items() if index in index_map}
+        self.taken = {index_map[index]: count for index, count in self.taken.items() if index in index_map}
+
+def source_hash(source):
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+def write_profile(path, profile, source):
+    data = {
+        "version": PROFILE_VERSION,
+        "source": source_hash(source),
+        "counts": {str(index): count for index, count in sorted(profile.counts.items())},
+        "taken": {str(index): count for index, count in sorted(profile.taken.items())},
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    print(f"Profile written to {path}")
+
+def read_profile(path, source):
+    # Counts refer to the unoptimized quads of one exact source text
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != PROFILE_VERSION or data.get("source") != source_hash(source):
+        print(f"Warning: {path} was recorded for a different source; profile ignored")
+        return None
+    return ExecutionProfile({int(index): count for index, count in data["counts"].items()},
+                            {int(index): count for index, count in data["taken"].items()})
+
+###################################### MEMOIZATION #########################################
+MEMO_TABLE_SIZE = 4096
+
+class MemoTable:
+    # Results of pure functions keyed on (function, arguments).  Once the table is full the
+    # least recently used entry is evicted, so memory stays bounded on any input.
+    def __init__(self, size=MEMO_TABLE_SIZE):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def store(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {"size": self.size, "entries": len(self.entries), "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+def pure_functions(quads, symbol_table):
+    # A function is pure when it has only `in` parameters, does no input or output, touches no
+    # name outside its own scope and calls only pure functions.  Its result then depends on
+    # nothing but its arguments.
+    regions = {}
+    for region in subprogram_regions(quads):
+        regions.setdefault(region.name, []).append(region)
+    candidates = {}
+    for name, found in regions.items():
+        subprogram = symbol_table.subprograms.get(name)
+        if len(found) != 1 or found[0].is_main or subprogram is None or subprogram.scope is None:
+            continue
+        if subprogram.kind != "function" or any(parameter.mode != "in" for parameter in subprogram.parameters):
+            continue
+        body = [quads[position] for position in found[0].own_positions()]
+        if any(quad[1] in ("in", "out") or (quad[1] == "par" and quad[3] == "ref") for quad in body):
+            continue
+        operands = [operand for quad in body for operand in list(quad_uses(quad)) + list(quad_defs(quad))]
+        if all(getattr(operand, "entity", None) is not None
+               and subprogram.scope.entities.get(operand) is operand.entity for operand in operands):
+            candidates[name] = {quad[2] for quad in body if quad[1] == "call"}
+    changed = True
+    while changed:
+        changed = False
+        for name, callees in list(candidates.items()):
+            if not callees <= set(candidates):
+                del candidates[name]
+                changed = True
+    return candidates
+
+def memoizable_functions(quads, symbol_table):
+    # Pure functions that can reach themselves through calls; memoizing a function that is not
+    # recursive only adds a table lookup to every call
+    calls = pure_functions(quads, symbol_table)
+    recursive = set()
+    for name in calls:
+        seen = set()
+        pending = list(calls[name])
+        while pending:
+            callee = pending.pop()
+            if callee == name:
+                recursive.add(name)
+                break
+            if callee not in seen:
+                seen.add(callee)
+                pending.extend(calls[callee])
+    return recursive
+
+###################################### BATCH EXECUTION #########################################
+# Runs one program over many input records in lockstep.  Every cell holds a NumPy array with one
+# lane per record.  Lanes that take different branches are split into groups; groups that reach
+# the same quad in the same activation are merged again.  Deeper activations and lower quad
+# positions run first, so the lanes of an if/else or a loop meet again at its join point.
+BATCH_RELOPS = {"=": operator.eq, "<>": operator.ne, "<": operator.lt, "<=": operator.le,
+                ">": operator.gt, ">=": operator.ge}
+
+def wrap_int32_lanes(values):
+    return ((values + (1 << 31)) & 0xffffffff) - (1 << 31)
+
+def fold_arithmetic_lanes(op, a, b):
+    if op == "+":
+        return wrap_int32_lanes(a + b)
+    if op == "-":
+        return wrap_int32_lanes(a - b)
+    if op == "*":
+        return wrap_int32_lanes(a * b)
+    quotient = np.abs(a) // np.abs(b)
+    return wrap_int32_lanes(np.where((a < 0) == (b < 0), quotient, -quotient))
+
+class LaneGroup:
+    def __init__(self, lanes, pc, frame, calls, pars=()):
+        self.lanes = lanes         # Record numbers executing together
+        self.pc = pc
+        self.frame = frame
+        self.calls = calls         # (return position, caller frame, result cell) per activation
+        self.pars = list(pars)
+
+    def key(self):
+        # Pending `par` quads belong to one group only
+        if self.pars:
+            return id(self)
+        return (self.pc, id(self.frame), tuple((pc, id(frame)) for pc, frame, result in self.calls))
+
+class BatchInterpreter(QuadInterpreter):
+    # `inputs` holds one sequence of input() values per record.  Per-record failures (division
+    # by zero, missing input, call depth) stop only that record and are kept in `errors`.
+    def __init__(self, intermediate, symbol_table, inputs, max_steps=INTERPRETER_MAX_STEPS):
+        if np is None:
+            raise InterpreterError("Batch execution needs NumPy")
+        records = [list(record) for record in inputs]
+        self.size = len(records)
+        self.lengths = np.array([len(record) for record in records], dtype=np.int64)
+        width = int(self.lengths.max()) if self.size else 0
+        if self.size and (self.lengths == width).all():
+            self.records = wrap_int32_lanes(np.array(records, dtype=np.int64).reshape(self.size, width))
+        else:
+            self.records = np.zeros((self.size, width), dtype=np.int64)
+            for lane, record in enumerate(records):
+                self.records[lane, :len(record)] = wrap_int32_lanes(np.array(record, dtype=np.int64))
+        super().__init__(intermediate, symbol_table, (), max_steps)
+        self.cursor = np.zeros(self.size, dtype=np.int64)
+        self.output = np.zeros((self.size, 0), dtype=np.int64)
+        self.output_counts = np.zeros(self.size, dtype=np.int64)
+        self.errors = {}                 # record number -> message
+        self.leaders = {self.positions[quad[4]] for quad in self.quads
+                        if quad[1] in JUMP_OPS and quad[4] in self.positions}
+        self.pending = {}
+        self.queue = []
+        self.sequence = itertools.count()
+
+    def new_cell(self):
+        return [np.zeros(self.size, dtype=np.int64)]
+
+    def lane_values(self, operand, frame, lanes):
+        if isinstance(operand, Constant):
+            return np.full(len(lanes), operand.value, dtype=np.int64)
+        return self.cell(operand, frame)[0][lanes]
+
+    def fail(self, lanes, failed, message):
+        for lane in lanes[failed]:
+            self.errors[int(lane)] = message
+        return lanes[~failed]
+
+    def write_output(self, lanes, values):
+        columns = self.output_counts[lanes]
+        width = int(columns.max()) + 1
+        if width > self.output.shape[1]:
+            grown = np.zeros((self.size, max(width, 2 * self.output.shape[1])), dtype=np.int64)
+            grown[:, :self.output.shape[1]] = self.output
+            self.output = grown
+        self.output[lanes, columns] = values
+        self.output_counts[lanes] += 1
+
+    def schedule(self, group):
+        if len(group.lanes) == 0:
+            return
+        key = group.key()
+        if key in self.pending:
+            waiting = self.pending[key]
+            waiting.lanes = np.concatenate([waiting.lanes, group.lanes])
+            return
+        self.pending[key] = group
+        heapq.heappush(self.queue, (-len(group.calls), group.pc, next(self.sequence), group))
+
+    def run(self):
+        if self.main_region is None:
+            raise InterpreterError("No main program")
+        self.counts[self.main_region.begin] += self.size
+        frame = Frame(self.symbol_table.scopes[0])
+        self.schedule(LaneGroup(np.arange(self.size), self.main_region.start, frame, []))
+        while self.queue:
+            group = heapq.heappop(self.queue)[-1]
+            del self.pending[group.key()]
+            self.run_group(group)
+        self.output = self.output[:, :int(self.output_counts.max()) if self.size else 0]
+        return self
+
+    def run_group(self, group):
+        # Runs the group until control leaves straight-line code, then schedules what follows
+        quads, counts, taken, positions = self.quads, self.counts, self.taken, self.positions
+        lanes, pc, frame = group.lanes, group.pc, group.frame
+        while len(lanes):
+            if not 0 <= pc < len(quads):
+                raise InterpreterError("Execution ran past the end of the program")
+            self.steps += 1
+            if self.steps > self.max_steps:
+                raise InterpreterError(f"Step limit of {self.max_steps} exceeded")
+            counts[pc] += len(lanes)
+            index, op, x, y, z = quads[pc]
+            pc += 1
+            if op in ARITHMETIC_OPS:
+                a, b = self.lane_values(x, frame, lanes), self.lane_values(y, frame, lanes)
+                if op == "/":
+                    zero = b == 0
+                    if zero.any():
+                        a, b = a[~zero], b[~zero]
+                        lanes = self.fail(lanes, zero, f"Quad {index}: division by zero")
+                self.cell(z, frame)[0][lanes] = fold_arithmetic_lanes(op, a, b)
+            elif op == ":=":
+                self.cell(z, frame)[0][lanes] = self.lane_values(x, frame, lanes)
+            elif op in RELOPS:
+                condition = BATCH_RELOPS[op](self.lane_values(x, frame, lanes), self.lane_values(y, frame, lanes))
+                taken[pc - 1] += int(condition.sum())
+                self.schedule(LaneGroup(lanes[condition], positions[z], frame, group.calls, group.pars))
+                self.schedule(LaneGroup(lanes[~condition], pc, frame, group.calls, group.pars))
+                return
+            elif op == "jump":
+                taken[pc - 1] += len(lanes)
+                self.schedule(LaneGroup(lanes, positions[z], frame, group.calls, group.pars))
+                return
+            elif op == "in":
+                lanes = self.fail(lanes, self.cursor[lanes] >= self.lengths[lanes], "input: no more values")
+                self.cell(x, frame)[0][lanes] = self.records[lanes, self.cursor[lanes]]
+                self.cursor[lanes] += 1
+            elif op == "out":
+                self.write_output(lanes, self.lane_values(x, frame, lanes))
+            elif op == "par":
+                group.pars.append((y, x, frame))
+            elif op == "call":
+                subprogram = self.symbol_table.subprograms.get(x)
+                region = self.regions.get(x)
+                if subprogram is None or region is None:
+                    raise InterpreterError(f"Quad {index}: call to undefined subprogram '{x}'")
+                if len(group.calls) >= INTERPRETER_MAX_DEPTH:
+                    self.fail(lanes, np.ones(len(lanes), dtype=bool), "Call depth limit exceeded")
+                    return
+                callee = Frame(subprogram.scope, self.enclosing_frame(subprogram, frame))
+                result = None
+                arguments = []
+                for mode, operand, owner in group.pars:
+                    if mode == "ret":
+                        result = self.cell(operand, owner)
+                    elif mode == "ref":
+                        arguments.append(self.cell(operand, owner))
+                    else:
+                        argument = self.new_cell()
+                        argument[0][lanes] = self.lane_values(operand, owner, lanes)
+                        arguments.append(argument)
+                for parameter, argument in zip(subprogram.parameters, arguments):
+                    callee.cells[id(parameter)] = argument
+                counts[region.begin] += len(lanes)
+                self.schedule(LaneGroup(lanes, region.start, callee, group.calls + [(pc, frame, result)]))
+                return
+            elif op in ("retv", "end_block"):
+                if op == "retv" and group.calls and group.calls[-1][2] is not None:
+                    group.calls[-1][2][0][lanes] = self.lane_values(x, frame, lanes)
+                if group.calls:
+                    return_pc, caller, result = group.calls[-1]
+                    self.schedule(LaneGroup(lanes, return_pc, caller, group.calls[:-1]))
+                return
+            elif op == "halt":
+                return
+            if pc in self.leaders:
+                self.schedule(LaneGroup(lanes, pc, frame, group.calls, group.pars))
+                return
+
+    def record_output(self, lane):
+        return [int(value) for value in self.output[lane, :self.output_counts[lane]]]
+
+def interpret_batch(intermediate, symbol_table, inputs, max_steps=INTERPRETER_MAX_STEPS):
+    return BatchInterpreter(intermediate, symbol_table, inputs, max_steps).run()
+
+def read_batch_records(path):
+    # One record per line: the input() values of one run, separated by commas or whitespace
+    with open(path, "r", encoding="utf-8") as f:
+        return [[int(token) for token in re.split(r"[\s,]+", line.strip()) if token]
+                for line in f if line.strip()]
+
+###################################### QUAD OPTIMIZATION #########################################
+JUMP_OPS = {"jump", "=", "<>", "<", "<=", ">", ">="}
+RELOPS = {"=", "<>", "<", "<=", ">", ">="}
+ARITHMETIC_OPS = {"+", "-", "*", "/"}
+
+INLINE_MAX_QUADS = 8       # Largest callee body inlined at an ordinary call site
+INLINE_LOOP_BONUS = 4      # Call sites inside loops accept bodies this many times larger
+INLINE_MAX_ROUNDS = 4
+SPECIALIZE_MIN_CALLS = 2   # Weight of calls a constant-argument combination needs to get a clone
+SPECIALIZE_MAX_QUADS = 64  # Largest subprogram body that is cloned
+SPECIALIZE_GROWTH = 0.5    # Quads all clones may add, as a share of the program
+
+def is_constant(value):
+    return isinstance(value, Constant)
+
+def quad_defs(quad):
+    # Names written by a quad (par ref arguments count as written by the call)
+    index, op, x, y, z = quad
+    if op in ARITHMETIC_OPS or op == ":=":
+        return [z]
+    if op == "in" or (op == "par" and y in ("ref", "ret")):
+        return [x]
+    return []
+
+def quad_uses(quad):
+    index, op, x, y, z = quad
+    if op in ARITHMETIC_OPS or op in RELOPS:
+        operands = [x, y]
+    elif op in (":=", "out", "retv") or (op == "par" and y in ("cv", "ref")):
+        operands = [x]
+    else:
+        operands = []
+    return [operand for operand in operands if not is_constant(operand)]
+
+class CodeRegion:
+    def __init__(self, name, begin, parent=None):
+        self.name = name
+        self.begin = begin         # Position of the begin_block quad
+        self.start = begin + 1     # Position of the first quad of the region's own body
+        self.end = None            # Position of the end_block quad
+        self.parent = parent
+        self.children = []
+        self.is_main = False
+
+    def own_positions(self):
+        return range(self.start, self.end)
+
+def subprogram_regions(quads):
+    # Nested subprograms are emitted between the begin_block of their parent and the parent's
+    # own statements, so a region's body starts after the end_block of its last child.
+    regions = []
+    stack = []
+    for position, quad in enumerate(quads):
+        if quad[1] == "begin_block":
+            region = CodeRegion(quad[2], position, stack[-1] if stack else None)
+            if stack:
+                stack[-1].children.append(region)
+            stack.append(region)
+            regions.append(region)
+        elif quad[1] == "end_block":
+            region = stack.pop()
+            region.end = position
+            if stack:
+                stack[-1].start = position + 1
+    top_level = [region for region in regions if region.parent is None]
+    if top_level:
+        top_level[-1].is_main = True
+    return regions
+
+def region_scope(symbol_table, region):
+    if region.is_main:
+        return symbol_table.scopes[0]
+    return symbol_table.subprograms[region.name].scope
+
+def new_scope_temp(intermediate, scope):
+    entity = TemporaryVariable(intermediate.newtemp(), "int", scope.allocate_offset())
+    scope.add_entity(entity)
+    return Temporary(entity.name, entity)
+
+def renumber_quads(quads, forward=None):
+    # Quads are renumbered from 1 in list order.  Jump targets refer to quad indices of the
+    # input list; targets of quads that were removed are redirected through `forward`.
+    forward = forward or {}
+    positions = {quad[0]: position for position, quad in enumerate(quads, start=1)}
+
+    def resolve(label):
+        while label not in positions:
+            label = forward[label]
+        return positions[label]
+
+    renumbered = []
+    for position, (index, op, x, y, z) in enumerate(quads, start=1):
+        if op in JUMP_OPS and z != "_":
+            z = resolve(z)
+        renumbered.append((position, op, x, y, z))
+    return renumbered, positions
+
+def replace_quads(intermediate, quads, forward=None):
+    intermediate.quads, index_map = renumber_quads(quads, forward)
+    intermediate.next_quad_index = len(intermediate.quads) + 1
+    return index_map
+
+def loop_ranges(quads, region):
+    # Every loop built by the parser closes with a backward jump to its header
+    positions = {quads[p][0]: p for p in region.own_positions()}
+    ranges = []
+    for position in region.own_positions():
+        index, op, x, y, z = quads[position]
+        if op in JUMP_OPS and z in positions and positions[z] <= position:
+            ranges.append((positions[z], position))
+    return ranges
+
+def call_arguments(quads, region, position, callee):
+    # Positions of the par quads of the call at `position`, or None when they do not match the
+    # callee's parameters
+    first = position
+    while first > region.start and quads[first - 1][1] == "par":
+        first -= 1
+    par_positions = list(range(first, position))
+    expected = len(callee.parameters) + (1 if callee.kind == "function" else 0)
+    modes = [quads[p][3] for p in par_positions]
+    if len(par_positions) != expected or (callee.kind == "function" and modes[-1] != "ret"):
+        return None
+    if any((mode == "ref") != (parameter.mode == "inout") for parameter, mode in zip(callee.parameters, modes)):
+        return None
+    return par_positions
+
+def inline_candidate(quads, region, symbol_table):
+    if region.is_main or region.children:
+        return None
+    subprogram = symbol_table.subprograms.get(region.name)
+    if subprogram is None or subprogram.scope is None:
+        return None
+    body = [quads[position] for position in region.own_positions()]
+    if any(quad[1] in ("call", "par", "begin_block") for quad in body):
+        return None
+    return subprogram, body
+
+def inline_call(quads, call_position, par_positions, callee, body, end_index, caller_scope,
+                intermediate, fresh_ids, profile=None, scale=0.0):
+    # Build the quads that replace `par ... / call` at a call site.  With a profile the copies
+    # inherit the callee's counts, scaled to this call site's share of the calls.
+    pars = [quads[position] for position in par_positions]
+    callee_scope = callee.scope
+    written = {name for quad in body for name in quad_defs(quad)}
+    rename = {parameter.name: par[2] for parameter, par in zip(callee.parameters, pars)
+              if parameter.mode == "inout"}
+    # Names the body writes as the caller sees them: a write to an inout parameter changes its
+    # argument, so an `in` argument passed there as well must be copied
+    written_actuals = {rename.get(name, name) for name in written}
+    prologue = []
+    ret_temp = None
+    for parameter, par in zip(callee.parameters, pars):
+        actual = par[2]
+        if parameter.mode == "inout":
+            continue
+        if parameter.name not in written and (is_constant(actual) or actual not in written_actuals):
+            rename[parameter.name] = actual
+        else:
+            temp = new_scope_temp(intermediate, caller_scope)
+            prologue.append((next(fresh_ids), ":=", actual, "_", temp))
+            rename[parameter.name] = temp
+    if callee.kind == "function":
+        ret_temp = pars[-1][2]
+    for name, entity in callee_scope.entities.items():
+        if name not in rename and isinstance(entity, Variable):
+            rename[name] = new_scope_temp(intermediate, caller_scope)
+
+    continuation = quads[call_position + 1][0]
+    labels = {quad[0]: next(fresh_ids) for quad in body}
+    labels[end_index] = continuation
+
+    def operand(value):
+        if isinstance(value, str) and value in rename:
+            return rename[value]
+        return value
+
+    inlined = list(prologue)
+    origins = {quad[0]: (quads[call_position][0], 1.0) for quad in prologue}
+    for position, (index, op, x, y, z) in enumerate(body):
+        label = labels[index]
+        origins[label] = (index, scale)
+        if op in JUMP_OPS:
+            target = labels.get(z, z) if z != "_" else z
+            inlined.append((label, op, operand(x), operand(y), target))
+        elif op == "retv":
+            inlined.append((label, ":=", operand(x), "_", ret_temp))
+            if position != len(body) - 1:
+                inlined.append((next(fresh_ids), "jump", "_", "_", continuation))
+                origins[inlined[-1][0]] = (index, scale)
+        else:
+            inlined.append((label, op, operand(x), operand(y), operand(z)))
+    if profile is not None:
+        for label, (source, factor) in origins.items():
+            profile.inherit(label, source, factor)
+    return inlined
+
+def captures_free_names(callee, body, caller_scope):
+    # Names the callee reaches outside its own scope must mean the same entity at the call site
+    for quad in body:
+        for name in list(quad_uses(quad)) + list(quad_defs(quad)):
+            if name in callee.scope.entities:
+                continue
+            if callee.scope.find_entity(name) is not caller_scope.find_entity(name):
+                return True
+    return False
+
+def inline_subprograms(intermediate, symbol_table, max_quads=INLINE_MAX_QUADS, profile=None):
+    changed = False
+    for _ in range(INLINE_MAX_ROUNDS):
+        quads = intermediate.quads
+        regions = subprogram_regions(quads)
+        names = [region.name for region in regions]
+        candidates = {}
+        for region in regions:
+            if names.count(region.name) != 1:
+                continue
+            candidate = inline_candidate(quads, region, symbol_table)
+            if candidate is not None:
+                candidates[region.name] = candidate + (quads[region.begin][0], quads[region.end][0])
+
+        fresh_ids = itertools.count(max(quad[0] for quad in quads) + 1)
+        replacements = {}          # call position -> (first replaced position, new quads)
+        inlined_callees = set()
+        for region in regions:
+            caller_scope = region_scope(symbol_table, region)
+            loops = loop_ranges(quads, region)
+            for position in region.own_positions():
+                if quads[position][1] != "call" or quads[position][2] not in candidates:
+                    continue
+                callee, body, begin_index, end_index = candidates[quads[position][2]]
+                if callee.name == region.name:
+                    continue
+                par_positions = call_arguments(quads, region, position, callee)
+                if par_positions is None:
+                    continue
+                first = par_positions[0] if par_positions else position
+                in_loop = any(start <= position <= end for start, end in loops)
+                scale = 0.0
+                if profile is not None:
+                    # Measured counts replace the loop heuristic: calls that never ran are left
+                    # alone and calls made more than once per caller activation count as hot
+                    calls = profile.count(quads[position][0])
+                    if calls == 0:
+                        continue
+                    in_loop = calls > profile.count(quads[region.begin][0])
+                    scale = calls / max(1, profile.count(begin_index))
+                budget = max_quads * (INLINE_LOOP_BONUS if in_loop else 1)
+                if len(body) > budget or captures_free_names(callee, body, caller_scope):
+                    continue
+                replacements[position] = (first, inline_call(
+                    quads, position, par_positions, callee, body, end_index, caller_scope,
+                    intermediate, fresh_ids, profile, scale))
+                inlined_callees.add(callee.name)
+        if not replacements:
+            break
+
+        remaining_calls = {quads[p][2] for p in range(len(quads))
+                           if quads[p][1] == "call" and p not in replacements}
+        dead = set()
+        for region in regions:
+            if region.name in inlined_callees and region.name not in remaining_calls:
+                dead.update(range(region.begin, region.end + 1))
+        skipped = set()
+        for position, (first, inlined) in replacements.items():
+            skipped.update(range(first, position + 1))
+
+        new_quads = []
+        forward = {}
+        for position, quad in enumerate(quads):
+            if position in dead:
+                continue
+            if position in replacements:
+                first, inlined = replacements[position]
+                target = inlined[0][0] if inlined else quads[position + 1][0]
+                for replaced in range(first, position + 1):
+                    forward[quads[replaced][0]] = target
+                new_quads.extend(inlined)
+            elif position not in skipped:
+                new_quads.append(quad)
+        index_map = replace_quads(intermediate, new_quads, forward)
+        if profile is not None:
+            profile.renumber(index_map)
+        changed = True
+    return changed
+
+def constant_arguments(quads, par_positions, callee):
+    # Per parameter, the value of a constant `in` argument or None
+    return tuple(quads[p][2].value if parameter.mode == "in" and is_constant(quads[p][2]) else None
+                 for parameter, p in zip(callee.parameters, par_positions))
+
+def specialized_name(name, scope, symbol_table):
+    for number in itertools.count(1):
+        candidate = f"{name}_s{number}"
+        if candidate not in symbol_table.subprograms and scope.find_entity(candidate) is None:
+            return candidate
+
+def clone_subprogram(quads, region, callee, values, symbol_table, intermediate, fresh_ids, profile=None, scale=0.0):
+    # A copy of the callee without the parameters that `values` fixes, declared next to it.  The
+    # remaining parameters move to the front of the frame, where callers store arguments, and a
+    # fixed parameter becomes a local that is replaced by its value, or set from it on entry when
+    # the body writes it.
+    outer_scope = callee.scope.parent
+    clone = Subprogram(specialized_name(callee.name, outer_scope, symbol_table), callee.kind)
+    outer_scope.add_entity(clone)
+    symbol_table.subprograms[clone.name] = clone
+    clone.scope = Scope(outer_scope)
+    body = [quads[position] for position in region.own_positions()]
+    written = {name for quad in body for name in quad_defs(quad)}
+    fixed = {parameter.name: value for parameter, value in zip(callee.parameters, values) if value is not None}
+    kept = [parameter for parameter in callee.parameters if parameter.name not in fixed]
+    others = sorted((entity for entity in callee.scope.entities.values()
+                     if isinstance(entity, Variable) and entity not in kept), key=lambda entity: entity.offset)
+    rename = {}
+    prologue = []
+    for entity in kept + others:
+        offset = clone.scope.allocate_offset()
+        if isinstance(entity, TemporaryVariable):
+            copy = TemporaryVariable(intermediate.newtemp(), "int", offset)
+        elif entity in kept:
+            copy = Parameter(entity.name, "int", offset, entity.mode)
+            clone.parameters.append(copy)
+        else:
+            copy = Variable(entity.name, "int", offset)
+        clone.scope.add_entity(copy)
+        rename[entity.name] = (Temporary if isinstance(copy, TemporaryVariable) else VariableRef)(copy.name, copy)
+        if entity.name in fixed:
+            if entity.name in written:
+                prologue.append((next(fresh_ids), ":=", Constant(fixed[entity.name]), "_", rename[entity.name]))
             else:
-                asm_lines.append(f"{x}: # begin_block {x}")
+                rename[entity.name] = Constant(fixed[entity.name])
+    clone.scope.offset_counter = max(clone.scope.offset_counter, callee.scope.offset_counter)
+
+    def operand(value):
+        if isinstance(value, VariableRef) and value in rename:
+            return rename[value]
+        return value
+
+    begin, end = quads[region.begin][0], quads[region.end][0]
+    labels = {quad[0]: next(fresh_ids) for quad in body}
+    labels[end] = next(fresh_ids)
+    cloned = [(next(fresh_ids), "begin_block", clone.name, "_", "_")]
+    origins = {cloned[0][0]: begin}
+    cloned += prologue
+    origins.update((quad[0], begin) for quad in prologue)
+    for index, op, x, y, z in body:
+        origins[labels[index]] = index
+        if op in JUMP_OPS:
+            cloned.append((labels[index], op, operand(x), operand(y), labels.get(z, z) if z != "_" else z))
+        else:
+            cloned.append((labels[index], op, operand(x), operand(y), operand(z)))
+    cloned.append((labels[end], "end_block", clone.name, "_", "_"))
+    origins[labels[end]] = end
+    if profile is not None:
+        for label, source in origins.items():
+            profile.inherit(label, source, scale)
+    return clone, cloned
+
+def specialize_subprograms(intermediate, symbol_table, profile=None):
+    # Interprocedural constant propagation: a subprogram that is often called with the same
+    # constants as `in` arguments gets a clone for them, and those call sites call the clone
+    # without these arguments.  Folding and dead-code elimination of the clones are left to
+    # propagate_constants.  Without a profile a call site weighs 1, or INLINE_LOOP_BONUS inside
+    # a loop; with one, the times it ran.  Clones are made heaviest first within the budget.
+    quads = intermediate.quads
+    regions = subprogram_regions(quads)
+    names = [region.name for region in regions]
+    callees = {}
+    for region in regions:
+        subprogram = symbol_table.subprograms.get(region.name)
+        if (not region.is_main and not region.children and names.count(region.name) == 1 and subprogram is not None
+                and subprogram.scope is not None and region.end - region.start <= SPECIALIZE_MAX_QUADS):
+            callees[region.name] = (subprogram, region)
+
+    weights = collections.Counter()
+    first_seen = {}
+    for region in regions:
+        loops = loop_ranges(quads, region)
+        for position in region.own_positions():
+            if quads[position][1] != "call" or quads[position][2] not in callees:
+                continue
+            callee = callees[quads[position][2]][0]
+            par_positions = call_arguments(quads, region, position, callee)
+            if par_positions is None:
+                continue
+            values = constant_arguments(quads, par_positions, callee)
+            if all(value is None for value in values):
+                continue
+            key = (callee.name, values)
+            if profile is not None:
+                weights[key] += profile.count(quads[position][0])
+            else:
+                weights[key] += INLINE_LOOP_BONUS if any(start <= position <= end for start, end in loops) else 1
+            first_seen.setdefault(key, position)
+
+    budget = max(SPECIALIZE_MAX_QUADS, int(len(quads) * SPECIALIZE_GROWTH))
+    fresh_ids = itertools.count(max(quad[0] for quad in quads) + 1)
+    clones = {}                # (name, values) -> clone Subprogram
+    inserted = {}              # end_block position -> clone quads placed after it
+    for key in sorted(weights, key=lambda key: (-weights[key], first_seen[key])):
+        callee, region = callees[key[0]]
+        size = region.end - region.start + 2
+        if weights[key] < SPECIALIZE_MIN_CALLS or size > budget:
             continue
+        scale = 0.0
+        if profile is not None:
+            scale = min(1.0, weights[key] / max(1, profile.count(quads[region.begin][0])))
+        clone, cloned = clone_subprogram(quads, region, callee, key[1], symbol_table, intermediate, fresh_ids,
+                                         profile, scale)
+        if profile is not None:
+            # The calls that move to the clone no longer run the original
+            for position in range(region.begin, region.end + 1):
+                profile.inherit(quads[position][0], quads[position][0], 1.0 - scale)
+        clones[key] = clone
+        inserted.setdefault(region.end, []).extend(cloned)
+        budget -= size
+    if not clones:
+        return False
 
-        if op in {"+", "-", "*", "/"}:
-            oz = get_offset_local(symbol_table, z)
-            asm_lines += load_operand("t0", x, label)
-            asm_lines += load_operand("t1", y)
-            op_map = {
-                "+": "add",
-                "-": "sub",
-                "*": "mul",
-                "/": "div"
-            }
-            asm_lines.append(f"    {op_map[op]} t2, t0, t1")
-            asm_lines.append(f"    sw t2, -{oz}(sp)")
+    # Calls are redirected in the clones too, so a recursive call with the same constants
+    # stays in its clone
+    new_quads = []
+    for position, quad in enumerate(quads):
+        new_quads.append(quad)
+        new_quads.extend(inserted.get(position, []))
+    dropped = set()
+    redirected = {}
+    for region in subprogram_regions(new_quads):
+        for position in region.own_positions():
+            if new_quads[position][1] != "call" or new_quads[position][2] not in callees:
+                continue
+            callee = callees[new_quads[position][2]][0]
+            par_positions = call_arguments(new_quads, region, position, callee)
+            if par_positions is None:
+                continue
+            values = constant_arguments(new_quads, par_positions, callee)
+            clone = clones.get((callee.name, values))
+            if clone is None:
+                continue
+            dropped.update(p for p, value in zip(par_positions, values) if value is not None)
+            redirected[position] = clone.name
 
-        elif op == ":=":
-            oz = get_offset_local(symbol_table, z)
-            if is_number(x):
-                asm_lines.append(f"{label} li t0, {x}")
+    forward = {}
+    result = []
+    for position, quad in enumerate(new_quads):
+        if position in dropped:
+            continue
+        if position in redirected:
+            quad = (quad[0], "call", redirected[position], quad[3], quad[4])
+        result.append(quad)
+    # A dropped par is replaced by the next quad that is kept
+    following = None
+    for position in range(len(new_quads) - 1, -1, -1):
+        if position in dropped:
+            forward[new_quads[position][0]] = following
+        else:
+            following = new_quads[position][0]
+
+    # Subprograms that are no longer called at all are removed
+    called = {quad[2] for quad in result if quad[1] == "call"}
+    dead = set()
+    for region in subprogram_regions(result):
+        if region.name in callees and region.name not in called and any(key[0] == region.name for key in clones):
+            dead.update(range(region.begin, region.end + 1))
+    result = [quad for position, quad in enumerate(result) if position not in dead]
+    index_map = replace_quads(intermediate, result, forward)
+    if profile is not None:
+        profile.renumber(index_map)
+    return True
+
+def wrap_int32(value):
+    value &= 0xffffffff
+    return value - (1 << 32) if value & 0x80000000 else value
+
+def cimple_divide(a, b):
+    # Integer division truncates toward zero, like the RISC-V div instruction
+    quotient = abs(a) // abs(b)
+    return quotient if (a < 0) == (b < 0) else -quotient
+
+def fold_arithmetic(op, a, b):
+    if op == "+":
+        return wrap_int32(a + b)
+    if op == "-":
+        return wrap_int32(a - b)
+    if op == "*":
+        return wrap_int32(a * b)
+    return wrap_int32(cimple_divide(a, b))
+
+def simplify_arithmetic(op, x, y):
+    # Returns the operand an arithmetic quad reduces to, or None when it must stay
+    x_const, y_const = is_constant(x), is_constant(y)
+    if x_const and y_const:
+        if op == "/" and y.value == 0:
+            return None
+        return Constant(fold_arithmetic(op, x.value, y.value))
+    if op == "+":
+        if y_const and y.value == 0:
+            return x
+        if x_const and x.value == 0:
+            return y
+    elif op == "-":
+        if y_const and y.value == 0:
+            return x
+        if x == y:
+            return Constant(0)
+    elif op == "*":
+        if (y_const and y.value == 0) or (x_const and x.value == 0):
+            return Constant(0)
+        if y_const and y.value == 1:
+            return x
+        if x_const and x.value == 1:
+            return y
+    elif op == "/":
+        if y_const and y.value == 1:
+            return x
+    return None
+
+def simplify_algebra(intermediate):
+    changed = False
+    quads = []
+    for index, op, x, y, z in intermediate.quads:
+        if op in ARITHMETIC_OPS:
+            simplified = simplify_arithmetic(op, x, y)
+            if simplified is not None:
+                quads.append((index, ":=", simplified, "_", z))
+                changed = True
+                continue
+        quads.append((index, op, x, y, z))
+    intermediate.quads = quads
+    return changed
+
+def is_power_of_two(value):
+    return value > 0 and value & (value - 1) == 0
+
+def induction_step(quads, defs, variable):
+    # Step of a basic induction variable: its single definition in the loop is
+    # `variable := variable +/- constant`, either directly or through a temporary.
+    positions = defs.get(variable, [])
+    if len(positions) != 1:
+        return None
+    index, op, x, y, z = quads[positions[0]]
+    if op == ":=" and not is_constant(x) and len(defs.get(x, [])) == 1 and defs[x][0] < positions[0]:
+        index, op, x, y, z = quads[defs[x][0]]
+    if op == "+" and x == variable and is_constant(y):
+        return y.value
+    if op == "+" and y == variable and is_constant(x):
+        return x.value
+    if op == "-" and x == variable and is_constant(y):
+        return -y.value
+    return None
+
+# Each iteration trades the multiply's latency for an add's, while the multiply in front of the
+# loop and its load and store are paid on every entry
+INDUCTION_MIN_TRIPS = 8    # Iterations per loop entry a reduced multiply needs to pay off
+
+def loop_runs_long(quads, region, header, latch, defs, profile=None):
+    # Whether a loop averages INDUCTION_MIN_TRIPS iterations per entry in the profile or, without
+    # one, counts from a constant start to a constant bound at least that many times
+    if profile is not None:
+        iterations = profile.taken_count(quads[latch][0])
+        entries = profile.count(quads[header][0]) - iterations
+        return entries > 0 and iterations >= INDUCTION_MIN_TRIPS * entries
+    test = counted_loop_test(quads, header, defs)
+    if test is None:
+        return False
+    variable, op, bound, step = test
+    header_index = quads[header][0]
+    targets = {quad[0] for quad in quads if quad[1] in JUMP_OPS and quad[4] == header_index}
+    if not is_constant(bound) or targets != {quads[latch][0]}:
+        return False
+    start = loop_start_value(quads, region, header, variable, targets)
+    # The count gives up, returning None, past the limit
+    return start is not None and loop_trip_count(op, start, bound.value, step, INDUCTION_MIN_TRIPS - 1) is None
+
+def find_induction_multiply(quads, region, profile=None):
+    positions = {quads[p][0]: p for p in range(len(quads))}
+    for header, latch in loop_ranges(quads, region):
+        loop = range(header, latch + 1)
+        if any(quads[p][1] in ("call", "par") for p in loop):
+            continue
+        entered_midway = any(
+            quads[p][1] in JUMP_OPS and quads[p][4] in positions
+            and header < positions[quads[p][4]] <= latch
+            for p in range(len(quads)) if p not in loop)
+        if entered_midway:
+            continue
+        defs = {}
+        for p in loop:
+            for name in quad_defs(quads[p]):
+                defs.setdefault(name, []).append(p)
+        for p in loop:
+            index, op, x, y, z = quads[p]
+            if op != "*":
+                continue
+            if is_constant(y) and not is_constant(x):
+                variable, factor = x, y.value
+            elif is_constant(x) and not is_constant(y):
+                variable, factor = y, x.value
             else:
-                ox = get_offset_local(symbol_table, x)
-                asm_lines.append(f"{label} lw t0, -{ox}(sp)")
-            asm_lines.append(f"    sw t0, -{oz}(sp)")
+                continue
+            # Powers of two and trivial factors are already cheaper than an add in codegen
+            if factor in (0, 1, -1) or is_power_of_two(abs(factor)) or len(defs[z]) != 1:
+                continue
+            step = induction_step(quads, defs, variable)
+            if step is None:
+                continue
+            update = defs[variable][0]
+            # The product must be a temporary read only before the running sum next advances, so
+            # its readers can take the running sum instead of a copy
+            last = update if p < update else latch
+            readers = [q for q in range(len(quads)) if z in quad_uses(quads[q])]
+            if (not isinstance(z, Temporary) or not readers or any(not p < q <= last for q in readers)
+                    or sum(z in quad_defs(quad) for quad in quads) != 1):
+                continue
+            if loop_runs_long(quads, region, header, latch, defs, profile):
+                return header, latch, p, variable, factor, update, step
+            break
+    return None
 
-        elif op in ["=", "<>", "<", "<=", ">", ">="]:
-            asm_lines += load_operand("t0", x, label)
-            asm_lines += load_operand("t1", y)
-            branch = {
-                "=": f"beq t0, t1, L{z}",
-                "<>": f"bne t0, t1, L{z}",
-                "<": f"blt t0, t1, L{z}",
-                "<=": f"ble t0, t1, L{z}",
-                ">": f"bgt t0, t1, L{z}",
-                ">=": f"bge t0, t1, L{z}",
-            }
-            asm_lines.append(f"    {branch[op]}")
+def reduce_induction_variables(intermediate, symbol_table, profile=None):
+    # i * c inside a loop where i advances by a constant step becomes a running sum, in loops
+    # known or profiled to run long enough to pay for computing it before each entry
+    changed = False
+    while True:
+        quads = intermediate.quads
+        found = None
+        for region in subprogram_regions(quads):
+            found = find_induction_multiply(quads, region, profile)
+            if found is not None:
+                break
+        if found is None:
+            return changed
+        header, latch, multiply, variable, factor, update, step = found
+        product = quads[multiply][4]
+        running = new_scope_temp(intermediate, region_scope(symbol_table, region))
+        fresh_ids = itertools.count(max(quad[0] for quad in quads) + 1)
+        preheader = next(fresh_ids)
+        header_index = quads[header][0]
+        new_quads = []
+        for position, (index, op, x, y, z) in enumerate(quads):
+            if position == header:
+                new_quads.append((preheader, "*", variable, Constant(factor), running))
+            if position == multiply:
+                continue
+            if header < position <= latch:
+                x = running if x == product else x
+                y = running if y == product else y
+            elif op in JUMP_OPS and z == header_index:
+                z = preheader
+            new_quads.append((index, op, x, y, z))
+            if position == update:
+                new_quads.append((next(fresh_ids), "+", running, Constant(factor * step), running))
+                if profile is not None:
+                    profile.inherit(new_quads[-1][0], index)
+        forward = {quads[multiply][0]: quads[multiply + 1][0]}
+        if profile is not None:
+            # The preheader runs once per loop entry: header runs minus back-edge runs
+            profile.counts[preheader] = max(0, profile.count(header_index) - profile.taken_count(quads[latch][0]))
+            profile.renumber(replace_quads(intermediate, new_quads, forward))
+        else:
+            replace_quads(intermediate, new_quads, forward)
+        changed = True
 
-        elif op == "jump":
-            asm_lines.append(f"{label} j L{z}")
+UNROLL_FACTOR = 4          # Body copies per trip through an unrolled loop
+UNROLL_MAX_QUADS = 48      # Code-size budget: quads of body copies one loop may add
+FULL_UNROLL_MAX_TRIPS = 8  # Loops with a known trip count up to this are unrolled completely
+UNROLL_TEST_COST = 3       # Instructions of the loop test each body copy leaves out: two loads and a branch
+UNROLL_CHECK_COST = 10     # Instructions of the check in front of an unrolled trip
+MIRRORED_RELOPS = {"<": ">", "<=": ">=", ">": "<", ">=": "<="}
 
-        elif op == "par":
-            ox = get_offset_local(symbol_table, x)
-            if y == "cv":
-                asm_lines.append(f"{label} lw t0, -{ox}(sp)  # par cv")
-                asm_lines.append("    sw t0, -100(sp)")
-            elif y == "ref":
-                asm_lines.append(f"{label} addi t0, sp, -{ox}  # par ref")
-                asm_lines.append("    sw t0, -100(sp)")
-            elif y == "ret":
-                asm_lines.append(f"{label} addi t0, sp, -{ox}  # par ret")
-                asm_lines.append("    sw t0, -104(sp)")
+class CountedLoop:
+    # `while (variable op bound)` whose body advances variable by a constant step and changes
+    # nothing else the test reads
+    def __init__(self, header, latch, variable, op, bound, step, trips=None, copies=1):
+        self.header = header       # Position of the test; the exit jump follows it
+        self.latch = latch         # Position of the jump back to the test
+        self.variable = variable
+        self.op = op               # Relational operator with the variable on the left
+        self.bound = bound
+        self.step = step
+        self.trips = trips         # Known trip count when the loop is unrolled completely
+        self.copies = copies       # Body copies per trip otherwise
 
-        elif op == "call":
-            asm_lines.append(f"{label} jal {x}")
+    def body(self):
+        return range(self.header + 2, self.latch)
 
-        elif op == "inp":
-            ox = get_offset_local(symbol_table, x)
-            asm_lines.append(f"{label} call read_int")
-            asm_lines.append(f"    sw a0, -{ox}(sp)")
+def counted_loop_test(quads, header, defs):
+    # (variable, op, bound, step) of a test `variable op bound` the loop body moves toward its
+    # exit by a constant step without changing the bound; `defs` maps names to their loop defs
+    index, op, x, y, z = quads[header]
+    if op not in MIRRORED_RELOPS:
+        return None
+    variable, bound = x, y
+    step = None if is_constant(x) else induction_step(quads, defs, x)
+    if step is None and not is_constant(y):
+        variable, bound, op = y, x, MIRRORED_RELOPS[op]
+        step = induction_step(quads, defs, y)
+    if not step or (step > 0) != (op in ("<", "<=")):
+        return None
+    if not is_constant(bound) and bound in defs:
+        return None
+    return variable, op, bound, step
 
-        elif op == "out":
-            ox = get_offset_local(symbol_table, x)
-            asm_lines.append(f"{label} lw a0, -{ox}(sp)")
-            asm_lines.append("    call print_int")
+def unroll_min_trips(copies):
+    # Iterations per loop entry from which trips of `copies` body copies save more tests than
+    # their checks cost, the check that fails on the way out and its jump included; None if
+    # they never do
+    saving = copies * UNROLL_TEST_COST - UNROLL_CHECK_COST
+    if saving <= 0:
+        return None
+    return copies * ((UNROLL_CHECK_COST + 1) // saving + 1)
 
-        elif op == "retv":
-            ox = get_offset_local(symbol_table, x)
-            asm_lines.append(f"{label} lw t0, -{ox}(sp)")
-            asm_lines.append("    lw t1, -8(sp)")
-            asm_lines.append("    sw t0, 0(t1)")
+def loop_trip_count(op, start, bound, step, limit):
+    value, trips = start, 0
+    while BATCH_RELOPS[op](value, bound):
+        trips += 1
+        if trips > limit:
+            return None
+        value = wrap_int32(value + step)
+    return trips
 
-        elif op == "end_block":
-            asm_lines.append(f"{label} ret")
+def loop_start_value(quads, region, header, variable, targets):
+    # Constant the variable is set to on the straight path into the test, if any
+    for position in range(header - 1, region.start - 1, -1):
+        index, op, x, y, z = quads[position]
+        if op in JUMP_OPS or op == "call":
+            return None
+        if variable in quad_defs(quads[position]):
+            return x.value if op == ":=" and is_constant(x) else None
+        if index in targets:
+            return None
+    return None
 
-        elif op == "halt":
-            asm_lines.append(f"{label} # halt")
+def find_counted_loop(quads, region, done, factor, profile=None):
+    positions = {quads[p][0]: p for p in region.own_positions()}
+    jumps = [(p, positions[quads[p][4]]) for p in region.own_positions()
+             if quads[p][1] in JUMP_OPS and quads[p][4] in positions]
+    targets = {}
+    for source, target in jumps:
+        targets.setdefault(quads[target][0], []).append(source)
+    for header, latch in loop_ranges(quads, region):
+        index, op, x, y, z = quads[header]
+        if index in done or op not in MIRRORED_RELOPS or quads[latch][1] != "jump":
+            continue
+        if quads[header + 1][1] != "jump" or positions.get(z) != header + 2 or header + 2 >= latch:
+            continue
+        if profile is not None and profile.count(index) == 0:
+            continue
+        loop = range(header, latch + 1)
+        body = range(header + 2, latch)
+        if any(quads[p][1] in ("call", "par", "in") for p in body):
+            continue
+        # Innermost loops that are only entered at the test and only go back to it from the latch
+        if any((source not in loop and header < target <= latch)
+               or (source in body and (target in (header, header + 1) or target <= source))
+               for source, target in jumps):
+            continue
+        defs = {}
+        for p in loop:
+            for name in quad_defs(quads[p]):
+                defs.setdefault(name, []).append(p)
+        test = counted_loop_test(quads, header, defs)
+        if test is None:
+            continue
+        variable, op, bound, step = test
+        size = len(body)
+        trips = None
+        start = loop_start_value(quads, region, header, variable, targets)
+        known = start is not None and is_constant(bound) and targets.get(index) == [latch]
+        if known:
+            trips = loop_trip_count(op, start, bound.value, step, FULL_UNROLL_MAX_TRIPS)
+        if trips is not None and trips * size <= UNROLL_MAX_QUADS:
+            return CountedLoop(header, latch, variable, op, bound, step, trips=trips)
+        copies = min(factor, UNROLL_MAX_QUADS // size)
+        min_trips = unroll_min_trips(copies) if copies >= 2 else None
+        if min_trips is None:
+            continue
+        # Partial unrolling needs the iterations per entry to pay for the checks: counted from
+        # constants, or averaged over the profile's exits
+        if profile is not None:
+            pays = profile.taken_count(index) >= min_trips * max(1, profile.count(quads[header + 1][0]))
+        else:
+            pays = known and loop_trip_count(op, start, bound.value, step, min_trips - 1) is None
+        if pays:
+            return CountedLoop(header, latch, variable, op, bound, step, copies=copies)
+    return None
+
+def copy_loop_bodies(quads, loop, count, after, fresh_ids, profile=None, scale=1.0):
+    # `count` copies of the body one after another; a jump to the latch continues with the next
+    # copy and the last copy continues at `after`
+    body = loop.body()
+    latch_index = quads[loop.latch][0]
+    labels = [{quads[p][0]: next(fresh_ids) for p in body} for _ in range(count)]
+    starts = [copy[quads[body[0]][0]] for copy in labels[1:]] + [after]
+    copies = []
+    for copy, following in zip(labels, starts):
+        for p in body:
+            index, op, x, y, z = quads[p]
+            if op in JUMP_OPS and z != "_":
+                z = following if z == latch_index else copy.get(z, z)
+            copies.append((copy[index], op, x, y, z))
+            if profile is not None:
+                profile.inherit(copy[index], index, scale)
+    return copies
 
+def unroll_loops(intermediate, symbol_table, factor=UNROLL_FACTOR, profile=None):
+    # Counted loops with a small known trip count are replaced by that many body copies.  Other
+    # counted loops get a block that runs `factor` copies while the test still holds for the
+    # last of them; the original loop stays behind it for the remaining iterations.
+    if factor < 2:
+        return False
+    changed = False
+    done = set()               # Tests of remainder loops
+    while True:
+        quads = intermediate.quads
+        found = None
+        for region in subprogram_regions(quads):
+            found = find_counted_loop(quads, region, done, factor, profile)
+            if found is not None:
+                break
+        if found is None:
+            return changed
+        loop = found
+        fresh_ids = itertools.count(max(quad[0] for quad in quads) + 1)
+        header_index = quads[loop.header][0]
+        forward = {}
+        if loop.trips is not None:
+            exit_jump = (next(fresh_ids), "jump", "_", "_", quads[loop.header + 1][4])
+            replacement = copy_loop_bodies(quads, loop, loop.trips, exit_jump[0], fresh_ids,
+                                           profile, 1.0 / max(1, loop.trips)) + [exit_jump]
+            if profile is not None:
+                profile.inherit(exit_jump[0], quads[loop.header + 1][0])
+            for p in range(loop.header, loop.latch + 1):
+                forward[quads[p][0]] = replacement[0][0]
+            new_quads = quads[:loop.header] + replacement + quads[loop.latch + 1:]
         else:
-            asm_lines.append(f"# {label} Unhandled op: {op} {x} {y} {z}")
+            k = loop.copies
+            last = new_scope_temp(intermediate, region_scope(symbol_table, region))
+            check = [next(fresh_ids) for _ in range(4)]
+            back = next(fresh_ids)
+            copies = copy_loop_bodies(quads, loop, k, back, fresh_ids, profile, 1.0 / k)
+            unrolled = [
+                (check[0], "+", loop.variable, Constant((k - 1) * loop.step), last),
+                # The sum wrapped around: leave the rest to the original loop
+                (check[1], "<" if loop.step > 0 else ">", last, loop.variable, header_index),
+                (check[2], loop.op, last, loop.bound, copies[0][0]),
+                (check[3], "jump", "_", "_", header_index),
+            ] + copies + [(back, "jump", "_", "_", check[0])]
+            if profile is not None:
+                for label in check + [back]:
+                    profile.inherit(label, header_index, 1.0 / k)
+                # The wrap-around test is not expected to branch, and the way out is taken once
+                # per entry, like the original exit
+                profile.taken[check[1]] = 0
+                profile.inherit(check[3], quads[loop.header + 1][0])
+            new_quads = []
+            for position, (index, op, x, y, z) in enumerate(quads):
+                if position == loop.header:
+                    new_quads.extend(unrolled)
+                if op in JUMP_OPS and z == header_index and not loop.header <= position <= loop.latch:
+                    z = check[0]
+                new_quads.append((index, op, x, y, z))
+        index_map = replace_quads(intermediate, new_quads, forward)
+        done = {index_map[index] for index in done if index in index_map}
+        if loop.trips is None:
+            done.add(index_map[header_index])
+        if profile is not None:
+            profile.renumber(index_map)
+        changed = True
 
-    asm_lines.append("")
-    asm_lines.append(".data")
-    asm_lines.append("_stack: .space 1024")
-    asm_lines.append("str_nl: .asciz \"\\n\"")
-    asm_lines.append(".text")
-    asm_lines.append("")
-    asm_lines.append("# Runtime routines")
-    asm_lines.append("read_int:")
-    asm_lines.append("    li a7, 5")
-    asm_lines.append("    ecall")
-    asm_lines.append("    ret")
-    asm_lines.append("")
-    asm_lines.append("print_int:")
-    asm_lines.append("    li a7, 1")
-    asm_lines.append("    ecall")
-    asm_lines.append("    ret")
+INVERTED_RELOPS = {"=": "<>", "<>": "=", "<": ">=", ">=": "<", ">": "<=", "<=": ">"}
+LOOP_FREQUENCY = 8         # Static estimate of iterations per loop entry
+LIKELY_PROBABILITY = 0.9   # Probability of staying in a loop at a conditional branch
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        for line in asm_lines:
-            f.write(line + "\n")
+class BasicBlock:
+    def __init__(self, quads, order):
+        self.quads = quads
+        self.order = order         # Position in the original layout
+        self.label = quads[0][0]
 
-    print(f"RISC-V Assembly code written to {output_path}")
+    def terminator(self):
+        return self.quads[-1][1]
 
+def build_basic_blocks(quads):
+    # Splits a run of quads at jump targets and after every jump
+    labels = {quad[0] for quad in quads}
+    leaders = {quads[0][0]}
+    for position, (index, op, x, y, z) in enumerate(quads):
+        if op in JUMP_OPS:
+            if z in labels:
+                leaders.add(z)
+            if position + 1 < len(quads):
+                leaders.add(quads[position + 1][0])
+    blocks = []
+    for quad in quads:
+        if quad[0] in leaders:
+            blocks.append([])
+        blocks[-1].append(quad)
+    return [BasicBlock(block_quads, order) for order, block_quads in enumerate(blocks)]
 
+def block_successors(block, fall_through):
+    index, op, x, y, z = block.quads[-1]
+    if op == "jump":
+        return [z]
+    if op in RELOPS:
+        return [z, fall_through] if fall_through is not None else [z]
+    if op == "end_block" or fall_through is None:
+        return []
+    return [fall_through]
 
+def jump_threader(blocks):
+    # Maps a label to where control really goes: a block holding only `jump L` is skipped
+    by_label = {block.label: block for block in blocks}
 
+    def final_target(label):
+        seen = set()
+        while label in by_label and label not in seen:
+            block = by_label[label]
+            if len(block.quads) != 1 or block.terminator() != "jump":
+                break
+            seen.add(label)
+            label = block.quads[0][4]
+        return label
 
+    return final_target
 
+def branch_probabilities(block, targets, order, loops):
+    if len(targets) != 2 or targets[0] == targets[1]:
+        return [1.0] * len(targets)
 
-###################################### MAIN #########################################
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 cimple_compiler_2025.py <input_file>")
-        sys.exit(1)
+    def leaves_loop(target):
+        return any(header <= block.order <= latch and not header <= order[target] <= latch
+                   for header, latch in loops)
 
-    input_path = sys.argv[1]
-    lexer = LexerFSM(input_path)
-    print("Lexical analysis completed successfully.")
-    tokens = lexer.tokenize()
-    intermediate = IntermediateCodeGenerator()
-    parser = Parser(tokens, intermediate)
-    parser.program()
-    print("Parsing completed successfully.")
-    print("\nGenerated Intermediate Code (Quads):")
-    intermediate.print_quads()
-    write_int_file(intermediate, input_path)
-    write_asm_file(intermediate, parser.symbol_table, input_path)
\ No newline at end of file
+    exits = [leaves_loop(target) for target in targets]
+    if exits[0] == exits[1]:
+        return [0.5, 0.5]
+    return [1 - LIKELY_PROBABILITY if leaving else LIKELY_PROBABILITY for leaving in exits]
+
+def profile_edge_weights(blocks, successors, profile):
+    # Measured weights: a block's last quad runs once each time control leaves the block
+    weights = {}
+    for block in blocks:
+        index, op, x, y, z = block.quads[-1]
+        executed = profile.count(index)
+        targets = successors[block.label]
+        if op in RELOPS and len(targets) == 2:
+            taken = min(profile.taken_count(index), executed)
+            split = [taken, executed - taken]
+        else:
+            split = [executed] * len(targets)
+        for target, weight in zip(targets, split):
+            weights[(block.label, target)] = weights.get((block.label, target), 0) + weight
+    return weights
+
+def estimate_edge_weights(blocks, successors, profile=None):
+    # Static prediction: back edges are taken, branches that leave a loop are not.  Block
+    # frequencies flow along forward edges in layout order and loop headers are scaled up.
+    # Regions the profile saw running use the measured counts instead.
+    if profile is not None and any(profile.count(quad[0]) for block in blocks for quad in block.quads):
+        return profile_edge_weights(blocks, successors, profile)
+    order = {block.label: block.order for block in blocks}
+    loops = [(order[target], block.order) for block in blocks
+             for target in successors[block.label] if order[target] <= block.order]
+    headers = {header for header, latch in loops}
+    frequency = {block.label: 0.0 for block in blocks}
+    frequency[blocks[0].label] = 1.0
+    weights = {}
+    for block in blocks:
+        if block.order in headers:
+            frequency[block.label] *= LOOP_FREQUENCY
+        targets = successors[block.label]
+        for target, probability in zip(targets, branch_probabilities(block, targets, order, loops)):
+            weight = frequency[block.label] * probability
+            weights[(block.label, target)] = weights.get((block.label, target), 0) + weight
+            if order[target] > block.order:
+                frequency[target] += weight
+    return weights
+
+def layout_blocks(blocks, weights):
+    # Bottom-up chain merging: the heaviest edges become fall-throughs
+    entry, exit_block = blocks[0].label, blocks[-1].label
+    order = {block.label: block.order for block in blocks}
+    chain_of = {block.label: [block.label] for block in blocks}
+    # On equal weight a loop's back edge is merged first, which moves the loop test below the
+    # body: the latch falls into the test and the taken branch goes back to the top.
+    edges = sorted(weights.items(), key=lambda item: (
+        -round(item[1], 9), order[item[0][1]] > order[item[0][0]], order[item[0][0]], order[item[0][1]]))
+    for (source, target), weight in edges:
+        source_chain, target_chain = chain_of[source], chain_of[target]
+        if source_chain is target_chain or target == entry:
+            continue
+        if source_chain[-1] != source or target_chain[0] != target or exit_block in source_chain:
+            continue
+        # The entry and exit chains stay apart so every other chain can be placed between them
+        if entry in source_chain and exit_block in target_chain:
+            continue
+        source_chain.extend(target_chain)
+        for label in target_chain:
+            chain_of[label] = source_chain
+    chains = []
+    for block in blocks:
+        chain = chain_of[block.label]
+        if chain[0] == block.label:
+            chains.append(chain)
+    chains.sort(key=lambda chain: (chain[0] != entry, exit_block in chain, order[chain[0]]))
+    return [label for chain in chains for label in chain]
+
+def emit_layout(blocks, successors, placement, fresh_ids):
+    by_label = {block.label: block for block in blocks}
+    quads = []
+    for position, label in enumerate(placement):
+        block = by_label[label]
+        next_label = placement[position + 1] if position + 1 < len(placement) else None
+        body = block.quads[:]
+        index, op, x, y, z = body[-1]
+        targets = successors[label]
+        if op == "jump":
+            if z == next_label:
+                body.pop()
+        elif op in RELOPS and len(targets) == 2:
+            fall_through = targets[1]
+            if fall_through != next_label:
+                if z == next_label:
+                    body[-1] = (index, INVERTED_RELOPS[op], x, y, fall_through)
+                else:
+                    body.append((next(fresh_ids), "jump", "_", "_", fall_through))
+        elif targets and targets[0] != next_label:
+            body.append((next(fresh_ids), "jump", "_", "_", targets[0]))
+        quads.extend(body)
+    return quads
+
+def layout_region(quads, region, fresh_ids, profile=None):
+    blocks = build_basic_blocks(quads[region.start:region.end + 1])
+    fall_throughs = [block.label for block in blocks[1:]] + [None]
+    final_target = jump_threader(blocks)
+    successors = {}
+    for block, fall_through in zip(blocks, fall_throughs):
+        successors[block.label] = [final_target(label) for label in block_successors(block, fall_through)]
+        index, op, x, y, z = block.quads[-1]
+        if op in JUMP_OPS:
+            block.quads[-1] = (index, op, x, y, successors[block.label][0])
+    reachable = set()
+    pending = [blocks[0].label]
+    while pending:
+        label = pending.pop()
+        if label not in reachable:
+            reachable.add(label)
+            pending.extend(successors[label])
+    exit_label = blocks[-1].label
+    blocks = [block for block in blocks if block.label in reachable or block.label == exit_label]
+    weights = estimate_edge_weights(blocks, successors, profile)
+    placement = layout_blocks(blocks, weights)
+    return emit_layout(blocks, successors, placement, fresh_ids)
+
+def layout_code(intermediate, profile=None):
+    # Orders each subprogram's basic blocks for fall-through and inverts branches so that
+    # a condition costs one branch instead of a branch and a jump
+    quads = intermediate.quads
+    fresh_ids = itertools.count(max(quad[0] for quad in quads) + 1)
+    laid_out = {}
+    for region in subprogram_regions(quads):
+        laid_out[region.start] = (region.end, layout_region(quads, region, fresh_ids, profile))
+    new_quads = []
+    position = 0
+    while position < len(quads):
+        if position in laid_out:
+            end, region_quads = laid_out[position]
+            new_quads.extend(region_quads)
+            position = end + 1
+        else:
+            new_quads.append(quads[position])
+            position += 1
+    kept = {quad[0] for quad in new_quads}
+    forward = {quad[0]: quad[4] for quad in quads if quad[0] not in kept and quad[1] == "jump"}
+    index_map = replace_quads(intermediate, new_quads, forward)
+    if profile is not None:
+        profile.renumber(index_map)
+
+# SSA form of one region: locals that no other region can reach are renamed so that every
+# version has a single definition, with phi nodes at the iterated dominance frontiers of the
+# definitions.  Only names that are live into some block get phis (semi-pruned SSA).
+SCCP_UNKNOWN = "unknown"   # No executable definition seen yet; constants are ints
+SCCP_VARYING = "varying"   # Not a compile-time constant
+
+class SSAName(VariableRef):
+    # One version of a renamed variable.  It keeps the variable's entity, so leaving SSA only
+    # has to drop the version; version 0 is the value the variable has on entry.
+    def __new__(cls, base, version):
+        operand = super().__new__(cls, f"{base}.{version}", base.entity)
+        operand.base = base
+        operand.version = version
+        return operand
+
+class SSABlock(BasicBlock):
+    def __init__(self, block):
+        super().__init__(block.quads, block.order)
+        self.targets = []          # Successor labels as block_successors returns them
+        self.successors = []
+        self.predecessors = []
+        self.phis = {}             # Variable name -> [SSAName defined, {predecessor label: argument}]
+
+class SSAForm:
+    def __init__(self, blocks, variables):
+        self.blocks = blocks
+        self.by_label = {block.label: block for block in blocks}
+        self.entry = blocks[0].label
+        self.variables = variables # Name -> operand of every renamed variable
+        self.order = []            # Reachable labels in reverse postorder
+        self.idom = {}
+        self.frontiers = {}
+
+def ssa_base(operand):
+    return operand.base if isinstance(operand, SSAName) else operand
+
+def rename_quad(quad, use, define):
+    # Applies `use` to the operands a quad reads and `define` to the one it writes
+    index, op, x, y, z = quad
+    if op in ARITHMETIC_OPS or op in RELOPS:
+        x, y = use(x), use(y)
+    elif op in (":=", "out", "retv") or (op == "par" and y == "cv"):
+        x = use(x)
+    if op in ARITHMETIC_OPS or op == ":=":
+        z = define(z)
+    elif op == "in" or (op == "par" and y == "ret"):
+        x = define(x)
+    return (index, op, x, y, z)
+
+def ssa_variables(quads, regions, symbol_table):
+    # Per region (keyed by its begin position): the locals and `in` parameters that no other
+    # region reaches and that are never passed by reference.  Everything else stays in memory.
+    owners = {}
+    for region in regions:
+        for position in region.own_positions():
+            owners[position] = region
+    users = {}
+    excluded = set()
+    for position, (index, op, x, y, z) in enumerate(quads):
+        if position not in owners or op in ("begin_block", "end_block", "call"):
+            continue
+        for operand in (x, y, z):
+            entity = getattr(operand, "entity", None)
+            if entity is not None:
+                users.setdefault(id(entity), set()).add(owners[position].begin)
+            elif isinstance(operand, str) and not is_constant(operand) and operand != "_":
+                excluded.add(str(operand))
+        if op == "par" and y == "ref":
+            excluded.add(str(x))
+    variables = {}
+    for region in regions:
+        scope = region_scope(symbol_table, region)
+        own = {}
+        for position in region.own_positions():
+            for operand in quads[position][2:]:
+                entity = getattr(operand, "entity", None)
+                if entity is None or scope.entities.get(operand) is not entity or operand in excluded:
+                    continue
+                if isinstance(entity, Parameter) and entity.mode != "in":
+                    continue
+                if users[id(entity)] == {region.begin}:
+                    own.setdefault(str(operand), operand)
+        variables[region.begin] = own
+    return variables
+
+def dominator_tree(ssa):
+    # Reverse postorder, immediate dominators (Cooper, Harvey and Kennedy) and dominance
+    # frontiers of the blocks reachable from the entry
+    by_label = ssa.by_label
+    postorder = []
+    visited = {ssa.entry}
+    stack = [(ssa.entry, iter(by_label[ssa.entry].successors))]
+    while stack:
+        label, successors = stack[-1]
+        for successor in successors:
+            if successor not in visited:
+                visited.add(successor)
+                stack.append((successor, iter(by_label[successor].successors)))
+                break
+        else:
+            postorder.append(label)
+            stack.pop()
+    ssa.order = postorder[::-1]
+    number = {label: position for position, label in enumerate(ssa.order)}
+
+    def intersect(a, b):
+        while a != b:
+            while number[a] > number[b]:
+                a = idom[a]
+            while number[b] > number[a]:
+                b = idom[b]
+        return a
+
+    idom = {ssa.entry: ssa.entry}
+    changed = True
+    while changed:
+        changed = False
+        for label in ssa.order[1:]:
+            done = [p for p in by_label[label].predecessors if p in idom]
+            new = done[0]
+            for predecessor in done[1:]:
+                new = intersect(predecessor, new)
+            if idom.get(label) != new:
+                idom[label] = new
+                changed = True
+    ssa.idom = idom
+    ssa.frontiers = {label: set() for label in ssa.order}
+    for label in ssa.order:
+        predecessors = [p for p in by_label[label].predecessors if p in idom]
+        # The entry block is also entered from outside the region
+        if len(predecessors) + (label == ssa.entry) < 2:
+            continue
+        for predecessor in predecessors:
+            runner = predecessor
+            while runner != idom[label]:
+                ssa.frontiers[runner].add(label)
+                runner = idom[runner]
+
+def place_phis(ssa):
+    definitions = {}
+    live_in = set()
+    for label in ssa.order:
+        written = set()
+        for quad in ssa.by_label[label].quads:
+            live_in.update(name for name in quad_uses(quad) if name in ssa.variables and name not in written)
+            for name in quad_defs(quad):
+                if name in ssa.variables:
+                    written.add(name)
+                    definitions.setdefault(str(name), set()).add(label)
+    for name in ssa.variables:
+        if name not in live_in:
+            continue
+        pending = list(definitions.get(name, ()))
+        placed = set()
+        while pending:
+            for frontier in ssa.frontiers[pending.pop()]:
+                if frontier not in placed:
+                    placed.add(frontier)
+                    ssa.by_label[frontier].phis[name] = [None, {}]
+                    pending.append(frontier)
+
+def rename_ssa(ssa):
+    # Walks the dominator tree with a stack of current versions per variable
+    versions = {name: 0 for name in ssa.variables}
+    current = {name: [SSAName(operand, 0)] for name, operand in ssa.variables.items()}
+    children = {label: [] for label in ssa.order}
+    for label in ssa.order[1:]:
+        children[ssa.idom[label]].append(label)
+
+    def use(operand):
+        return current[operand][-1] if operand in current else operand
+
+    def define(operand):
+        if operand not in current:
+            return operand
+        versions[operand] += 1
+        name = SSAName(ssa.variables[operand], versions[operand])
+        current[operand].append(name)
+        defined.append(operand)
+        return name
+
+    for name, phi in ssa.by_label[ssa.entry].phis.items():
+        phi[1][None] = current[name][0]
+    pending = [(ssa.entry, None)]
+    while pending:
+        label, defined = pending.pop()
+        if defined is not None:
+            # Leaving the block: its versions go out of scope
+            for name in defined:
+                current[name].pop()
+            continue
+        block = ssa.by_label[label]
+        defined = []
+        for name, phi in block.phis.items():
+            phi[0] = define(name)
+        block.quads = [rename_quad(quad, use, define) for quad in block.quads]
+        for successor in block.successors:
+            for name, phi in ssa.by_label[successor].phis.items():
+                phi[1][label] = current[name][-1]
+        pending.append((label, defined))
+        pending.extend((child, None) for child in reversed(children[label]))
+
+def build_ssa(quads, region, variables):
+    # `variables` is this region's entry of ssa_variables
+    blocks = [SSABlock(block) for block in build_basic_blocks(quads[region.start:region.end + 1])]
+    for block, following in zip(blocks, blocks[1:] + [None]):
+        block.targets = block_successors(block, following.label if following is not None else None)
+        block.successors = list(dict.fromkeys(block.targets))
+    ssa = SSAForm(blocks, variables)
+    for block in blocks:
+        for successor in block.successors:
+            ssa.by_label[successor].predecessors.append(block.label)
+    dominator_tree(ssa)
+    place_phis(ssa)
+    rename_ssa(ssa)
+    return ssa
+
+def leave_ssa(ssa):
+    # Passes on the SSA form only substitute constants and drop dead code, so the versions of a
+    # variable never overlap: every version becomes the variable again and phis disappear
+    return [rename_quad(quad, ssa_base, ssa_base) for block in ssa.blocks for quad in block.quads]
+
+def format_ssa(ssa):
+    lines = []
+    for block in ssa.blocks:
+        lines.append(f"L{block.label}:" + ("" if block.label in ssa.idom else "  # unreachable"))
+        for name, (target, arguments) in block.phis.items():
+            incoming = ", ".join(f"{argument} [{'entry' if label is None else f'L{label}'}]"
+                                 for label, argument in arguments.items())
+            lines.append(f"  {target} := phi({incoming})")
+        lines.extend(f"  {index}: {op}, {x}, {y}, {z}" for index, op, x, y, z in block.quads)
+    return "\n".join(lines) + "\n"
+
+def meet(a, b):
+    if a == SCCP_UNKNOWN:
+        return b
+    if b == SCCP_UNKNOWN or a == b:
+        return a
+    return SCCP_VARYING
+
+def sccp(ssa):
+    # Sparse conditional constant propagation (Wegman and Zadeck).  Values start unknown and
+    # only fall; a block is evaluated once an edge into it is found executable, so definitions
+    # on branches that never run do not spoil the values at a join.
+    by_label = ssa.by_label
+    values = {}
+    uses = {}
+    for label in ssa.order:
+        block = by_label[label]
+        for name, (target, arguments) in block.phis.items():
+            for argument in arguments.values():
+                uses.setdefault(argument, []).append((label, name))
+        for position, quad in enumerate(block.quads):
+            for operand in quad_uses(quad):
+                uses.setdefault(operand, []).append((label, position))
+    executable = set()
+    edges = {(None, ssa.entry)}
+    flow = [(None, ssa.entry)]
+    changed_names = []
+
+    def value(operand):
+        if is_constant(operand):
+            return operand.value
+        if isinstance(operand, SSAName) and operand.version:
+            return values.get(operand, SCCP_UNKNOWN)
+        return SCCP_VARYING
+
+    def lower(name, new):
+        if not isinstance(name, SSAName):
+            return
+        old = values.get(name, SCCP_UNKNOWN)
+        merged = meet(old, new)
+        if merged != old:
+            values[name] = merged
+            changed_names.append(name)
+
+    def mark(source, target):
+        if (source, target) not in edges:
+            edges.add((source, target))
+            flow.append((source, target))
+
+    def evaluate_phi(block, name):
+        target, arguments = block.phis[name]
+        result = SCCP_UNKNOWN
+        for predecessor, argument in arguments.items():
+            if (predecessor, block.label) in edges:
+                result = meet(result, value(argument))
+        lower(target, result)
+
+    def evaluate(block, position):
+        index, op, x, y, z = block.quads[position]
+        if op in ARITHMETIC_OPS or op in RELOPS:
+            a, b = value(x), value(y)
+            if SCCP_VARYING in (a, b) or (op == "/" and b == 0):
+                result = SCCP_VARYING
+            elif SCCP_UNKNOWN in (a, b):
+                result = SCCP_UNKNOWN
+            elif op in RELOPS:
+                result = BATCH_RELOPS[op](a, b)
+            else:
+                result = fold_arithmetic(op, a, b)
+            if op in ARITHMETIC_OPS:
+                lower(z, result)
+        elif op == ":=":
+            lower(z, value(x))
+        elif op == "in" or (op == "par" and y == "ret"):
+            lower(x, SCCP_VARYING)
+        if position != len(block.quads) - 1:
+            return
+        if op in RELOPS and len(block.targets) == 2:
+            if result == SCCP_VARYING:
+                mark(block.label, block.targets[0])
+                mark(block.label, block.targets[1])
+            elif result != SCCP_UNKNOWN:
+                mark(block.label, block.targets[0 if result else 1])
+        else:
+            for target in block.targets:
+                mark(block.label, target)
+
+    while flow or changed_names:
+        while flow:
+            source, label = flow.pop()
+            block = by_label[label]
+            for name in block.phis:
+                evaluate_phi(block, name)
+            if label not in executable:
+                executable.add(label)
+                for position in range(len(block.quads)):
+                    evaluate(block, position)
+        while changed_names:
+            for label, site in uses.get(changed_names.pop(), ()):
+                if label in executable:
+                    if isinstance(site, int):
+                        evaluate(by_label[label], site)
+                    else:
+                        evaluate_phi(by_label[label], site)
+    return values, executable
+
+def apply_constants(ssa, values, executable):
+    # Replaces constant versions by their values, turns branches with a constant outcome into
+    # jumps (or drops them), deletes blocks that never run and definitions nobody reads anymore
+    def substitute(operand):
+        known = values.get(operand) if isinstance(operand, SSAName) else None
+        return Constant(known) if isinstance(known, int) else operand
+
+    exit_block = ssa.blocks[-1]
+    blocks = [block for block in ssa.blocks if block.label in executable or block is exit_block]
+    used = set()
+    for block in blocks:
+        quads = []
+        for position, quad in enumerate(block.quads):
+            index, op, x, y, z = quad = rename_quad(quad, substitute, lambda operand: operand)
+            if op in RELOPS and is_constant(x) and is_constant(y) and position == len(block.quads) - 1:
+                if not BATCH_RELOPS[op](x.value, y.value):
+                    continue
+                quad = (index, "jump", "_", "_", z)
+            quads.append(quad)
+            used.update(quad_uses(quad))
+        block.quads = quads
+        for name, phi in block.phis.items():
+            phi[1] = {label: argument for label, argument in phi[1].items() if label is None or label in executable}
+            used.update(phi[1].values())
+    for block in blocks:
+        block.quads = [quad for quad in block.quads
+                       if not ((quad[1] in ARITHMETIC_OPS or quad[1] == ":=") and isinstance(quad[4], SSAName)
+                               and isinstance(values.get(quad[4]), int) and quad[4] not in used)]
+    ssa.blocks = blocks
+
+def propagate_constants(intermediate, symbol_table, profile=None):
+    # Runs SCCP on the SSA form of every region and translates the result back to quads
+    quads = intermediate.quads
+    regions = subprogram_regions(quads)
+    variables = ssa_variables(quads, regions, symbol_table)
+    rewritten = {}
+    forward = {}
+    for region in regions:
+        ssa = build_ssa(quads, region, variables[region.begin])
+        values, executable = sccp(ssa)
+        apply_constants(ssa, values, executable)
+        body = leave_ssa(ssa)
+        original = quads[region.start:region.end + 1]
+        if body == original:
+            continue
+        rewritten[region.start] = (region.end, body)
+        # Labels of removed quads move on to the next quad that is kept
+        kept = {quad[0] for quad in body}
+        following = None
+        for index, op, x, y, z in reversed(original):
+            if index in kept:
+                following = index
+            else:
+                forward[index] = following
+    if not rewritten:
+        return False
+    new_quads = []
+    position = 0
+    while position < len(quads):
+        if position in rewritten:
+            end, body = rewritten[position]
+            new_quads.extend(body)
+            position = end + 1
+        else:
+            new_quads.append(quads[position])
+            position += 1
+    index_map = replace_quads(intermediate, new_quads, forward)
+    if profile is not None:
+        profile.renumber(index_map)
+    return True
+
+def optimize(intermediate, symbol_table, profile=None, unroll_factor=UNROLL_FACTOR):
+    # `profile` holds counts for the quads as parsed; each pass keeps it in step with its output
+    inline_subprograms(intermediate, symbol_table, profile=profile)
+    specialize_subprograms(intermediate, symbol_table, profile)
+    propagate_constants(intermediate, symbol_table, profile)
+    simplify_algebra(intermediate)
+    reduce_induction_variables(intermediate, symbol_table, profile)
+    unroll_loops(intermediate, symbol_table, unroll_factor, profile)
+    layout_code(intermediate, profile)
+
+###################################### ASSEMBLY CODE GENERATION #########################################
+RECURSIVE_STACK_SIZE = 65536   # Stack reserved when recursion leaves the call depth unbounded
+IO_BUFFER_SIZE = 4096      # Bytes per read or write of the buffered I/O runtime
+IO_DIGITS = 12             # Longest int as text with its sign and newline, rounded to a word
+
+def signed_magic(divisor):
+    # Magic multiplier and shift for signed division by a constant divisor >= 2
+    # (Hacker's Delight, section 10-4)
+    two31 = 1 << 31
+    anc = two31 - 1 - two31 % divisor
+    p = 31
+    q1, r1 = divmod(two31, anc)
+    q2, r2 = divmod(two31, divisor)
+    while True:
+        p += 1
+        q1, r1 = 2 * q1, 2 * r1
+        if r1 >= anc:
+            q1, r1 = q1 + 1, r1 - anc
+        q2, r2 = 2 * q2, 2 * r2
+        if r2 >= divisor:
+            q2, r2 = q2 + 1, r2 - divisor
+        delta = divisor - r2
+        if not (q1 < delta or (q1 == delta and r1 == 0)):
+            break
+    return wrap_int32(q2 + 1), p - 32
+
+def constant_multiply_asm(factor):
+    # t2 = t0 * factor without a mul where a cheaper sequence exists
+    if factor == 0:
+        return ["    li t2, 0"]
+    if factor == 1:
+        return ["    mv t2, t0"]
+    if factor == -1:
+        return ["    neg t2, t0"]
+    if is_power_of_two(abs(factor)):
+        lines = [f"    slli t2, t0, {abs(factor).bit_length() - 1}"]
+        if factor < 0:
+            lines.append("    neg t2, t2")
+        return lines
+    return None
+
+def constant_divide_asm(divisor):
+    # t2 = t0 / divisor, truncating toward zero
+    if divisor == 0:
+        return None
+    if divisor == 1:
+        return ["    mv t2, t0"]
+    if divisor == -1:
+        return ["    neg t2, t0"]
+    magnitude = abs(divisor)
+    if is_power_of_two(magnitude):
+        shift = magnitude.bit_length() - 1
+        lines = ["    srai t3, t0, 31"] if shift > 1 else []
+        lines.append(f"    srli t3, {'t3' if shift > 1 else 't0'}, {32 - shift}")
+        lines.append("    add t3, t0, t3")
+        lines.append(f"    srai t2, t3, {shift}")
+    else:
+        magic, shift = signed_magic(magnitude)
+        lines = [f"    li t1, {magic}", "    mulh t2, t0, t1"]
+        if magic < 0:
+            lines.append("    add t2, t2, t0")
+        if shift > 0:
+            lines.append(f"    srai t2, t2, {shift}")
+        lines.append("    srli t3, t0, 31")
+        lines.append("    add t2, t2, t3")
+    if divisor < 0:
+        lines.append("    neg t2, t2")
+    return lines
+
+SWITCH_MIN_CASES = 4       # Shorter compare chains stay as sequential branches
+JUMP_TABLE_MAX_SPAN = 3    # A table may have up to this many slots per case
+
+def find_switch_dispatches(quads):
+    # Finds chains of `variable = constant` tests where each failed test leads straight to the
+    # next one, as switchcase produces when every case compares one variable with a constant.
+    # Returns {head position: (variable, [(value, target index)], default target index)}.
+    positions = {quad[0]: position for position, quad in enumerate(quads)}
+
+    def follow_jump(target):
+        position = positions.get(target)
+        if position is not None and quads[position][1] == "jump":
+            return quads[position][4]
+        return target
+
+    def arm(position):
+        index, op, x, y, z = quads[position]
+        if op not in ("=", "<>") or position + 1 >= len(quads):
+            return None
+        if is_constant(y) and not is_constant(x):
+            variable, value = x, y.value
+        elif is_constant(x) and not is_constant(y):
+            variable, value = y, x.value
+        else:
+            return None
+        fall_through = quads[position + 1][0]
+        if op == "=":
+            return variable, value, follow_jump(z), follow_jump(fall_through)
+        return variable, value, follow_jump(fall_through), follow_jump(z)
+
+    arms = {}
+    for position in range(len(quads)):
+        found = arm(position)
+        if found is not None:
+            arms[position] = found
+    successors = set()
+    for position, (variable, value, target, other) in arms.items():
+        next_position = positions.get(other)
+        if next_position in arms and arms[next_position][0] == variable:
+            successors.add(next_position)
+
+    dispatches = {}
+    for head in arms:
+        if head in successors:
+            continue
+        variable = arms[head][0]
+        cases = {}
+        visited = set()
+        position = head
+        while position in arms and arms[position][0] == variable and position not in visited:
+            visited.add(position)
+            _, value, target, default = arms[position]
+            cases.setdefault(value, target)
+            position = positions.get(default)
+        if len(cases) >= SWITCH_MIN_CASES:
+            dispatches[head] = (variable, sorted(cases.items()), default)
+    return dispatches
+
+def switch_dispatch_asm(head_index, cases, default):
+    # Dispatches on the value in t0; returns the code and any .data lines it needs
+    low, high = cases[0][0], cases[-1][0]
+    span = high - low + 1
+    if span <= JUMP_TABLE_MAX_SPAN * len(cases):
+        table = dict(cases)
+        labels = ", ".join(f"L{table.get(low + slot, default)}" for slot in range(span))
+        lines = []
+        if low != 0:
+            lines += [f"    li t1, {low}", "    sub t0, t0, t1"]
+        lines += [
+            f"    li t1, {span}",
+            f"    bgeu t0, t1, L{default}",
+            "    slli t0, t0, 2",
+            f"    la t1, _jt{head_index}",
+            "    add t1, t1, t0",
+            "    lw t1, 0(t1)",
+            "    jr t1",
+        ]
+        return lines, [f"_jt{head_index}: .word {labels}"]
+
+    lines = []
+    counter = itertools.count(1)
+
+    def decision_tree(subset):
+        if len(subset) <= 2:
+            for value, target in subset:
+                lines.append(f"    li t1, {value}")
+                lines.append(f"    beq t0, t1, L{target}")
+            lines.append(f"    j L{default}")
+            return
+        middle = len(subset) // 2
+        value, target = subset[middle]
+        lower = f"L{head_index}_bs{next(counter)}"
+        lines.append(f"    li t1, {value}")
+        lines.append(f"    beq t0, t1, L{target}")
+        lines.append(f"    blt t0, t1, {lower}")
+        decision_tree(subset[middle + 1:])
+        lines.append(f"{lower}:")
+        decision_tree(subset[:middle])
+
+    decision_tree(cases)
+    return lines, []
+
+class BlockFrame:
+    # Layout of a block's activation record: its nesting level and its size (the scope's offset
+    # counter), with the quad indices of its first own statement, which follows any nested
+    # subprograms, and of its end_block, which a retv jumps to
+    def __init__(self, name, level, size, body, end, is_main=False):
+        self.name = name
+        self.level = level
+        self.size = size
+        self.body = body
+        self.end = end
+        self.is_main = is_main
+
+    def base(self):
+        # The main program's frame is static and addressed from s0; a subprogram's from sp
+        return "s0" if self.is_main else "sp"
+
+    def outgoing(self):
+        # Distance from sp to the frame of a callee: main calls from the top of the stack
+        return 0 if self.is_main else self.size
+
+def block_frames(quads, symbol_table, main_index=None):
+    # BlockFrame of every begin_block in quads, keyed by its quad index.  Scopes are found through
+    # the enclosing region, so nested subprograms with the same name do not clash.  `main_index`
+    # is the quad index of the main begin_block when quads hold only part of the program.
+    frames = {}
+    scopes = {}
+    for region in subprogram_regions(quads):
+        index = quads[region.begin][0]
+        is_main = region.is_main if main_index is None else index == main_index
+        if is_main:
+            scope = symbol_table.scopes[0]
+        else:
+            outer = scopes[id(region.parent)] if region.parent else symbol_table.scopes[0]
+            entity = outer.entities.get(region.name)
+            scope = entity.scope if isinstance(entity, Subprogram) and entity.scope else \
+                symbol_table.subprograms[region.name].scope
+        scopes[id(region)] = scope
+        end = quads[region.end][0] if region.end is not None else None
+        body = quads[region.start][0] if region.end is not None else None
+        frames[index] = BlockFrame(region.name, scope.level, scope.offset_counter, body, end, is_main)
+    return frames
+
+def operand_offset(operand):
+    # Names that were never resolved (undeclared identifiers) fall back to offset 0
+    entity = getattr(operand, "entity", None)
+    return entity.offset if entity is not None else 0
+
+def operand_level(operand):
+    entity = getattr(operand, "entity", None)
+    return entity.level if entity is not None else None
+
+def asm_sequence(label, instructions):
+    first = f"{label} {instructions[0]}" if label else f"    {instructions[0]}"
+    return [first] + [f"    {instruction}" for instruction in instructions[1:]]
+
+def frame_address(operand, frame):
+    # (instructions, base register, offset) of the operand's slot.  Globals live in the static
+    # main frame at s0 and locals at the current frame's base; a variable of an enclosing
+    # subprogram is one load away, through the display entry of its level (gp + 4 * level).
+    level = operand_level(operand)
+    if level is None or level == frame.level:
+        return [], frame.base(), operand_offset(operand)
+    if level == 0:
+        return [], "s0", operand_offset(operand)
+    return [f"lw t3, {4 * level}(gp)"], "t3", operand_offset(operand)
+
+def memory_operand_asm(operand, frame):
+    # (instructions, memory operand) that address the operand's value; an inout parameter holds
+    # the address of the caller's variable
+    setup, base, offset = frame_address(operand, frame)
+    entity = getattr(operand, "entity", None)
+    if isinstance(entity, Parameter) and entity.mode == "inout":
+        return setup + [f"lw t3, -{offset}({base})"], "0(t3)"
+    return setup, f"-{offset}({base})"
+
+def address_asm(reg, operand, frame):
+    setup, base, offset = frame_address(operand, frame)
+    entity = getattr(operand, "entity", None)
+    if isinstance(entity, Parameter) and entity.mode == "inout":
+        return setup + [f"lw {reg}, -{offset}({base})"]
+    return setup + [f"addi {reg}, {base}, -{offset}"]
+
+def load_operand_asm(reg, operand, frame, label=""):
+    if is_constant(operand):
+        return asm_sequence(label, [f"li {reg}, {operand.value}"])
+    setup, address = memory_operand_asm(operand, frame)
+    return asm_sequence(label, setup + [f"lw {reg}, {address}"])
+
+def store_operand_asm(reg, operand, frame, label=""):
+    setup, address = memory_operand_asm(operand, frame)
+    return asm_sequence(label, setup + [f"sw {reg}, {address}"])
+
+def arithmetic_asm(op, x, y, label, frame):
+    # Leaves the result in t2; constant factors and divisors are strength-reduced
+    if op == "*" and is_constant(x) and not is_constant(y):
+        x, y = y, x
+    if op in ("*", "/") and is_constant(y) and not is_constant(x):
+        reduced = constant_multiply_asm(y.value) if op == "*" else constant_divide_asm(y.value)
+        if reduced is not None:
+            return load_operand_asm("t0", x, frame, label) + reduced
+    op_map = {
+        "+": "add",
+        "-": "sub",
+        "*": "mul",
+        "/": "div"
+    }
+    lines = load_operand_asm("t0", x, frame, label) + load_operand_asm("t1", y, frame)
+    lines.append(f"    {op_map[op]} t2, t0, t1")
+    return lines
+
+def quad_chunks(quads):
+    # Code generation units: each begin_block starts a new chunk
+    starts = [position for position, quad in enumerate(quads) if quad[1] == "begin_block" and position > 0]
+    bounds = [0] + starts + [len(quads)]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+def generate_chunk_asm(chunk):
+    # Translates one chunk of quads; positions in dispatches and main_position are chunk-relative.
+    # `blocks` are the frames open at the start of the chunk and `frames` those it begins.
+    quads, dispatches, main_position, blocks, frames = chunk
+    blocks = list(blocks)
+    asm_lines = []
+    data_lines = []
+    arguments = 0                  # par cv/ref quads since the last call
+
+    for position, quad in enumerate(quads):
+        index, op, x, y, z = quad
+        label = f"L{index}:"
+        if op == "begin_block":
+            blocks.append(frames[index])
+        frame = blocks[-1]
+        if op != "par":
+            arguments = 0
+
+        if position in dispatches:
+            variable, cases, default = dispatches[position]
+            code, data = switch_dispatch_asm(index, cases, default)
+            asm_lines += load_operand_asm("t0", variable, frame, label)
+            asm_lines += code
+            data_lines += data
+            continue
+
+        if op == "begin_block":
+            if position == main_position:
+                asm_lines.append(f"Lmain: # begin_block {x}")
+            else:
+                # Saves the return address and the display entry of this level, which then
+                # points at the new frame
+                asm_lines.append(f"{x}: # begin_block {x}")
+                asm_lines.append("    sw ra, 0(sp)")
+                asm_lines.append(f"    lw t0, {4 * frame.level}(gp)")
+                asm_lines.append("    sw t0, -4(sp)")
+                asm_lines.append(f"    sw sp, {4 * frame.level}(gp)")
+                if frame.body != index + 1:
+                    asm_lines.append(f"    j L{frame.body}")   # Over the nested subprograms
+            continue
+
+        if op in {"+", "-", "*", "/"}:
+            asm_lines += arithmetic_asm(op, x, y, label, frame)
+            asm_lines += store_operand_asm("t2", z, frame)
+
+        elif op == ":=":
+            if is_constant(x):
+                asm_lines.append(f"{label} li t0, {x.value}")
+            else:
+                asm_lines += load_operand_asm("t0", x, frame, label)
+            asm_lines += store_operand_asm("t0", z, frame)
+
+        elif op in ["=", "<>", "<", "<=", ">", ">="]:
+            asm_lines += load_operand_asm("t0", x, frame, label)
+            asm_lines += load_operand_asm("t1", y, frame)
+            branch = {
+                "=": f"beq t0, t1, L{z}",
+                "<>": f"bne t0, t1, L{z}",
+                "<": f"blt t0, t1, L{z}",
+                "<=": f"ble t0, t1, L{z}",
+                ">": f"bgt t0, t1, L{z}",
+                ">=": f"bge t0, t1, L{z}",
+            }
+            asm_lines.append(f"    {branch[op]}")
+
+        elif op == "jump":
+            asm_lines.append(f"{label} j L{z}")
+
+        elif op == "par":
+            # Arguments go straight into the callee's frame, below the caller's own
+            if y == "cv":
+                asm_lines += load_operand_asm("t0", x, frame, label)
+            else:
+                asm_lines += asm_sequence(label, address_asm("t0", x, frame))
+            if y == "ret":
+                asm_lines.append(f"    sw t0, -{frame.outgoing() + 8}(sp)  # par ret")
+            else:
+                asm_lines.append(f"    sw t0, -{frame.outgoing() + FRAME_HEADER + 4 * arguments}(sp)  # par {y}")
+                arguments += 1
+
+        elif op == "call":
+            if frame.outgoing():
+                asm_lines.append(f"{label} addi sp, sp, -{frame.outgoing()}")
+                asm_lines.append(f"    jal {x}")
+                asm_lines.append(f"    addi sp, sp, {frame.outgoing()}")
+            else:
+                asm_lines.append(f"{label} jal {x}")
+
+        elif op == "in":
+            asm_lines.append(f"{label} call read_int")
+            asm_lines += store_operand_asm("a0", x, frame)
+
+        elif op == "out":
+            asm_lines += load_operand_asm("a0", x, frame, label)
+            asm_lines.append("    call print_int")
+
+        elif op == "retv":
+            if frame.is_main:
+                # Returning from the main program ends it, like in the interpreter
+                asm_lines.append(f"{label} j exit_program")
+                continue
+            # The caller's `par ret` left the address of the result in the frame header
+            asm_lines += load_operand_asm("t0", x, frame, label)
+            asm_lines.append("    lw t1, -8(sp)")
+            asm_lines.append("    sw t0, 0(t1)")
+            asm_lines.append(f"    j L{frame.end}")
+
+        elif op == "end_block":
+            blocks.pop()
+            if frame.is_main:
+                asm_lines.append(f"{label} ret")
+                continue
+            asm_lines.append(f"{label} lw t0, -4(sp)")
+            asm_lines.append(f"    sw t0, {4 * frame.level}(gp)")
+            asm_lines.append("    lw ra, 0(sp)")
+            asm_lines.append("    ret")
+
+        elif op == "halt":
+            asm_lines.append(f"{label} j exit_program")
+
+        else:
+            asm_lines.append(f"# {label} Unhandled op: {op} {x} {y} {z}")
+
+    return asm_lines, data_lines
+
+def asm_chunks(quads, frames, main_position=None, blocks=()):
+    # Code generation units of a run of quads, with their switch dispatches, main label and the
+    # frames of the blocks open at their start (`blocks` are those open before quads[0])
+    dispatches = find_switch_dispatches(quads)
+    blocks = list(blocks)
+    chunks = []
+    for start, end in quad_chunks(quads):
+        chunk_dispatches = {position - start: dispatch for position, dispatch in dispatches.items()
+                            if start <= position < end}
+        chunk_main = main_position - start if main_position is not None and start <= main_position < end else None
+        chunk_frames = {quad[0]: frames[quad[0]] for quad in quads[start:end] if quad[1] == "begin_block"}
+        chunks.append((quads[start:end], chunk_dispatches, chunk_main, tuple(blocks), chunk_frames))
+        for quad in quads[start:end]:
+            if quad[1] == "begin_block":
+                blocks.append(frames[quad[0]])
+            elif quad[1] == "end_block":
+                blocks.pop()
+    return chunks
+
+def call_graph(quads):
+    # Names every block calls from its own code, keyed by block name; calls resolve by name, like
+    # in the interpreter
+    return {region.name: sorted({quads[position][2] for position in region.own_positions()
+                                 if quads[position][1] == "call"})
+            for region in subprogram_regions(quads)}
+
+def stack_depths(graph, sizes):
+    # Bytes of stack a call to each subprogram can use: its frame plus the deepest chain of calls
+    # below it.  None where a chain can reach a subprogram that is still active, i.e. recursion.
+    depths = {}
+    active = set()
+
+    def depth(name):
+        if name in depths:
+            return depths[name]
+        if name in active:
+            return None
+        active.add(name)
+        below = [depth(callee) for callee in graph.get(name, ()) if callee in sizes]
+        active.discard(name)
+        depths[name] = None if None in below else sizes[name] + max(below, default=0)
+        return depths[name]
+
+    for name in sizes:
+        depth(name)
+    return depths
+
+def stack_size(graph, sizes, main):
+    # Bytes to reserve below the static main frame: the deepest chain of calls from the main
+    # program, or RECURSIVE_STACK_SIZE when recursion leaves it unbounded
+    depths = stack_depths(graph, sizes)
+    below = [depths[callee] for callee in graph.get(main, ()) if callee in sizes]
+    if None in below:
+        return RECURSIVE_STACK_SIZE
+    return max(below, default=4)           # A callee's frame starts at the word _stack_top
+
+def program_stack_size(quads, frames):
+    sizes = {frame.name: frame.size for frame in frames.values() if not frame.is_main}
+    main = next((frame.name for frame in frames.values() if frame.is_main), None)
+    return stack_size(call_graph(quads), sizes, main)
+
+def asm_prologue():
+    # sp is the frame of the running subprogram, s0 the static frame of the main program and gp
+    # the display, which holds the frame of the latest activation at each nesting level
+    return ["    la sp, _stack_top", "    la s0, _main_frame", "    la gp, _display", "    j Lmain"]
+
+def asm_epilogue(data_lines, main_size=FRAME_HEADER, levels=1, stack=RECURSIVE_STACK_SIZE, buffered_io=False):
+    # The data section (stack, main frame, display, jump tables) and the runtime routines behind
+    # the program's code.  Frames grow down from their base, so the labels name the top words;
+    # the stack comes first, so an overflow runs off the start of the data segment.
+    asm_lines = []
+    asm_lines.append("")
+    asm_lines.append(".data")
+    asm_lines.append(f"_stack: .space {stack - 4}")
+    asm_lines.append("_stack_top: .word 0")
+    asm_lines.append(f"    .space {main_size - 4}")
+    asm_lines.append("_main_frame: .word 0")
+    asm_lines.append(f"_display: .space {4 * levels}")
+    asm_lines += data_lines
+    asm_lines.append("str_nl: .asciz \"\\n\"")
+    if buffered_io:
+        asm_lines += buffered_io_data()
+    asm_lines.append(".text")
+    asm_lines.append("")
+    asm_lines.append("# Runtime routines")
+    if buffered_io:
+        return asm_lines + buffered_io_runtime()
+    asm_lines.append("read_int:")
+    asm_lines.append("    li a7, 5")
+    asm_lines.append("    ecall")
+    asm_lines.append("    ret")
+    asm_lines.append("")
+    asm_lines.append("print_int:")
+    asm_lines.append("    li a7, 1")
+    asm_lines.append("    ecall")
+    asm_lines.append("    li a0, 10")
+    asm_lines.append("    li a7, 11")
+    asm_lines.append("    ecall")
+    asm_lines.append("    ret")
+    asm_lines.append("")
+    asm_lines.append("exit_program:")
+    asm_lines.append("    li a7, 10")
+    asm_lines.append("    ecall")
+    return asm_lines
+
+def buffered_io_data():
+    return [
+        f"_in_buffer: .space {IO_BUFFER_SIZE}",
+        "_in_state: .word 0, 0",
+        f"_out_buffer: .space {IO_BUFFER_SIZE}",
+        "_out_length: .word 0",
+        f"_digits: .space {IO_DIGITS}",
+    ]
+
+def buffered_io_runtime():
+    # read_int parses decimal text straight out of _in_buffer, which _fill_input refills with one
+    # read (ecall 63) of up to IO_BUFFER_SIZE bytes; print_int formats into _out_buffer, and
+    # _flush hands that to one write (ecall 64) when it is full, before input is read and at
+    # exit.  The scheduler renames t0-t6 inside runs, so values that live across a branch or
+    # call are kept in a- and s-registers: s1 holds the return address, _flush returns through
+    # s4, and while read_int runs a3 and a4 are the next and end addresses of the input bytes.
+    return [
+        "read_int:",
+        "    mv s1, ra",
+        "    la s5, _in_state",
+        "    lw a3, 0(s5)",
+        "    lw a4, 4(s5)",
+        "    li a6, 10",
+        "    li s2, 0",
+        "    li s3, 0",
+        "_read_int_skip:",
+        "    bltu a3, a4, _read_int_first",
+        "    jal _fill_input",
+        "    beq a3, a4, _read_int_eof",
+        "_read_int_first:",
+        "    lbu a0, 0(a3)",
+        "    addi a3, a3, 1",
+        "    li a1, 32",
+        "    ble a0, a1, _read_int_skip",
+        "    li a1, 45",
+        "    bne a0, a1, _read_int_digit",
+        "    li s3, 1",
+        "_read_int_next:",
+        "    bltu a3, a4, _read_int_byte",
+        "    jal _fill_input",
+        "    beq a3, a4, _read_int_done",
+        "_read_int_byte:",
+        "    lbu a0, 0(a3)",
+        "    addi a3, a3, 1",
+        "_read_int_digit:",
+        "    addi a0, a0, -48",
+        "    bgeu a0, a6, _read_int_done",
+        "    mul s2, s2, a6",
+        "    add s2, s2, a0",
+        "    j _read_int_next",
+        "_read_int_done:",
+        "    sw a3, 0(s5)",
+        "    sw a4, 4(s5)",
+        "    mv a0, s2",
+        "    beqz s3, _read_int_return",
+        "    neg a0, a0",
+        "_read_int_return:",
+        "    jr s1",
+        "_read_int_eof:",
+        "    jal s4, _flush",
+        "    li a0, 1",
+        "    li a7, 93",
+        "    ecall",
+        "",
+        "_fill_input:",
+        "    mv a5, ra",
+        "    jal s4, _flush",
+        "    li a0, 0",
+        "    la a1, _in_buffer",
+        f"    li a2, {IO_BUFFER_SIZE}",
+        "    li a7, 63",
+        "    ecall",
+        "    la a3, _in_buffer",
+        "    mv a4, a3",
+        "    blt a0, zero, _fill_input_done",
+        "    add a4, a3, a0",
+        "_fill_input_done:",
+        "    jr a5",
+        "",
+        "print_int:",
+        "    mv s1, ra",
+        "    mv s2, a0",
+        "    la a6, _out_length",
+        "    lw a1, 0(a6)",
+        f"    li a2, {IO_BUFFER_SIZE - IO_DIGITS}",
+        "    blt a1, a2, _print_int_room",
+        "    jal s4, _flush",
+        "_print_int_room:",
+        "    la a6, _out_length",
+        "    lw a1, 0(a6)",
+        "    la s3, _out_buffer",
+        "    add s3, s3, a1",
+        "    bge s2, zero, _print_int_digits",
+        "    li a1, 45",
+        "    sb a1, 0(s3)",
+        "    addi s3, s3, 1",
+        "    neg s2, s2",
+        "_print_int_digits:",
+        "    la s5, _digits",
+        f"    addi s5, s5, {IO_DIGITS}",
+        "    mv a3, s5",
+        "    li a2, 10",
+        "_print_int_divide:",
+        "    remu a1, s2, a2",
+        "    addi a1, a1, 48",
+        "    addi a3, a3, -1",
+        "    sb a1, 0(a3)",
+        "    divu s2, s2, a2",
+        "    bnez s2, _print_int_divide",
+        "_print_int_copy:",
+        "    lbu a1, 0(a3)",
+        "    sb a1, 0(s3)",
+        "    addi a3, a3, 1",
+        "    addi s3, s3, 1",
+        "    blt a3, s5, _print_int_copy",
+        "    li a1, 10",
+        "    sb a1, 0(s3)",
+        "    addi s3, s3, 1",
+        "    la a1, _out_buffer",
+        "    sub s3, s3, a1",
+        "    la a6, _out_length",
+        "    sw s3, 0(a6)",
+        "    jr s1",
+        "",
+        "_flush:",
+        "    la a1, _out_length",
+        "    lw a2, 0(a1)",
+        "    beqz a2, _flush_done",
+        "    sw zero, 0(a1)",
+        "    li a0, 1",
+        "    la a1, _out_buffer",
+        "    li a7, 64",
+        "    ecall",
+        "_flush_done:",
+        "    jr s4",
+        "",
+        "exit_program:",
+        "    jal s4, _flush",
+        "    li a7, 10",
+        "    ecall",
+    ]
+
+def frame_data(frames):
+    # Size of the main frame and number of display entries for the frames of a whole program
+    main_size = next((frame.size for frame in frames.values() if frame.is_main), FRAME_HEADER)
+    return main_size, max((frame.level for frame in frames.values()), default=0) + 1
+
+def link_asm(results, frames, stack, buffered_io=False):
+    # Joins translated chunks, in program order, with the start-up code, data and runtime;
+    # `stack` is the size of the stack in bytes
+    asm_lines = asm_prologue()
+    data_lines = []
+    for chunk_asm, chunk_data in results:
+        asm_lines += chunk_asm
+        data_lines += chunk_data
+    return asm_lines + asm_epilogue(data_lines, *frame_data(frames), stack, buffered_io)
+
+def generate_asm(intermediate, symbol_table, name_without_ext, jobs=1, latency=None, buffered_io=False):
+    # `latency` is a LatencyModel to schedule the instructions for, or None to keep their order;
+    # `buffered_io` links the runtime that reads and writes in blocks of IO_BUFFER_SIZE bytes
+    quads = intermediate.quads
+    # The main program is the last top-level block, whatever its name
+    main_position = next((region.begin for region in subprogram_regions(quads) if region.is_main), None)
+    frames = block_frames(quads, symbol_table)
+    chunks = asm_chunks(quads, frames, main_position)
+
+    # Chunks are independent, so they can be translated in parallel; map keeps their order
+    if jobs > 1 and len(chunks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            results = list(pool.map(generate_chunk_asm, chunks,
+                                    chunksize=max(1, len(chunks) // (4 * jobs))))
+    else:
+        results = [generate_chunk_asm(chunk) for chunk in chunks]
+    asm_lines = link_asm(results, frames, program_stack_size(quads, frames), buffered_io)
+    return schedule_asm(asm_lines, latency) if latency is not None else asm_lines
+
+def write_asm_file(intermediate, symbol_table, input_path, jobs=1, latency=None, buffered_io=False):
+    name_without_ext = os.path.splitext(os.path.basename(input_path))[0]
+    write_asm_lines(generate_asm(intermediate, symbol_table, name_without_ext, jobs, latency, buffered_io), input_path)
+
+def write_asm_lines(asm_lines, input_path):
+    output_path = output_path_for(input_path, "asm", ".asm")
+    with open(output_path, "w", encoding="utf-8") as f:
+        for line in asm_lines:
+            f.write(line + "\n")
+
+    print(f"RISC-V Assembly code written to {output_path}")
+
+
+
+
+
+
+
+###################################### STREAMING CODE GENERATION #########################################
+# For programs too large to keep every quad in memory.  A quad can be written out once no jump
+# before it still waits for backpatching, i.e. when it lies outside every open if, while,
+# switchcase, forcase and incase.  The generator holds back at most a window of quads while
+# nothing is pending, then hands them to a sink that appends them to the .int file and their
+# assembly to the .asm file.  Memory is bounded by the largest open control structure (plus the
+# window), not by the length of the program; the symbol table and the token list still grow with it.
+STREAM_WINDOW = 4096       # Quads collected before a flush when no jump is pending
+
+class StreamingIntermediateCodeGenerator(IntermediateCodeGenerator):
+    def __init__(self, sink, window=STREAM_WINDOW):
+        super().__init__()
+        self.sink = sink
+        self.window = window
+        self.first_index = 1       # Index of self.quads[0]
+        self.pending = set()       # Jumps whose target is still "_"
+        self.peak = 0              # Most quads held at once
+
+    def genquad(self, op, x, y, z):
+        index = super().genquad(op, x, y, z)
+        if op in JUMP_OPS and z == "_":
+            self.pending.add(index)
+        self.peak = max(self.peak, len(self.quads))
+        self.flush()
+        return index
+
+    def backpatch(self, lst, z):
+        # Quads are numbered consecutively from first_index, so no search is needed
+        for index in lst:
+            position = index - self.first_index
+            if position < 0:
+                raise ValueError(f"Quad {index} was already written out")
+            quad = self.quads[position]
+            self.quads[position] = (quad[0], quad[1], quad[2], quad[3], z)
+            self.pending.discard(index)
+        self.flush()
+
+    def flush(self, force=False):
+        # The par quads of a call stay with it: arguments are numbered from the first one
+        if self.quads and (force or (not self.pending and len(self.quads) >= self.window
+                                     and self.quads[-1][1] != "par")):
+            self.sink.write(self.quads, self.main_block)
+            self.first_index += len(self.quads)
+            self.quads = []
+
+    def close(self):
+        if self.pending:
+            raise ValueError(f"Jumps left without a target: {sorted(self.pending)}")
+        self.flush(force=True)
+        self.sink.close()
+
+class QuadStreamWriter:
+    # Appends flushed quads to an .int stream and their assembly to an .asm stream; only the jump
+    # tables are kept until close(), which writes the data section and the runtime routines.
+    # A subprogram's call sites need its frame size, so its quads are held until its scope is
+    # closed; the main program's frame is static and its code is written as it comes.  The call
+    # graph and frame sizes are kept to size the stack.
+    def __init__(self, int_file, asm_file, symbol_table=None):
+        self.int_file = int_file
+        self.asm_file = asm_file
+        self.symbol_table = symbol_table    # The parser's, set before parsing starts
+        self.data_lines = []
+        self.held = []                      # Quads of top-level subprograms not translated yet
+        self.main_frame = None
+        self.levels = 1
+        self.graph = {}
+        self.sizes = {}
+        self.main_calls = set()
+        self.write_lines(asm_prologue())
+
+    def write_lines(self, lines):
+        self.asm_file.write("".join(line + "\n" for line in lines))
+
+    def write_chunks(self, quads, frames, main_position=None, blocks=()):
+        for chunk in asm_chunks(quads, frames, main_position, blocks):
+            asm_lines, data_lines = generate_chunk_asm(chunk)
+            self.write_lines(asm_lines)
+            self.data_lines += data_lines
+        self.levels = max([self.levels] + [frame.level + 1 for frame in frames.values()])
+
+    def write_subprograms(self):
+        # Translates the held quads up to the last top-level subprogram whose scope is closed
+        global_scope = self.symbol_table.scopes[0]
+        depth = 0
+        done = 0
+        for position, quad in enumerate(self.held):
+            if quad[1] == "begin_block":
+                depth += 1
+                if depth == 1:
+                    name = quad[2]
+            elif quad[1] == "end_block":
+                depth -= 1
+                if depth == 0 and global_scope.entities[name].scope is not None:
+                    done = position + 1
+        if done:
+            quads, self.held = self.held[:done], self.held[done:]
+            frames = block_frames(quads, self.symbol_table, main_index=0)
+            self.graph.update(call_graph(quads))
+            self.sizes.update((frame.name, frame.size) for frame in frames.values())
+            self.write_chunks(quads, frames)
+
+    def write(self, quads, main_block):
+        self.int_file.write(format_quads(quads))
+        main_position = main_block - quads[0][0] if main_block is not None else len(quads)
+        self.held += quads[:max(main_position, 0)]
+        self.write_subprograms()
+        if main_position >= len(quads):
+            return
+        main = quads[max(main_position, 0):]
+        self.main_calls.update(quad[2] for quad in main if quad[1] == "call")
+        if main_position >= 0:
+            self.main_frame = BlockFrame(main[0][2], 0, FRAME_HEADER, None, None, is_main=True)
+            self.write_chunks(main, {main[0][0]: self.main_frame}, 0)
+        else:
+            self.write_chunks(main, {}, None, [self.main_frame])
+
+    def close(self):
+        main = self.main_frame.name if self.main_frame else None
+        stack = stack_size({**self.graph, main: sorted(self.main_calls)}, self.sizes, main)
+        self.write_lines(asm_epilogue(self.data_lines, self.symbol_table.scopes[0].offset_counter,
+                                      self.levels, stack))
+
+def compile_streaming(input_path, window=STREAM_WINDOW):
+    int_path = output_path_for(input_path, "int", ".int")
+    asm_path = output_path_for(input_path, "asm", ".asm")
+    tokens = LexerFSM(input_path).tokenize()
+    with open(int_path, "w", encoding="utf-8") as int_file, open(asm_path, "w", encoding="utf-8") as asm_file:
+        writer = QuadStreamWriter(int_file, asm_file)
+        intermediate = StreamingIntermediateCodeGenerator(writer, window)
+        parser = Parser(tokens, intermediate)
+        writer.symbol_table = parser.symbol_table
+        parser.program()
+        intermediate.close()
+    print(f"Intermediate code written to {int_path}")
+    print(f"RISC-V Assembly code written to {asm_path}")
+    print(f"{intermediate.next_quad_index - 1} quads, at most {intermediate.peak} held in memory")
+    return intermediate
+
+###################################### RISC-V SIMULATOR #########################################
+# Executes the assembly produced by generate_asm, so generated code can be measured without an
+# external toolchain.  Text is addressed by instruction (4 bytes each from TEXT_BASE) and the
+# .data section is laid out from DATA_BASE.  Pseudo-instructions retire as many instructions as
+# their standard expansion (`li` of a large constant, `la` and `call` take two).
+TEXT_BASE = 0x00400000
+DATA_BASE = 0x10010000
+SIMULATOR_MEMORY = 1 << 20
+SIMULATOR_MAX_STEPS = 10_000_000
+REGISTER_NAMES = ["zero", "ra", "sp", "gp", "tp", "t0", "t1", "t2", "s0", "s1", "a0", "a1", "a2",
+                  "a3", "a4", "a5", "a6", "a7", "s2", "s3", "s4", "s5", "s6", "s7", "s8", "s9",
+                  "s10", "s11", "t3", "t4", "t5", "t6"]
+REGISTERS = {name: number for number, name in enumerate(REGISTER_NAMES)}
+REGISTERS.update({f"x{number}": number for number in range(32)})
+REGISTERS["fp"] = 8
+
+LOAD_MNEMONICS = {"lw", "lh", "lhu", "lb", "lbu"}
+STORE_MNEMONICS = {"sw", "sh", "sb"}
+BRANCH_MNEMONICS = {"beq", "bne", "blt", "bge", "bltu", "bgeu", "ble", "bgt", "bleu", "bgtu", "beqz", "bnez"}
+REGISTER_OPS = {"add", "sub", "mul", "mulh", "mulhu", "mulhsu", "div", "divu", "rem", "remu",
+                "and", "or", "xor", "sll", "srl", "sra", "slt", "sltu"}
+IMMEDIATE_OPS = {"addi", "andi", "ori", "xori", "slli", "srli", "srai", "slti", "sltiu"}
+
+class SimulatorError(Exception):
+    pass
+
+class AsmInstruction:
+    def __init__(self, mnemonic, operands, line_number, labels):
+        self.mnemonic = mnemonic
+        self.operands = operands
+        self.line_number = line_number
+        self.labels = labels
+
+def unwrap_int32(value):
+    return value & 0xffffffff
+
+def strip_asm_comment(line):
+    in_string = False
+    for position, char in enumerate(line):
+        if char == '"' and (position == 0 or line[position - 1] != "\\"):
+            in_string = not in_string
+        elif char == "#" and not in_string:
+            return line[:position]
+    return line
+
+def split_asm_operands(text):
+    return [operand.strip() for operand in text.split(",")] if text.strip() else []
+
+def parse_asm_sections(asm_lines):
+    # Returns (instructions, text labels -> instruction number, data labels -> address, data
+    # bytes, .word fixups as (data position, label)); the fixups are left for the caller
+    instructions = []
+    text_labels = {}
+    data_labels = {}
+    data = bytearray()
+    word_fixups = []           # (data position, label) for .word entries naming labels
+    section = "text"
+    pending = []
+    for line_number, line in enumerate(asm_lines, start=1):
+        line = strip_asm_comment(line).strip()
+        while True:
+            match = re.match(r"([A-Za-z_.$][\w.$]*):\s*", line)
+            if not match:
+                break
+            pending.append(match.group(1))
+            line = line[match.end():]
+        if not line:
+            continue
+        mnemonic, _, rest = line.partition(" ")
+        if mnemonic in (".data", ".text"):
+            section = mnemonic[1:]
+            continue
+        if mnemonic in (".globl", ".global", ".section"):
+            continue
+        if section == "data":
+            if mnemonic == ".align":
+                while len(data) % (1 << int(rest)):
+                    data.append(0)
+            for label in pending:
+                data_labels[label] = DATA_BASE + len(data)
+            pending = []
+            if mnemonic == ".word":
+                for value in split_asm_operands(rest):
+                    if re.fullmatch(r"-?\d+|-?0x[0-9a-fA-F]+", value):
+                        data += struct.pack("<I", unwrap_int32(int(value, 0)))
+                    else:
+                        word_fixups.append((len(data), value))
+                        data += bytes(4)
+            elif mnemonic == ".space":
+                data += bytes(int(rest, 0))
+            elif mnemonic in (".asciz", ".ascii", ".string"):
+                text = rest.strip()[1:-1].encode("utf-8").decode("unicode_escape").encode("latin-1")
+                data += text + (b"" if mnemonic == ".ascii" else b"\0")
+            elif mnemonic != ".align":
+                raise SimulatorError(f"Line {line_number}: unsupported directive '{mnemonic}'")
+            continue
+        for label in pending:
+            text_labels[label] = len(instructions)
+        instructions.append(AsmInstruction(mnemonic, split_asm_operands(rest), line_number, pending))
+        pending = []
+    for label in pending:
+        text_labels[label] = len(instructions)
+    return instructions, text_labels, data_labels, data, word_fixups
+
+def parse_asm(asm_lines):
+    # Text addresses count one word per instruction, as the simulator executes them
+    instructions, text_labels, data_labels, data, word_fixups = parse_asm_sections(asm_lines)
+    for position, label in word_fixups:
+        if label in text_labels:
+            address = TEXT_BASE + 4 * text_labels[label]
+        elif label in data_labels:
+            address = data_labels[label]
+        else:
+            raise SimulatorError(f"Undefined label '{label}' in .word")
+        struct.pack_into("<I", data, position, address)
+    return instructions, text_labels, data_labels, data
+
+class Simulator:
+    def __init__(self, asm_lines, inputs=(), max_steps=SIMULATOR_MAX_STEPS):
+        self.instructions, self.text_labels, self.data_labels, data = parse_asm(asm_lines)
+        if len(data) > SIMULATOR_MEMORY:
+            raise SimulatorError("Data section does not fit in simulator memory")
+        self.memory = bytearray(SIMULATOR_MEMORY)
+        self.memory[:len(data)] = data
+        self.registers = [0] * 32
+        self.registers[REGISTERS["sp"]] = DATA_BASE + SIMULATOR_MEMORY
+        self.inputs = iter(inputs)
+        self.input_bytes = b""       # Text of input values not yet taken by read (ecall 63)
+        self.max_steps = max_steps
+        self.output = []
+        self.exit_code = None
+        self.ecalls = 0
+        self.executed = [0] * len(self.instructions)
+        self.taken_branches = 0
+        self.program = [self.decode(instruction, number) for number, instruction in enumerate(self.instructions)]
+
+    # Decoding resolves registers, immediates and labels once per instruction
+    def register(self, name, instruction):
+        if name not in REGISTERS:
+            raise SimulatorError(f"Line {instruction.line_number}: unknown register '{name}'")
+        return REGISTERS[name]
+
+    def immediate(self, text, instruction):
+        try:
+            return int(text, 0)
+        except ValueError:
+            raise SimulatorError(f"Line {instruction.line_number}: bad immediate '{text}'") from None
+
+    def target(self, label, instruction):
+        if label not in self.text_labels:
+            raise SimulatorError(f"Line {instruction.line_number}: undefined label '{label}'")
+        return self.text_labels[label]
+
+    def address(self, label, instruction):
+        if label in self.data_labels:
+            return self.data_labels[label]
+        return TEXT_BASE + 4 * self.target(label, instruction)
+
+    def memory_operand(self, text, instruction):
+        match = re.fullmatch(r"(-?\w*)\((\w+)\)", text.replace(" ", ""))
+        if not match:
+            raise SimulatorError(f"Line {instruction.line_number}: bad memory operand '{text}'")
+        return self.immediate(match.group(1) or "0", instruction), self.register(match.group(2), instruction)
+
+    def decode(self, instruction, number=0):
+        m, ops = instruction.mnemonic, instruction.operands
+        reg = lambda position: self.register(ops[position], instruction)
+        imm = lambda position: self.immediate(ops[position], instruction)
+        try:
+            if m in REGISTER_OPS:
+                return m, reg(0), reg(1), reg(2)
+            if m in IMMEDIATE_OPS:
+                return m, reg(0), reg(1), imm(2)
+            if m in LOAD_MNEMONICS or m in STORE_MNEMONICS:
+                offset, base = self.memory_operand(ops[1], instruction)
+                return m, reg(0), base, offset
+            if m in ("beqz", "bnez"):
+                return m, reg(0), 0, self.target(ops[1], instruction)
+            if m in BRANCH_MNEMONICS:
+                return m, reg(0), reg(1), self.target(ops[2], instruction)
+            if m == "li":
+                return m, reg(0), imm(1), None
+            if m == "la":
+                return m, reg(0), self.address(ops[1], instruction), None
+            if m in ("mv", "neg", "not", "seqz", "snez"):
+                return m, reg(0), reg(1), None
+            if m == "lui":
+                return "li", reg(0), wrap_int32(imm(1) << 12), None
+            if m == "auipc":
+                return "li", reg(0), wrap_int32(TEXT_BASE + 4 * number + (imm(1) << 12)), None
+            if m == "j":
+                return "jal", 0, self.target(ops[0], instruction), None
+            if m in ("call", "jal") and len(ops) == 1:
+                return "jal", REGISTERS["ra"], self.target(ops[0], instruction), None
+            if m == "jal":
+                return "jal", reg(0), self.target(ops[1], instruction), None
+            if m == "jr":
+                return "jalr", 0, reg(0), 0
+            if m == "ret":
+                return "jalr", 0, REGISTERS["ra"], 0
+            if m == "jalr" and len(ops) == 1:
+                return "jalr", REGISTERS["ra"], reg(0), 0
+            if m == "jalr":
+                return "jalr", reg(0), reg(1), imm(2) if len(ops) > 2 else 0
+            if m in ("ecall", "nop"):
+                return m, None, None, None
+        except IndexError:
+            raise SimulatorError(f"Line {instruction.line_number}: missing operand for '{m}'") from None
+        raise SimulatorError(f"Line {instruction.line_number}: unsupported instruction '{m}'")
+
+    def retired_length(self, number):
+        m, a, b, c = self.program[number]
+        mnemonic = self.instructions[number].mnemonic
+        if mnemonic == "li":
+            return 1 if -2048 <= b < 2048 else 2
+        return 2 if mnemonic in ("la", "call") else 1
+
+    def load(self, address, size, signed=True):
+        offset = address - DATA_BASE
+        if offset < 0 or offset + size > SIMULATOR_MEMORY:
+            raise SimulatorError(f"Load from unmapped address {address:#x}")
+        return int.from_bytes(self.memory[offset:offset + size], "little", signed=signed)
+
+    def store(self, address, size, value):
+        offset = address - DATA_BASE
+        if offset < 0 or offset + size > SIMULATOR_MEMORY:
+            raise SimulatorError(f"Store to unmapped address {address:#x}")
+        self.memory[offset:offset + size] = (value & ((1 << (8 * size)) - 1)).to_bytes(size, "little")
+
+    def read_string(self, address):
+        end = self.memory.index(0, address - DATA_BASE)
+        return self.memory[address - DATA_BASE:end].decode("latin-1")
+
+    def read_input(self, size):
+        # The input values as text, one per line, as a terminal or pipe would deliver them
+        while len(self.input_bytes) < size:
+            value = next(self.inputs, None)
+            if value is None:
+                break
+            self.input_bytes += f"{value}\n".encode("ascii")
+        data, self.input_bytes = self.input_bytes[:size], self.input_bytes[size:]
+        return data
+
+    def ecall(self):
+        regs = self.registers
+        service, a0 = regs[REGISTERS["a7"]], regs[REGISTERS["a0"]]
+        self.ecalls += 1
+        if service == 63 and a0 == 0:
+            data = self.read_input(regs[REGISTERS["a2"]])
+            offset = unwrap_int32(regs[REGISTERS["a1"]]) - DATA_BASE
+            if offset < 0 or offset + len(data) > SIMULATOR_MEMORY:
+                raise SimulatorError(f"read into unmapped address {offset + DATA_BASE:#x}")
+            self.memory[offset:offset + len(data)] = data
+            regs[REGISTERS["a0"]] = len(data)
+        elif service == 64 and a0 == 1:
+            size = regs[REGISTERS["a2"]]
+            offset = unwrap_int32(regs[REGISTERS["a1"]]) - DATA_BASE
+            if offset < 0 or offset + size > SIMULATOR_MEMORY:
+                raise SimulatorError(f"write from unmapped address {offset + DATA_BASE:#x}")
+            self.output.append(self.memory[offset:offset + size].decode("latin-1"))
+            regs[REGISTERS["a0"]] = size
+        elif service == 1:
+            self.output.append(str(a0))
+        elif service == 4:
+            self.output.append(self.read_string(unwrap_int32(a0)))
+        elif service == 11:
+            self.output.append(chr(a0 & 0xff))
+        elif service == 5:
+            try:
+                regs[REGISTERS["a0"]] = wrap_int32(int(next(self.inputs)))
+            except StopIteration:
+                raise SimulatorError("read_int: no more input") from None
+        elif service == 10:
+            self.exit_code = 0
+        elif service in (17, 93):
+            self.exit_code = a0
+        else:
+            raise SimulatorError(f"Unsupported ecall service {service}")
+
+    def jump_register(self, address):
+        if address % 4 or not 0 <= (address - TEXT_BASE) // 4 < len(self.program):
+            raise SimulatorError(f"Jump to address {address:#x} outside the program")
+        return (address - TEXT_BASE) // 4
+
+    def run(self):
+        regs, program, executed = self.registers, self.program, self.executed
+        pc = self.text_labels.get("_start", 0)
+        steps = 0
+        while self.exit_code is None:
+            if not 0 <= pc < len(program):
+                raise SimulatorError("Execution ran past the end of the program")
+            steps += 1
+            if steps > self.max_steps:
+                raise SimulatorError(f"Step limit of {self.max_steps} exceeded")
+            executed[pc] += 1
+            m, a, b, c = program[pc]
+            pc += 1
+            if m in REGISTER_OPS:
+                x, y = regs[b], regs[c]
+                if m == "add":
+                    value = x + y
+                elif m == "sub":
+                    value = x - y
+                elif m == "mul":
+                    value = x * y
+                elif m == "mulh":
+                    value = (x * y) >> 32
+                elif m == "mulhu":
+                    value = (unwrap_int32(x) * unwrap_int32(y)) >> 32
+                elif m == "mulhsu":
+                    value = (x * unwrap_int32(y)) >> 32
+                elif m == "div":
+                    value = -1 if y == 0 else cimple_divide(x, y)
+                elif m == "divu":
+                    value = -1 if y == 0 else unwrap_int32(x) // unwrap_int32(y)
+                elif m == "rem":
+                    value = x if y == 0 else x - cimple_divide(x, y) * y
+                elif m == "remu":
+                    value = x if y == 0 else unwrap_int32(x) % unwrap_int32(y)
+                elif m == "and":
+                    value = x & y
+                elif m == "or":
+                    value = x | y
+                elif m == "xor":
+                    value = x ^ y
+                elif m == "sll":
+                    value = x << (y & 31)
+                elif m == "srl":
+                    value = unwrap_int32(x) >> (y & 31)
+                elif m == "sra":
+                    value = x >> (y & 31)
+                elif m == "slt":
+                    value = int(x < y)
+                else:
+                    value = int(unwrap_int32(x) < unwrap_int32(y))
+                if a:
+                    regs[a] = wrap_int32(value)
+            elif m in IMMEDIATE_OPS:
+                x = regs[b]
+                if m == "addi":
+                    value = x + c
+                elif m == "andi":
+                    value = x & c
+                elif m == "ori":
+                    value = x | c
+                elif m == "xori":
+                    value = x ^ c
+                elif m == "slli":
+                    value = x << c
+                elif m == "srli":
+                    value = unwrap_int32(x) >> c
+                elif m == "srai":
+                    value = x >> c
+                elif m == "slti":
+                    value = int(x < c)
+                else:
+                    value = int(unwrap_int32(x) < unwrap_int32(c))
+                if a:
+                    regs[a] = wrap_int32(value)
+            elif m in BRANCH_MNEMONICS:
+                x, y = regs[a], regs[b]
+                if m == "beq" or m == "beqz":
+                    taken = x == y
+                elif m == "bne" or m == "bnez":
+                    taken = x != y
+                elif m == "blt":
+                    taken = x < y
+                elif m == "bge":
+                    taken = x >= y
+                elif m == "ble":
+                    taken = x <= y
+                elif m == "bgt":
+                    taken = x > y
+                elif m == "bltu":
+                    taken = unwrap_int32(x) < unwrap_int32(y)
+                elif m == "bgeu":
+                    taken = unwrap_int32(x) >= unwrap_int32(y)
+                elif m == "bleu":
+                    taken = unwrap_int32(x) <= unwrap_int32(y)
+                else:
+                    taken = unwrap_int32(x) > unwrap_int32(y)
+                if taken:
+                    self.taken_branches += 1
+                    pc = c
+            elif m in LOAD_MNEMONICS:
+                address = unwrap_int32(regs[b] + c)
+                size = 4 if m == "lw" else 2 if m in ("lh", "lhu") else 1
+                value = self.load(address, size, m in ("lw", "lh", "lb"))
+                if a:
+                    regs[a] = value
+            elif m in STORE_MNEMONICS:
+                address = unwrap_int32(regs[b] + c)
+                self.store(address, 4 if m == "sw" else 2 if m == "sh" else 1, regs[a])
+            elif m == "li" or m == "la":
+                if a:
+                    regs[a] = wrap_int32(b)
+            elif m == "mv":
+                if a:
+                    regs[a] = regs[b]
+            elif m == "neg":
+                if a:
+                    regs[a] = wrap_int32(-regs[b])
+            elif m == "not":
+                if a:
+                    regs[a] = ~regs[b]
+            elif m == "seqz":
+                if a:
+                    regs[a] = int(regs[b] == 0)
+            elif m == "snez":
+                if a:
+                    regs[a] = int(regs[b] != 0)
+            elif m == "jal":
+                if a:
+                    regs[a] = TEXT_BASE + 4 * pc
+                pc = b
+            elif m == "jalr":
+                target = self.jump_register(unwrap_int32(regs[b] + c))
+                if a:
+                    regs[a] = TEXT_BASE + 4 * pc
+                pc = target
+            elif m == "ecall":
+                self.ecall()
+        return self
+
+    @property
+    def retired(self):
+        return sum(count * self.retired_length(number) for number, count in enumerate(self.executed))
+
+    def count_executed(self, mnemonics):
+        return sum(count for number, count in enumerate(self.executed)
+                   if self.instructions[number].mnemonic in mnemonics)
+
+    def label_counts(self):
+        counts = {}
+        for number, instruction in enumerate(self.instructions):
+            for label in instruction.labels:
+                counts[label] = self.executed[number]
+        return counts
+
+    def stats(self):
+        return {
+            "retired": self.retired,
+            "loads": self.count_executed(LOAD_MNEMONICS),
+            "stores": self.count_executed(STORE_MNEMONICS),
+            "branches": self.count_executed(BRANCH_MNEMONICS),
+            "taken_branches": self.taken_branches,
+            "ecalls": self.ecalls,
+            "labels": self.label_counts(),
+        }
+
+def simulate_asm(asm_lines, inputs=(), max_steps=SIMULATOR_MAX_STEPS):
+    return Simulator(asm_lines, inputs, max_steps).run()
+
+BENCHMARK_INPUTS = [7, 3, 5, 2, 9, 4, 6, 8, 1, 0]
+BENCHMARK_MAX_STEPS = 1_000_000
+
+def benchmark_program(path, optimize_code=False, inputs=BENCHMARK_INPUTS, max_steps=BENCHMARK_MAX_STEPS):
+    with open(path, "r", encoding="utf-8") as f:
+        compiled = compile_source(f.read(), os.path.basename(path), optimize_code)
+    row = {"program": os.path.basename(path), "optimized": optimize_code}
+    if not compiled["ok"]:
+        row["status"] = "compile error: " + "; ".join(compiled["diagnostics"])
+        return row
+    try:
+        simulator = simulate_asm(compiled["asm"].splitlines(), itertools.cycle(inputs), max_steps)
+    except SimulatorError as error:
+        row["status"] = f"runtime error: {error}"
+        return row
+    row["status"] = "ok"
+    row["output"] = "".join(simulator.output)
+    row.update(simulator.stats())
+    del row["labels"]
+    return row
+
+def benchmark_corpus(directory, inputs=BENCHMARK_INPUTS, max_steps=BENCHMARK_MAX_STEPS):
+    # Every .ci program of the corpus, compiled with and without -O
+    rows = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".ci"):
+            for optimize_code in (False, True):
+                rows.append(benchmark_program(os.path.join(directory, name), optimize_code,
+                                              inputs, max_steps))
+    return rows
+
+IO_ECALL_CYCLES = 1000     # Rough cost of a system call (trap, kernel entry and return) in cycles
+
+# Echoes its input: a count, then that many values
+IO_BENCHMARK_SOURCE = """program echoNumbers
+declare n, x;
+{
+input(n);
+while (n > 0)
+{
+input(x);
+print(x);
+n := n - 1
+}
+}.
+"""
+
+def io_benchmark_values(count):
+    # Values of every length and sign, the same on every run
+    return ((number * 7919) % 2000003 - 1000001 for number in range(count))
+
+def benchmark_io(count, max_steps=None):
+    # Simulates IO_BENCHMARK_SOURCE on `count` values with the ecall-per-value runtime and with
+    # the buffered one.  The estimate charges IO_ECALL_CYCLES per system call and one cycle per
+    # instruction, since a system call costs far more than the instructions that avoid it.
+    with contextlib.redirect_stdout(io.StringIO()):
+        intermediate = IntermediateCodeGenerator()
+        parser = Parser(LexerFSM("echoNumbers.ci").tokenize(IO_BENCHMARK_SOURCE), intermediate)
+        parser.program()
+    expected = "".join(f"{value}\n" for value in io_benchmark_values(count))
+    max_steps = max_steps or 400 * (count + 1000)
+    rows = []
+    for buffered_io in (False, True):
+        asm_lines = generate_asm(intermediate, parser.symbol_table, "echoNumbers", buffered_io=buffered_io)
+        started = time.perf_counter()
+        simulator = simulate_asm(asm_lines, itertools.chain([count], io_benchmark_values(count)), max_steps)
+        seconds = time.perf_counter() - started
+        rows.append({"runtime": "buffered" if buffered_io else "ecall", "values": count,
+                     "ok": "".join(simulator.output) == expected, "ecalls": simulator.ecalls,
+                     "retired": simulator.retired,
+                     "retired_per_value": round(simulator.retired / max(1, count), 1),
+                     "estimated_cycles": simulator.retired + IO_ECALL_CYCLES * simulator.ecalls,
+                     "simulator_seconds": round(seconds, 2)})
+    return rows
+
+###################################### INSTRUCTION SCHEDULING #########################################
+# Reorders the generated assembly for an in-order, single-issue pipeline.  The unit of scheduling
+# is a run of consecutive instruction lines; a run ends after a control transfer (branch, jump,
+# call, ecall) or a change of sp, and before a label that some instruction or jump table refers to.
+# Unreferenced `L{index}` labels move with their instruction.  Generated code never carries a
+# value in a scratch register (t0-t6) into or out of a run, so the values inside a run are first
+# given fresh scratch registers, which removes the false dependences of reusing t0, t1 and t2.
+SCRATCH_REGISTERS = ["t0", "t1", "t2", "t3", "t4", "t5", "t6"]
+CONTROL_MNEMONICS = BRANCH_MNEMONICS | {"j", "jal", "jalr", "jr", "call", "ret", "ecall"}
+UNARY_MNEMONICS = {"mv", "neg", "not", "seqz", "snez"}
+
+class LatencyModel:
+    # Cycles from an instruction's issue until its result can be used; everything else takes one
+    def __init__(self, load=2, mul=3, div=20):
+        self.load = load
+        self.mul = mul
+        self.div = div
+
+    @classmethod
+    def parse(cls, spec):
+        # "load=3,mul=4,div=34"; names that are left out keep their default
+        values = {}
+        for item in spec.split(","):
+            name, _, value = (part.strip() for part in item.partition("="))
+            if name not in ("load", "mul", "div") or not value.isdigit() or int(value) < 1:
+                raise ValueError(f"bad latency '{item.strip()}'")
+            values[name] = int(value)
+        return cls(**values)
+
+    def latency(self, mnemonic):
+        if mnemonic in LOAD_MNEMONICS:
+            return self.load
+        if mnemonic in ("mul", "mulh", "mulhu", "mulhsu"):
+            return self.mul
+        if mnemonic in ("div", "divu", "rem", "remu"):
+            return self.div
+        return 1
+
+class ScheduledInstruction:
+    # What one instruction of a run writes and reads; `memory` is None or ("load" | "store", slot),
+    # where slot is the sp offset of a stack access and None for any other address
+    def __init__(self, mnemonic, operands, defs, uses, memory):
+        self.mnemonic = mnemonic
+        self.operands = operands
+        self.defs = defs
+        self.uses = uses
+        self.memory = memory
+
+    def issue_slots(self):
+        # Pseudo-instructions issue as their expansion
+        if self.mnemonic == "li":
+            return li_length(li_value(self.operands[1]))
+        return 2 if self.mnemonic in ("la", "call") else 1
+
+def stack_slot(operand):
+    # Frames (sp, s0) and the display (gp) never overlap; other bases may point anywhere
+    match = re.fullmatch(r"(-?\w*)\((\w+)\)", operand.replace(" ", ""))
+    return (match.group(2), int(match.group(1) or "0", 0)) if match.group(2) in ("sp", "s0", "gp") else None
+
+def memory_base(operand):
+    return re.fullmatch(r"(-?\w*)\((\w+)\)", operand.replace(" ", "")).group(2)
+
+def analyze_instruction(instruction):
+    # None for anything the scheduler does not understand; such an instruction stays in place
+    m, ops = instruction.mnemonic, instruction.operands
+    try:
+        if m in REGISTER_OPS:
+            defs, uses, memory = {ops[0]}, {ops[1], ops[2]}, None
+        elif m in IMMEDIATE_OPS or m in UNARY_MNEMONICS:
+            defs, uses, memory = {ops[0]}, {ops[1]}, None
+        elif m in LOAD_MNEMONICS:
+            defs, uses, memory = {ops[0]}, {memory_base(ops[1])}, ("load", stack_slot(ops[1]))
+        elif m in STORE_MNEMONICS:
+            defs, uses, memory = set(), {ops[0], memory_base(ops[1])}, ("store", stack_slot(ops[1]))
+        elif m in ("li", "la", "lui", "auipc"):
+            defs, uses, memory = {ops[0]}, set(), None
+        elif m in ("beqz", "bnez"):
+            defs, uses, memory = set(), {ops[0]}, None
+        elif m in BRANCH_MNEMONICS:
+            defs, uses, memory = set(), {ops[0], ops[1]}, None
+        elif m in ("jr", "jalr"):
+            defs, uses, memory = set() if m == "jr" else {"ra"}, {ops[0] if len(ops) < 3 else ops[1]}, None
+        elif m in ("j", "jal", "call", "ret"):
+            defs, uses, memory = {"ra"}, set(), None
+        elif m == "ecall":
+            defs, uses, memory = {"a0"}, {"a0", "a7"}, None
+        else:
+            return None
+    except (IndexError, AttributeError):
+        return None
+    return ScheduledInstruction(m, ops, defs - {"zero", "x0"}, uses - {"zero", "x0"}, memory)
+
+def asm_runs(asm_lines):
+    # (text instructions as parsed for the simulator, their analysis, runs of instruction numbers,
+    # labels something refers to)
+    instructions, text_labels, data_labels, data, word_fixups = parse_asm_sections(asm_lines)
+    referenced = {label for _, label in word_fixups}
+    referenced.update(operand for instruction in instructions for operand in instruction.operands)
+    analyzed = [analyze_instruction(instruction) for instruction in instructions]
+    runs, run = [], []
+    for number, instruction in enumerate(instructions):
+        analysis = analyzed[number]
+        if run and (instruction.line_number != instructions[run[-1]].line_number + 1
+                    or analysis is None or referenced.intersection(instruction.labels)):
+            runs.append(run)
+            run = []
+        run.append(number)
+        if analysis is None or analysis.mnemonic in CONTROL_MNEMONICS or "sp" in analysis.defs:
+            runs.append(run)
+            run = []
+    if run:
+        runs.append(run)
+    return instructions, analyzed, runs, referenced
+
+def rename_scratch_registers(run):
+    # Gives every scratch value of the run its own register where that is possible.  A value read
+    # before the run writes its register and the last value written to each register keep their
+    # register, so nothing changes for code outside the run.  Returns one (defs map, uses map) per
+    # instruction.
+    values = []                # [register, first position, last position, fixed]
+    current = {}
+    maps = []
+    for position, instruction in enumerate(run):
+        uses = {}
+        for register in instruction.uses & set(SCRATCH_REGISTERS):
+            if register not in current:
+                current[register] = [register, -1, position, True]
+                values.append(current[register])
+            current[register][2] = position
+            uses[register] = current[register]
+        defs = {}
+        for register in instruction.defs & set(SCRATCH_REGISTERS):
+            current[register] = [register, position, position, False]
+            values.append(current[register])
+            defs[register] = current[register]
+        maps.append((defs, uses))
+    for value in current.values():
+        value[2] = len(run)
+        value[3] = True
+    taken = {register: [] for register in SCRATCH_REGISTERS}
+    for value in values:
+        if value[3]:
+            taken[value[0]].append((value[1], value[2]))
+    for value in values:
+        if value[3]:
+            continue
+        start, end = value[1], value[2]
+        free = [register for register in SCRATCH_REGISTERS
+                if all(end <= other_start or other_end <= start for other_start, other_end in taken[register])]
+        # The register that was released longest ago leaves the scheduler the most freedom
+        value[0] = min(free, key=lambda register: max((other_end for other_start, other_end in taken[register]
+                                                        if other_end <= start), default=-2))
+        taken[value[0]].append((start, end))
+    return [({register: value[0] for register, value in defs.items()},
+             {register: value[0] for register, value in uses.items()}) for defs, uses in maps]
+
+def run_dependences(run, model):
+    # {predecessor: minimum issue distance} per instruction; true dependences wait for the
+    # producer's latency, the rest only keep their order
+    preds = [{} for _ in run]
+    last_writer, readers = {}, {}
+    accesses = []
+    for position, instruction in enumerate(run):
+        edges = preds[position]
+        def depend(other, distance):
+            edges[other] = max(edges.get(other, 0), distance)
+        for register in instruction.uses:
+            if register in last_writer:
+                depend(last_writer[register], model.latency(run[last_writer[register]].mnemonic))
+        for register in instruction.defs:
+            if register in last_writer:
+                depend(last_writer[register], 1)
+            for reader in readers.get(register, []):
+                if reader != position:
+                    depend(reader, 1)
+        if instruction.memory is not None:
+            kind, slot = instruction.memory
+            for other in accesses:
+                other_kind, other_slot = run[other].memory
+                if "store" in (kind, other_kind) and (slot is None or other_slot is None or slot == other_slot):
+                    depend(other, 1)
+            accesses.append(position)
+        if instruction.mnemonic in CONTROL_MNEMONICS:
+            for other in range(position):
+                depend(other, 1)
+        for register in instruction.defs:
+            last_writer[register] = position
+            readers[register] = []
+        for register in instruction.uses - instruction.defs:
+            readers.setdefault(register, []).append(position)
+    return preds
+
+def issue_costs(run, preds, order):
+    # Cycles each instruction adds when the run is issued in `order`, stalls included, with every
+    # register ready at the start of the run
+    issued = {}
+    costs = [0] * len(run)
+    cycle = 0
+    for position in order:
+        start = max([cycle] + [issued[other] + distance for other, distance in preds[position].items()])
+        issued[position] = start
+        costs[position] = start + run[position].issue_slots() - cycle
+        cycle += costs[position]
+    return costs
+
+def list_schedule(run, preds):
+    # Critical-path list scheduling: each cycle issues the ready instruction with the longest
+    # latency-weighted path to the end of the run, the earliest one on ties
+    succs = [[] for _ in run]
+    for position, edges in enumerate(preds):
+        for other, distance in edges.items():
+            succs[other].append((position, distance))
+    height = [0] * len(run)
+    for position in reversed(range(len(run))):
+        height[position] = max([run[position].issue_slots()] + [distance + height[other] for other, distance in succs[position]])
+    waiting = [len(edges) for edges in preds]
+    earliest = [0] * len(run)
+    ready = [position for position in range(len(run)) if not waiting[position]]
+    order = []
+    cycle = 0
+    while ready:
+        available = [position for position in ready if earliest[position] <= cycle]
+        if not available:
+            cycle = min(earliest[position] for position in ready)
+            continue
+        chosen = max(available, key=lambda position: (height[position], -position))
+        ready.remove(chosen)
+        order.append(chosen)
+        for other, distance in succs[chosen]:
+            earliest[other] = max(earliest[other], cycle + distance)
+            waiting[other] -= 1
+            if not waiting[other]:
+                ready.append(other)
+        cycle += run[chosen].issue_slots()
+    return order
+
+def rewrite_asm_line(line, instruction, defs, uses):
+    # Replaces the renamed registers in the operands; labels and the comment are kept
+    code = strip_asm_comment(line).rstrip()
+    prefix = re.match(r"\s*(?:[A-Za-z_.$][\w.$]*:\s*)*", code).group(0)
+    writes = bool(instruction.defs) and instruction.mnemonic not in CONTROL_MNEMONICS
+    operands = []
+    for position, operand in enumerate(instruction.operands):
+        mapping = defs if position == 0 and writes else uses
+        operands.append(re.sub(r"\bt[0-6]\b", lambda match: mapping.get(match.group(0), match.group(0)), operand))
+    return f"{prefix}{instruction.mnemonic} {', '.join(operands)}{line[len(code):]}"
+
+def schedule_asm(asm_lines, model):
+    # Every run is renamed and list-scheduled; a run keeps its original form unless that saves
+    # cycles under `model`
+    asm_lines = list(asm_lines)
+    instructions, analyzed, runs, referenced = asm_runs(asm_lines)
+    for numbers in runs:
+        run = [analyzed[number] for number in numbers]
+        if len(run) < 3:
+            continue
+        before = sum(issue_costs(run, run_dependences(run, model), range(len(run))))
+        maps = rename_scratch_registers(run)
+        renamed = [ScheduledInstruction(instruction.mnemonic, instruction.operands,
+                                        {defs.get(register, register) for register in instruction.defs},
+                                        {uses.get(register, register) for register in instruction.uses},
+                                        instruction.memory)
+                   for instruction, (defs, uses) in zip(run, maps)]
+        preds = run_dependences(renamed, model)
+        if referenced.intersection(instructions[numbers[0]].labels):
+            # A jump target has to stay the first instruction of its run
+            for edges in preds[1:]:
+                edges.setdefault(0, 1)
+        order = list_schedule(renamed, preds)
+        if sum(issue_costs(renamed, preds, order)) >= before:
+            continue
+        lines = [rewrite_asm_line(asm_lines[instructions[number].line_number - 1], instruction, defs, uses)
+                 if any(old != new for old, new in list(defs.items()) + list(uses.items()))
+                 else asm_lines[instructions[number].line_number - 1]
+                 for number, instruction, (defs, uses) in zip(numbers, run, maps)]
+        first = instructions[numbers[0]].line_number - 1
+        asm_lines[first:first + len(lines)] = [lines[position] for position in order]
+    return asm_lines
+
+def estimate_cycles(asm_lines, model, counts=None):
+    # Static estimate of the cycles an in-order pipeline needs: every run once, or `counts[n]`
+    # times for instruction n (a simulator's `executed`) to estimate a whole execution
+    instructions, analyzed, runs, referenced = asm_runs(asm_lines)
+    total = 0
+    for numbers in runs:
+        if analyzed[numbers[0]] is None:
+            costs = [1]
+        else:
+            run = [analyzed[number] for number in numbers]
+            costs = issue_costs(run, run_dependences(run, model), range(len(run)))
+        total += sum(cost * (counts[number] if counts is not None else 1) for number, cost in zip(numbers, costs))
+    return total
+
+def schedule_report(intermediate, symbol_table, model):
+    # Estimated cycles of every block's code, each run counted once, before and after scheduling
+    quads = intermediate.quads
+    main_position = next((region.begin for region in subprogram_regions(quads) if region.is_main), None)
+    rows = []
+    for chunk in asm_chunks(quads, block_frames(quads, symbol_table), main_position):
+        asm_lines, data_lines = generate_chunk_asm(chunk)
+        rows.append({"block": chunk[0][0][2],
+                     "before": estimate_cycles(asm_lines, model),
+                     "after": estimate_cycles(schedule_asm(asm_lines, model), model)})
+    return {"latency": vars(model), "blocks": rows,
+            "before": sum(row["before"] for row in rows), "after": sum(row["after"] for row in rows)}
+
+###################################### COST REPORT #########################################
+# Static cost of every block for deployment on small targets: the instructions generated for its
+# own code, its frame, the subprograms it calls, the stack a call to it can use (the same figure
+# that sizes `_stack`) and, for every loop, the instructions and estimated cycles of one
+# iteration.  Called subprograms are not included in a loop's cycles; its `calls` lists them.
+def asm_by_quad(asm_lines, first_index):
+    # A chunk's assembly split at its `L{index}:` labels; the lines before the first label belong
+    # to the chunk's first quad, its begin_block
+    owned = {}
+    index = first_index
+    for line in asm_lines:
+        match = re.match(r"L(\d+):", line)
+        if match:
+            index = int(match.group(1))
+        owned.setdefault(index, []).append(line)
+    return owned
+
+def instruction_count(asm_lines):
+    return len(parse_asm_sections(asm_lines)[0])
+
+def cost_report(intermediate, symbol_table, model=None):
+    model = model or LatencyModel()
+    quads = intermediate.quads
+    frames = block_frames(quads, symbol_table)
+    main_position = next((region.begin for region in subprogram_regions(quads) if region.is_main), None)
+    owned = {}
+    for chunk in asm_chunks(quads, frames, main_position):
+        owned.update(asm_by_quad(generate_chunk_asm(chunk)[0], chunk[0][0][0]))
+
+    def lines(positions):
+        return [line for position in positions for line in owned.get(quads[position][0], [])]
+
+    graph = call_graph(quads)
+    sizes = {frame.name: frame.size for frame in frames.values() if not frame.is_main}
+    depths = stack_depths(graph, sizes)
+    blocks = []
+    for region in subprogram_regions(quads):
+        frame = frames[quads[region.begin][0]]
+        below = [depths[callee] for callee in graph[region.name] if callee in sizes]
+        if frame.is_main:
+            max_stack = None if None in below else max(below, default=0)
+        else:
+            max_stack = depths[region.name]
+        loops = []
+        for head, tail in loop_ranges(quads, region):
+            body = lines(range(head, tail + 1))
+            loops.append({"header": quads[head][0],
+                          "quads": tail - head + 1,
+                          "instructions": instruction_count(body),
+                          "cycles": estimate_cycles(body, model),
+                          "calls": sorted({quads[p][2] for p in range(head, tail + 1) if quads[p][1] == "call"})})
+        blocks.append({"block": region.name,
+                       "level": frame.level,
+                       "main": frame.is_main,
+                       "instructions": instruction_count(lines([region.begin, *region.own_positions(), region.end])),
+                       "frame_size": frame.size,
+                       "calls": graph[region.name],
+                       "max_stack": max_stack,
+                       "unbounded": max_stack is None,
+                       "loops": loops})
+    return {"latency": vars(model),
+            "stack_size": program_stack_size(quads, frames),
+            "unbounded": [block["block"] for block in blocks if block["unbounded"]],
+            "blocks": blocks}
+
+def write_cost_report(intermediate, symbol_table, input_path, model=None):
+    output_path = output_path_for(input_path, "asm", ".cost.json")
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(cost_report(intermediate, symbol_table, model), f, indent=2)
+    print(f"Cost report written to {output_path}")
+    return output_path
+
+###################################### MACHINE CODE AND ELF #########################################
+# Encodes the generated assembly as RV32IM machine code and wraps it in a static ELF executable,
+# so no external assembler or linker is needed.  Text starts at TEXT_BASE and data at DATA_BASE,
+# like in the simulator; the runtime routines and `_stack` come from link_asm as usual.  Pseudo-
+# instructions get their standard expansion (`la` and `call` use auipc, a large `li` lui+addi).
+ELF_PAGE = 0x1000
+ELF_MACHINE_RISCV = 243
+ELF_HEADER = struct.Struct("<16sHHIIIIIHHHHHH")
+ELF_PROGRAM_HEADER = struct.Struct("<IIIIIIII")
+ELF_SECTION_HEADER = struct.Struct("<IIIIIIIIII")
+ELF_SYMBOL = struct.Struct("<IIIBBH")
+
+R_TYPE = {"add": (0x00, 0), "sub": (0x20, 0), "sll": (0x00, 1), "slt": (0x00, 2), "sltu": (0x00, 3),
+          "xor": (0x00, 4), "srl": (0x00, 5), "sra": (0x20, 5), "or": (0x00, 6), "and": (0x00, 7),
+          "mul": (0x01, 0), "mulh": (0x01, 1), "mulhsu": (0x01, 2), "mulhu": (0x01, 3),
+          "div": (0x01, 4), "divu": (0x01, 5), "rem": (0x01, 6), "remu": (0x01, 7)}
+I_TYPE = {"addi": 0, "slti": 2, "sltiu": 3, "xori": 4, "ori": 6, "andi": 7}
+SHIFT_IMMEDIATE = {"slli": (0x00, 1), "srli": (0x00, 5), "srai": (0x20, 5)}
+LOAD_FUNCT3 = {"lb": 0, "lh": 1, "lw": 2, "lbu": 4, "lhu": 5}
+STORE_FUNCT3 = {"sb": 0, "sh": 1, "sw": 2}
+BRANCH_FUNCT3 = {"beq": 0, "bne": 1, "blt": 4, "bge": 5, "bltu": 6, "bgeu": 7}
+SWAPPED_BRANCHES = {"ble": "bge", "bgt": "blt", "bleu": "bgeu", "bgtu": "bltu"}
+INVERTED_BRANCHES = {"beq": "bne", "bne": "beq", "blt": "bge", "bge": "blt", "bltu": "bgeu", "bgeu": "bltu"}
+
+class AssemblerError(Exception):
+    pass
+
+def fits_signed(value, bits):
+    return -(1 << (bits - 1)) <= value < (1 << (bits - 1))
+
+def sign_extend(value, bits):
+    value &= (1 << bits) - 1
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+def split_immediate(value):
+    # hi << 12 plus the sign-extended lo gives value (lui/auipc followed by addi, jalr, ...)
+    hi = (value + 0x800) >> 12
+    return hi & 0xfffff, value - (hi << 12)
+
+def encode_r(funct7, rs2, rs1, funct3, rd, opcode=0x33):
+    return funct7 << 25 | rs2 << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | opcode
+
+def encode_i(imm, rs1, funct3, rd, opcode):
+    return (imm & 0xfff) << 20 | rs1 << 15 | funct3 << 12 | rd << 7 | opcode
+
+def encode_s(imm, rs2, rs1, funct3):
+    return (imm >> 5 & 0x7f) << 25 | rs2 << 20 | rs1 << 15 | funct3 << 12 | (imm & 0x1f) << 7 | 0x23
+
+def encode_b(offset, rs2, rs1, funct3):
+    return ((offset >> 12 & 1) << 31 | (offset >> 5 & 0x3f) << 25 | rs2 << 20 | rs1 << 15 | funct3 << 12
+            | (offset >> 1 & 0xf) << 8 | (offset >> 11 & 1) << 7 | 0x63)
+
+def encode_u(imm20, rd, opcode):
+    return (imm20 & 0xfffff) << 12 | rd << 7 | opcode
+
+def encode_j(offset, rd):
+    return ((offset >> 20 & 1) << 31 | (offset >> 1 & 0x3ff) << 21 | (offset >> 11 & 1) << 20
+            | (offset >> 12 & 0xff) << 12 | rd << 7 | 0x6f)
+
+def li_value(text):
+    # li accepts anything that fits in 32 bits, signed or not
+    return wrap_int32(int(text, 0))
+
+def li_length(value):
+    return 1 if fits_signed(value, 12) or value & 0xfff == 0 else 2
+
+class RV32Assembler:
+    # Two passes over the parsed program.  The first fixes every instruction's size and address;
+    # a branch whose target is out of reach becomes an inverted branch over a `jal`, which can
+    # move other targets, so it repeats until nothing grows.  The second encodes the words.
+    def __init__(self, asm_lines):
+        (self.instructions, self.text_labels, self.data_labels, data,
+         word_fixups) = parse_asm_sections(asm_lines)
+        self.long_branches = set()
+        self.addresses = self.layout()
+        self.data = bytearray(data)
+        for position, label in word_fixups:
+            struct.pack_into("<I", self.data, position, self.label_address(label))
+
+    def error(self, instruction, message):
+        return AssemblerError(f"Line {instruction.line_number}: {message}")
+
+    def register(self, instruction, position):
+        try:
+            return REGISTERS[instruction.operands[position]]
+        except KeyError:
+            raise self.error(instruction, f"unknown register '{instruction.operands[position]}'") from None
+
+    def immediate(self, instruction, position, bits=12):
+        try:
+            value = int(instruction.operands[position], 0)
+        except ValueError:
+            raise self.error(instruction, f"bad immediate '{instruction.operands[position]}'") from None
+        if not fits_signed(value, bits):
+            raise self.error(instruction, f"immediate {value} does not fit in {bits} bits")
+        return value
+
+    def memory_operand(self, instruction, position):
+        match = re.fullmatch(r"(-?\w*)\((\w+)\)", instruction.operands[position].replace(" ", ""))
+        if not match or match.group(2) not in REGISTERS:
+            raise self.error(instruction, f"bad memory operand '{instruction.operands[position]}'")
+        offset = int(match.group(1) or "0", 0)
+        if not fits_signed(offset, 12):
+            raise self.error(instruction, f"offset {offset} does not fit in 12 bits")
+        return offset, REGISTERS[match.group(2)]
+
+    def label_address(self, label, instruction=None):
+        if label in self.text_labels:
+            return self.addresses[self.text_labels[label]]
+        if label in self.data_labels:
+            return self.data_labels[label]
+        if instruction is None:
+            raise AssemblerError(f"Undefined label '{label}' in .word")
+        raise self.error(instruction, f"undefined label '{label}'")
+
+    def branch(self, instruction):
+        # (base mnemonic, rs1, rs2, target label) with the operand-swapping pseudo-branches resolved
+        m, ops = instruction.mnemonic, instruction.operands
+        if m in ("beqz", "bnez"):
+            return ("beq" if m == "beqz" else "bne"), self.register(instruction, 0), 0, ops[1]
+        if m in SWAPPED_BRANCHES:
+            return SWAPPED_BRANCHES[m], self.register(instruction, 1), self.register(instruction, 0), ops[2]
+        return m, self.register(instruction, 0), self.register(instruction, 1), ops[2]
+
+    def length(self, number):
+        instruction = self.instructions[number]
+        m = instruction.mnemonic
+        if m == "li":
+            return li_length(li_value(instruction.operands[1]))
+        if m in ("la", "call"):
+            return 2
+        return 2 if number in self.long_branches else 1
+
+    def layout(self):
+        while True:
+            addresses = [TEXT_BASE]
+            for number in range(len(self.instructions)):
+                addresses.append(addresses[-1] + 4 * self.length(number))
+            self.addresses = addresses
+            grown = False
+            for number, instruction in enumerate(self.instructions):
+                if instruction.mnemonic in BRANCH_MNEMONICS and number not in self.long_branches:
+                    target = self.label_address(self.branch(instruction)[3], instruction)
+                    if not fits_signed(target - addresses[number], 13):
+                        self.long_branches.add(number)
+                        grown = True
+            if not grown:
+                return addresses
+
+    def encode(self, number):
+        instruction = self.instructions[number]
+        m, ops = instruction.mnemonic, instruction.operands
+        address = self.addresses[number]
+        reg = lambda position: self.register(instruction, position)
+        imm = lambda position: self.immediate(instruction, position)
+
+        def relative(label, bits):
+            offset = self.label_address(label, instruction) - address
+            if not fits_signed(offset, bits):
+                raise self.error(instruction, f"'{label}' is out of reach")
+            return offset
+
+        try:
+            if m in R_TYPE:
+                funct7, funct3 = R_TYPE[m]
+                return [encode_r(funct7, reg(2), reg(1), funct3, reg(0))]
+            if m in I_TYPE:
+                return [encode_i(imm(2), reg(1), I_TYPE[m], reg(0), 0x13)]
+            if m in SHIFT_IMMEDIATE:
+                funct7, funct3 = SHIFT_IMMEDIATE[m]
+                shift = int(ops[2], 0)
+                if not 0 <= shift < 32:
+                    raise self.error(instruction, f"shift amount {shift} out of range")
+                return [encode_i(funct7 << 5 | shift, reg(1), funct3, reg(0), 0x13)]
+            if m in LOAD_MNEMONICS:
+                offset, base = self.memory_operand(instruction, 1)
+                return [encode_i(offset, base, LOAD_FUNCT3[m], reg(0), 0x03)]
+            if m in STORE_MNEMONICS:
+                offset, base = self.memory_operand(instruction, 1)
+                return [encode_s(offset, reg(0), base, STORE_FUNCT3[m])]
+            if m in BRANCH_MNEMONICS:
+                base, rs1, rs2, label = self.branch(instruction)
+                if number in self.long_branches:
+                    return [encode_b(8, rs2, rs1, BRANCH_FUNCT3[INVERTED_BRANCHES[base]]),
+                            encode_j(relative(label, 21) - 4, 0)]
+                return [encode_b(relative(label, 13), rs2, rs1, BRANCH_FUNCT3[base])]
+            if m == "li":
+                value = li_value(ops[1])
+                if fits_signed(value, 12):
+                    return [encode_i(value, 0, 0, reg(0), 0x13)]
+                hi, lo = split_immediate(value)
+                words = [encode_u(hi, reg(0), 0x37)]
+                return words + [encode_i(lo, reg(0), 0, reg(0), 0x13)] if lo else words
+            if m == "la":
+                hi, lo = split_immediate(self.label_address(ops[1], instruction) - address)
+                return [encode_u(hi, reg(0), 0x17), encode_i(lo, reg(0), 0, reg(0), 0x13)]
+            if m == "call":
+                hi, lo = split_immediate(relative(ops[0], 32))
+                return [encode_u(hi, REGISTERS["ra"], 0x17), encode_i(lo, REGISTERS["ra"], 0, REGISTERS["ra"], 0x67)]
+            if m == "lui" or m == "auipc":
+                value = int(ops[1], 0)
+                if not 0 <= value < (1 << 20) and not fits_signed(value, 20):
+                    raise self.error(instruction, f"immediate {value} does not fit in 20 bits")
+                return [encode_u(value, reg(0), 0x37 if m == "lui" else 0x17)]
+            if m == "j":
+                return [encode_j(relative(ops[0], 21), 0)]
+            if m == "jal":
+                rd, label = (REGISTERS["ra"], ops[0]) if len(ops) == 1 else (reg(0), ops[1])
+                return [encode_j(relative(label, 21), rd)]
+            if m == "jr":
+                return [encode_i(0, reg(0), 0, 0, 0x67)]
+            if m == "ret":
+                return [encode_i(0, REGISTERS["ra"], 0, 0, 0x67)]
+            if m == "jalr":
+                if len(ops) == 1:
+                    return [encode_i(0, reg(0), 0, REGISTERS["ra"], 0x67)]
+                if "(" in ops[1]:
+                    offset, base = self.memory_operand(instruction, 1)
+                    return [encode_i(offset, base, 0, reg(0), 0x67)]
+                return [encode_i(imm(2) if len(ops) > 2 else 0, reg(1), 0, reg(0), 0x67)]
+            if m == "mv":
+                return [encode_i(0, reg(1), 0, reg(0), 0x13)]
+            if m == "neg":
+                return [encode_r(0x20, reg(1), 0, 0, reg(0))]
+            if m == "not":
+                return [encode_i(-1, reg(1), 4, reg(0), 0x13)]
+            if m == "seqz":
+                return [encode_i(1, reg(1), 3, reg(0), 0x13)]
+            if m == "snez":
+                return [encode_r(0x00, reg(1), 0, 3, reg(0))]
+            if m == "nop":
+                return [encode_i(0, 0, 0, 0, 0x13)]
+            if m == "ecall":
+                return [0x00000073]
+        except IndexError:
+            raise self.error(instruction, f"missing operand for '{m}'") from None
+        raise self.error(instruction, f"unsupported instruction '{m}'")
+
+    def assemble(self):
+        text = bytearray()
+        for number in range(len(self.instructions)):
+            for word in self.encode(number):
+                text += struct.pack("<I", word)
+        return bytes(text)
+
+    def symbols(self):
+        # (name, address, section number, is function) for every label
+        named = [(label, self.addresses[number], 1, not re.fullmatch(r"L\d+|_jt\d+", label))
+                 for label, number in self.text_labels.items()]
+        named += [(label, address, 2, False) for label, address in self.data_labels.items()]
+        return sorted(named, key=lambda symbol: (symbol[1], symbol[0]))
+
+def encode_elf(text, data, symbols, entry=TEXT_BASE):
+    # ET_EXEC with one read/execute segment for .text and one read/write segment for .data,
+    # plus section headers and a symbol table so binutils can inspect it
+    text_offset = ELF_PAGE
+    data_offset = text_offset + (len(text) + ELF_PAGE - 1) // ELF_PAGE * ELF_PAGE
+    strtab = bytearray(b"\0")
+    symtab = bytearray(ELF_SYMBOL.size)
+    for name, address, section, function in symbols:
+        symtab += ELF_SYMBOL.pack(len(strtab), address, 0, 2 if function else (0 if section == 1 else 1), 0, section)
+        strtab += name.encode("utf-8") + b"\0"
+    first_global = len(symtab) // ELF_SYMBOL.size
+    symtab += ELF_SYMBOL.pack(len(strtab), entry, 0, 1 << 4, 0, 1)
+    strtab += b"_start\0"
+    names = [b"", b".text", b".data", b".symtab", b".strtab", b".shstrtab"]
+    shstrtab = b"\0".join(names) + b"\0"
+    name_offsets = [shstrtab.index(name + b"\0") if name else 0 for name in names]
+    symtab_offset = data_offset + (len(data) + 3) // 4 * 4
+    strtab_offset = symtab_offset + len(symtab)
+    shstrtab_offset = strtab_offset + len(strtab)
+    section_offset = (shstrtab_offset + len(shstrtab) + 3) // 4 * 4
+
+    image = bytearray(section_offset)
+    image[:ELF_HEADER.size] = ELF_HEADER.pack(
+        b"\x7fELF\x01\x01\x01" + bytes(9), 2, ELF_MACHINE_RISCV, 1, entry, ELF_HEADER.size,
+        section_offset, 0, ELF_HEADER.size, ELF_PROGRAM_HEADER.size, 2, ELF_SECTION_HEADER.size,
+        len(names), len(names) - 1)
+    image[ELF_HEADER.size:ELF_HEADER.size + 2 * ELF_PROGRAM_HEADER.size] = (
+        ELF_PROGRAM_HEADER.pack(1, text_offset, TEXT_BASE, TEXT_BASE, len(text), len(text), 5, ELF_PAGE)
+        + ELF_PROGRAM_HEADER.pack(1, data_offset, DATA_BASE, DATA_BASE, len(data), len(data), 6, ELF_PAGE))
+    image[text_offset:text_offset + len(text)] = text
+    image[data_offset:data_offset + len(data)] = data
+    image[symtab_offset:symtab_offset + len(symtab)] = symtab
+    image[strtab_offset:strtab_offset + len(strtab)] = strtab
+    image[shstrtab_offset:shstrtab_offset + len(shstrtab)] = shstrtab
+    sections = [
+        (0, 0, 0, 0, 0, 0, 0, 0, 0, 0),
+        (name_offsets[1], 1, 6, TEXT_BASE, text_offset, len(text), 0, 0, 4, 0),
+        (name_offsets[2], 1, 3, DATA_BASE, data_offset, len(data), 0, 0, 4, 0),
+        (name_offsets[3], 2, 0, 0, symtab_offset, len(symtab), 4, first_global, 4, ELF_SYMBOL.size),
+        (name_offsets[4], 3, 0, 0, strtab_offset, len(strtab), 0, 0, 1, 0),
+        (name_offsets[5], 3, 0, 0, shstrtab_offset, len(shstrtab), 0, 0, 1, 0),
+    ]
+    for fields in sections:
+        image += ELF_SECTION_HEADER.pack(*fields)
+    return bytes(image)
+
+def assemble_elf(asm_lines):
+    assembler = RV32Assembler(asm_lines)
+    return encode_elf(assembler.assemble(), bytes(assembler.data), assembler.symbols())
+
+def write_elf_file(intermediate, symbol_table, input_path, jobs=1, latency=None, buffered_io=False):
+    name_without_ext = os.path.splitext(os.path.basename(input_path))[0]
+    image = assemble_elf(generate_asm(intermediate, symbol_table, name_without_ext, jobs, latency, buffered_io))
+    output_path = output_path_for(input_path, "elf", ".elf")
+    with open(output_path, "wb") as f:
+        f.write(image)
+    print(f"RISC-V ELF executable written to {output_path}")
+    return output_path
+
+def read_elf(image):
+    # Returns (entry, loadable segments as (address, bytes, flags), symbols name -> address)
+    if image[:4] != b"\x7fELF" or image[4] != 1 or image[5] != 1:
+        raise SimulatorError("Not a 32-bit little-endian ELF file")
+    fields = ELF_HEADER.unpack_from(image)
+    machine, entry, phoff, shoff = fields[2], fields[4], fields[5], fields[6]
+    phnum, shnum = fields[10], fields[12]
+    if machine != ELF_MACHINE_RISCV:
+        raise SimulatorError("Not a RISC-V ELF file")
+    segments = []
+    for number in range(phnum):
+        kind, offset, address, _, size, memory_size, flags, _ = ELF_PROGRAM_HEADER.unpack_from(
+            image, phoff + number * ELF_PROGRAM_HEADER.size)
+        if kind == 1:
+            segments.append((address, image[offset:offset + size] + bytes(memory_size - size), flags))
+    headers = [ELF_SECTION_HEADER.unpack_from(image, shoff + number * ELF_SECTION_HEADER.size)
+               for number in range(shnum)]
+    symbols = {}
+    for name, kind, flags, address, offset, size, link, info, align, entry_size in headers:
+        if kind != 2:
+            continue
+        strings = headers[link][4]
+        for position in range(offset + ELF_SYMBOL.size, offset + size, ELF_SYMBOL.size):
+            name_offset, value = ELF_SYMBOL.unpack_from(image, position)[:2]
+            end = image.index(b"\0", strings + name_offset)
+            symbols[image[strings + name_offset:end].decode("utf-8")] = value
+    return entry, segments, symbols
+
+def disassemble_word(word, address, label):
+    # One instruction in the syntax parse_asm reads; `label(address)` names branch targets
+    opcode, rd, funct3 = word & 0x7f, word >> 7 & 31, word >> 12 & 7
+    rs1, rs2, funct7 = word >> 15 & 31, word >> 20 & 31, word >> 25
+    names = REGISTER_NAMES
+    imm_i = sign_extend(word >> 20, 12)
+    if opcode == 0x33:
+        for m, codes in R_TYPE.items():
+            if codes == (funct7, funct3):
+                return f"{m} {names[rd]}, {names[rs1]}, {names[rs2]}"
+    elif opcode == 0x13:
+        for m, (shift_funct7, shift_funct3) in SHIFT_IMMEDIATE.items():
+            if (funct3, funct7) == (shift_funct3, shift_funct7):
+                return f"{m} {names[rd]}, {names[rs1]}, {rs2}"
+        for m, code in I_TYPE.items():
+            if code == funct3:
+                return f"{m} {names[rd]}, {names[rs1]}, {imm_i}"
+    elif opcode == 0x03:
+        for m, code in LOAD_FUNCT3.items():
+            if code == funct3:
+                return f"{m} {names[rd]}, {imm_i}({names[rs1]})"
+    elif opcode == 0x23:
+        imm_s = sign_extend(funct7 << 5 | rd, 12)
+        for m, code in STORE_FUNCT3.items():
+            if code == funct3:
+                return f"{m} {names[rs2]}, {imm_s}({names[rs1]})"
+    elif opcode == 0x63:
+        offset = sign_extend((word >> 31) << 12 | (word >> 7 & 1) << 11 | (word >> 25 & 0x3f) << 5
+                             | (word >> 8 & 0xf) << 1, 13)
+        for m, code in BRANCH_FUNCT3.items():
+            if code == funct3:
+                return f"{m} {names[rs1]}, {names[rs2]}, {label(address + offset)}"
+    elif opcode in (0x37, 0x17):
+        return f"{'lui' if opcode == 0x37 else 'auipc'} {names[rd]}, {word >> 12}"
+    elif opcode == 0x6f:
+        offset = sign_extend((word >> 31) << 20 | (word >> 12 & 0xff) << 12 | (word >> 20 & 1) << 11
+                             | (word >> 21 & 0x3ff) << 1, 21)
+        return f"jal {names[rd]}, {label(address + offset)}"
+    elif opcode == 0x67 and funct3 == 0:
+        return f"jalr {names[rd]}, {names[rs1]}, {imm_i}"
+    elif word == 0x00000073:
+        return "ecall"
+    return f".word {word:#010x}"
+
+def elf_asm_lines(image):
+    # Disassembles an executable written by encode_elf back into assembly for the simulator.
+    # The simulator places text at TEXT_BASE and data at DATA_BASE, so the layout must match.
+    entry, segments, symbols = read_elf(image)
+    text = next((segment for segment in segments if segment[2] & 1), None)
+    if text is None or text[0] != TEXT_BASE:
+        raise SimulatorError(f"The text segment must start at {TEXT_BASE:#x}")
+    labels = {}
+    for name, address in sorted(symbols.items(), key=lambda item: item[1]):
+        labels.setdefault(address, []).append(name)
+
+    def label(address):
+        if address not in labels:
+            labels[address] = [f".L{address:x}"]
+        return labels[address][0]
+
+    body = [disassemble_word(word, TEXT_BASE + 4 * number, label)
+            for number, (word,) in enumerate(struct.iter_unpack("<I", text[1][:len(text[1]) // 4 * 4]))]
+    if "_start" not in symbols:
+        labels.setdefault(entry, []).append("_start")
+    asm_lines = []
+    for number, line in enumerate(body):
+        asm_lines += [f"{name}:" for name in labels.get(TEXT_BASE + 4 * number, [])]
+        asm_lines.append(f"    {line}")
+    for address, data, flags in segments:
+        if flags & 1:
+            continue
+        if address != DATA_BASE:
+            raise SimulatorError(f"The data segment must start at {DATA_BASE:#x}")
+        asm_lines.append(".data")
+        padded = data + bytes(-len(data) % 4)
+        asm_lines += [f".word {word}" for (word,) in struct.iter_unpack("<I", padded)]
+    return asm_lines
+
+def simulate_elf(image, inputs=(), max_steps=SIMULATOR_MAX_STEPS):
+    return Simulator(elf_asm_lines(image), inputs, max_steps).run()
+
+###################################### BINARY INTERMEDIATE CODE #########################################
+# Layout of a .intb file (little-endian):
+#   header     magic, version, section counts and section offsets
+#   strings    (string_count + 1) u32 offsets into the UTF-8 blob that follows
+#   quads      fixed-width records: index, opcode byte, then (kind byte, i32) per operand;
+#              variables and temporaries refer to their symbol record
+#   scopes     one i32 per scope: index of the parent scope, -1 for the global scope
+#   symbols    fixed-width records: kind, mode, offset, name, owning scope, body scope
+BINARY_INT_MAGIC = b"CIMQ"
+BINARY_INT_VERSION = 2
+BINARY_HEADER = struct.Struct("<4sHHIIIIIIIIII")
+BINARY_QUAD = struct.Struct("<IBBiBiBi")
+BINARY_SCOPE = struct.Struct("<i")
+BINARY_SYMBOL = struct.Struct("<BBiIIi")
+OPCODES = ["begin_block", "end_block", "halt", ":=", "+", "-", "*", "/", "=", "<>", "<", ">",
+           "<=", ">=", "jump", "in", "out", "par", "call", "retv"]
+OPCODE_NUMBERS = {op: number for number, op in enumerate(OPCODES)}
+OPERAND_NONE, OPERAND_LABEL, OPERAND_STRING, OPERAND_CONSTANT, OPERAND_NAME, OPERAND_VARIABLE, OPERAND_TEMPORARY = range(7)
+SYMBOL_VARIABLE, SYMBOL_TEMPORARY, SYMBOL_PARAMETER, SYMBOL_FUNCTION, SYMBOL_PROCEDURE = range(5)
+PARAMETER_MODES = ["", "in", "inout"]
+
+class StringTable:
+    def __init__(self):
+        self.strings = []
+        self.numbers = {}
+
+    def intern(self, text):
+        if text not in self.numbers:
+            self.numbers[text] = len(self.strings)
+            self.strings.append(text)
+        return self.numbers[text]
+
+def collect_scopes(symbol_table):
+    # Global scope first, then subprogram scopes in declaration order
+    scopes = []
+
+    def visit(scope):
+        scopes.append(scope)
+        for entity in scope.entities.values():
+            if isinstance(entity, Subprogram) and entity.scope is not None:
+                visit(entity.scope)
+
+    visit(symbol_table.scopes[0])
+    return scopes
+
+def encode_binary_int(intermediate, symbol_table):
+    strings = StringTable()
+    scopes = collect_scopes(symbol_table)
+    scope_numbers = {id(scope): number for number, scope in enumerate(scopes)}
+    scope_records = [BINARY_SCOPE.pack(scope_numbers[id(scope.parent)] if scope.parent else -1)
+                     for scope in scopes]
+    symbol_records = []
+    symbol_numbers = {}
+    for number, scope in enumerate(scopes):
+        for entity in scope.entities.values():
+            mode, offset, body = 0, getattr(entity, "offset", 0), -1
+            if isinstance(entity, Subprogram):
+                kind = SYMBOL_FUNCTION if entity.kind == "function" else SYMBOL_PROCEDURE
+                body = scope_numbers[id(entity.scope)] if entity.scope is not None else -1
+            elif isinstance(entity, Parameter):
+                kind, mode = SYMBOL_PARAMETER, PARAMETER_MODES.index(entity.mode)
+            elif isinstance(entity, TemporaryVariable):
+                kind = SYMBOL_TEMPORARY
+            else:
+                kind = SYMBOL_VARIABLE
+            symbol_numbers[id(entity)] = len(symbol_records)
+            symbol_records.append(BINARY_SYMBOL.pack(kind, mode, offset, strings.intern(entity.name),
+                                                     number, body))
+
+    def operand(value):
+        if value == "_":
+            return OPERAND_NONE, 0
+        if isinstance(value, int):
+            return OPERAND_LABEL, value
+        if isinstance(value, Constant):
+            return OPERAND_CONSTANT, strings.intern(str(value))
+        if isinstance(value, VariableRef) and id(value.entity) in symbol_numbers:
+            kind = OPERAND_TEMPORARY if isinstance(value, Temporary) else OPERAND_VARIABLE
+            return kind, symbol_numbers[id(value.entity)]
+        if isinstance(value, VariableRef):
+            return OPERAND_NAME, strings.intern(str(value))
+        return OPERAND_STRING, strings.intern(value)
+
+    quad_records = []
+    for index, op, x, y, z in intermediate.quads:
+        if op not in OPCODE_NUMBERS:
+            raise ValueError(f"Quad {index}: opcode '{op}' has no binary encoding")
+        fields = [index, OPCODE_NUMBERS[op]]
+        for value in (x, y, z):
+            fields.extend(operand(value))
+        quad_records.append(BINARY_QUAD.pack(*fields))
+
+    blob = bytearray()
+    string_offsets = [0]
+    for text in strings.strings:
+        blob += text.encode("utf-8")
+        string_offsets.append(len(blob))
+    strings_offset = BINARY_HEADER.size
+    blob_offset = strings_offset + 4 * len(string_offsets)
+    quads_offset = blob_offset + len(blob)
+    scopes_offset = quads_offset + BINARY_QUAD.size * len(quad_records)
+    symbols_offset = scopes_offset + BINARY_SCOPE.size * len(scope_records)
+    header = BINARY_HEADER.pack(BINARY_INT_MAGIC, BINARY_INT_VERSION, 0, len(quad_records),
+                                len(strings.strings), len(scope_records), len(symbol_records),
+                                intermediate.temp_count, strings_offset, blob_offset, quads_offset,
+                                scopes_offset, symbols_offset)
+    return b"".join([header, struct.pack(f"<{len(string_offsets)}I", *string_offsets), bytes(blob)]
+                    + quad_records + scope_records + symbol_records)
+
+def write_binary_int_file(intermediate, symbol_table, input_path):
+    output_path = output_path_for(input_path, "int", ".intb")
+    with open(output_path, "wb") as f:
+        f.write(encode_binary_int(intermediate, symbol_table))
+    print(f"Binary intermediate code written to {output_path}")
+
+class BinaryIntReader:
+    # Memory-mapped .intb reader: quads are decoded on access, strings are decoded once
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.quad_count, self.string_count, self.scope_count, self.symbol_count,
+         self.temp_count, self.strings_offset, self.blob_offset, self.quads_offset,
+         self.scopes_offset, self.symbols_offset) = BINARY_HEADER.unpack_from(self.data, 0)
+        if magic != BINARY_INT_MAGIC or version != BINARY_INT_VERSION:
+            self.close()
+            if magic != BINARY_INT_MAGIC:
+                raise ValueError(f"{path} is not a binary intermediate code file")
+            raise ValueError(f"{path}: unsupported binary intermediate code version {version}")
+        self.string_cache = {}
+        self.loaded_symbols = None
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def string(self, number):
+        if number not in self.string_cache:
+            start, end = struct.unpack_from("<II", self.data, self.strings_offset + 4 * number)
+            self.string_cache[number] = self.data[self.blob_offset + start:self.blob_offset + end].decode("utf-8")
+        return self.string_cache[number]
+
+    def operand(self, kind, value):
+        if kind == OPERAND_NONE:
+            return "_"
+        if kind == OPERAND_LABEL:
+            return value
+        if kind == OPERAND_CONSTANT:
+            return Constant(self.string(value))
+        if kind == OPERAND_NAME:
+            return VariableRef(self.string(value))
+        if kind in (OPERAND_VARIABLE, OPERAND_TEMPORARY):
+            entity = self.symbols()[1][value]
+            return (Temporary if kind == OPERAND_TEMPORARY else VariableRef)(entity.name, entity)
+        return self.string(value)
+
+    def __len__(self):
+        return self.quad_count
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.quad_count:
+            raise IndexError(position)
+        index, opcode, xk, x, yk, y, zk, z = BINARY_QUAD.unpack_from(
+            self.data, self.quads_offset + BINARY_QUAD.size * position)
+        return (index, OPCODES[opcode], self.operand(xk, x), self.operand(yk, y), self.operand(zk, z))
+
+    def __iter__(self):
+        for position in range(self.quad_count):
+            yield self[position]
+
+    def intermediate(self):
+        intermediate = IntermediateCodeGenerator()
+        intermediate.quads = list(self)
+        intermediate.next_quad_index = len(intermediate.quads) + 1
+        intermediate.temp_count = self.temp_count
+        return intermediate
+
+    def symbol_table(self):
+        return self.symbols()[0]
+
+    def symbols(self):
+        # Decoded once: the symbol table and the entities in record order
+        if self.loaded_symbols is not None:
+            return self.loaded_symbols
+        scopes = []
+        for number in range(self.scope_count):
+            parent, = BINARY_SCOPE.unpack_from(self.data, self.scopes_offset + BINARY_SCOPE.size * number)
+            scopes.append(Scope(scopes[parent] if parent >= 0 else None))
+        symbol_table = SymbolTable()
+        symbol_table.scopes.append(scopes[0])
+        entities = []
+        for number in range(self.symbol_count):
+            kind, mode, offset, name, owner, body = BINARY_SYMBOL.unpack_from(
+                self.data, self.symbols_offset + BINARY_SYMBOL.size * number)
+            name = self.string(name)
+            if kind in (SYMBOL_FUNCTION, SYMBOL_PROCEDURE):
+                entity = Subprogram(name, "function" if kind == SYMBOL_FUNCTION else "procedure")
+                entity.scope = scopes[body] if body >= 0 else None
+                symbol_table.subprograms[name] = entity
+            elif kind == SYMBOL_PARAMETER:
+                entity = Parameter(name, "int", offset, PARAMETER_MODES[mode])
+            elif kind == SYMBOL_TEMPORARY:
+                entity = TemporaryVariable(name, "int", offset)
+            else:
+                entity = Variable(name, "int", offset)
+            scopes[owner].add_entity(entity)
+            entities.append(entity)
+        for scope in scopes:
+            offsets = [entity.offset for entity in scope.entities.values() if isinstance(entity, Variable)]
+            scope.offset_counter = max(offsets) + 4 if offsets else FRAME_HEADER
+        for subprogram in symbol_table.subprograms.values():
+            if subprogram.scope is not None:
+                subprogram.parameters = [entity for entity in subprogram.scope.entities.values()
+                                         if isinstance(entity, Parameter)]
+        self.loaded_symbols = symbol_table, entities
+        return self.loaded_symbols
+
+BACKENDS = {
+    "asm": write_asm_file,
+    "elf": write_elf_file,
+}
+
+def compile_binary_int(binary_path, backend="asm", jobs=1):
+    # Code generation straight from a stored .intb, without lexing or parsing the source
+    with BinaryIntReader(binary_path) as reader:
+        intermediate = reader.intermediate()
+        symbol_table = reader.symbol_table()
+    BACKENDS[backend](intermediate, symbol_table, binary_path, jobs)
+    return intermediate, symbol_table
+
+###################################### COMPILE SERVER #########################################
+SERVER_CACHE_SIZE = 256
+
+def compile_source(source, name, optimize_code=False):
+    # Runs the whole pipeline on source text; everything the parser prints is returned as "log"
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            tokens = LexerFSM(name).tokenize(source)
+            intermediate = IntermediateCodeGenerator()
+            parser = Parser(tokens, intermediate)
+            parser.program()
+            if optimize_code:
+                optimize(intermediate, parser.symbol_table)
+            asm_lines = generate_asm(intermediate, parser.symbol_table, os.path.splitext(name)[0])
+    except (SyntaxError, ValueError) as error:
+        return {"ok": False, "diagnostics": [str(error)], "log": log.getvalue()}
+    except Exception as error:
+        return {"ok": False, "diagnostics": [f"Internal compiler error: {error!r}"], "log": log.getvalue()}
+    return {
+        "ok": True,
+        "diagnostics": [],
+        "quads": [list(quad) for quad in intermediate.quads],
+        "int": format_int(intermediate),
+        "asm": "".join(line + "\n" for line in asm_lines),
+        "log": log.getvalue(),
+    }
+
+def source_key(source, name, optimize_code):
+    digest = hashlib.sha256()
+    digest.update(f"{name}\0{int(bool(optimize_code))}\0".encode("utf-8"))
+    digest.update(source.encode("utf-8"))
+    return digest.hexdigest()
+
+class CompileServer:
+    # Long-running compiler: newline-delimited JSON requests over a Unix socket are compiled
+    # in a process pool, and results are shared between clients through a content-hash cache.
+    def __init__(self, socket_path, workers=None, cache_size=SERVER_CACHE_SIZE):
+        self.socket_path = socket_path
+        self.workers = workers
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.executor = None
+        self.server = None
+        self.requests = 0
+        self.cache_hits = 0
+
+    async def compile(self, request):
+        source = request["source"]
+        name = request.get("name", "program.ci")
+        if not isinstance(source, str) or not isinstance(name, str):
+            return {"ok": False, "diagnostics": ["Bad request: 'source' and 'name' must be strings"]}
+        optimize_code = bool(request.get("optimize", False))
+        key = source_key(source, name, optimize_code)
+        self.requests += 1
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.cache_hits += 1
+            return dict(self.cache[key], cached=True)
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self.executor, compile_source, source, name, optimize_code)
+        self.cache[key] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return dict(result, cached=False)
+
+    async def handle_request(self, request):
+        command = request.get("command", "compile")
+        if command == "compile":
+            return await self.compile(request)
+        if command == "stats":
+            return {"ok": True, "requests": self.requests, "cache_hits": self.cache_hits,
+                    "cached_entries": len(self.cache)}
+        if command == "shutdown":
+            self.server.close()
+            return {"ok": True}
+        return {"ok": False, "diagnostics": [f"Unknown command '{command}'"]}
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if isinstance(request, dict):
+                        response = await self.handle_request(request)
+                    else:
+                        response = {"ok": False, "diagnostics": ["Bad request: expected a JSON object"]}
+                except (json.JSONDecodeError, KeyError) as error:
+                    response = {"ok": False, "diagnostics": [f"Bad request: {error}"]}
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        if not hasattr(socket, "AF_UNIX"):
+            raise OSError("The compile server needs Unix domain sockets")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self.server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path)
+        try:
+            async with self.server:
+                try:
+                    await self.server.serve_forever()
+                except asyncio.CancelledError:
+                    pass
+        finally:
+            self.executor.shutdown()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+def request_server(socket_path, request):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        with client.makefile("rb") as stream:
+            return json.loads(stream.readline())
+
+def compile_with_server(socket_path, input_path, optimize_code=False):
+    # Thin client: the daemon compiles, the client only writes the .int and .asm files
+    with open(input_path, "r", encoding="utf-8") as file:
+        source = file.read()
+    response = request_server(socket_path, {"command": "compile", "source": source,
+                                            "name": os.path.basename(input_path),
+                                            "optimize": optimize_code})
+    if not response["ok"]:
+        for diagnostic in response["diagnostics"]:
+            print(diagnostic, file=sys.stderr)
+        return response
+    for folder, extension, key in (("int", ".int", "int"), ("asm", ".asm", "asm")):
+        output_path = output_path_for(input_path, folder, extension)
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(response[key])
+        print(f"Wrote {output_path}{' (cached)' if response['cached'] else ''}")
+    return response
+
+###################################### INCREMENTAL COMPILATION #########################################
+# A top-level subprogram is parsed from its tokens and the names it finds outside its own scopes,
+# so an unchanged token span can be replayed from a snapshot instead of being parsed again.
+# Snapshots store quads relative to their first quad and temporary number, and only plain data,
+# so they can be saved as JSON between runs.
+INCREMENTAL_VERSION = 1
+ASM_LABEL = re.compile(r"\b(L|_jt)(\d+)(?!\d)")
+
+def token_fingerprint(tokens):
+    digest = hashlib.sha256()
+    for token in tokens:
+        digest.update(f"{token.family}\0{token.recognized_string}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+def rebase_asm_line(line, delta):
+    # Quad labels and jump tables move with the quads; subprogram names in jal and begin_block
+    # lines do not
+    if not delta or "# begin_block" in line:
+        return line
+    head, separator, callee = line.partition(" jal ")
+    head = ASM_LABEL.sub(lambda match: f"{match.group(1)}{int(match.group(2)) + delta}", head)
+    return head + separator + callee
+
+def encode_scope_tree(scope):
+    # Scopes as (parent number or -1, offset counter, entity records), parents first, plus a map
+    # from id(entity) to (scope number, name) for encoding operands
+    scopes = []
+    numbers = {}
+
+    def visit(scope, parent):
+        number = len(scopes)
+        records = []
+        scopes.append((parent, scope.offset_counter, records))
+        for entity in scope.entities.values():
+            numbers[id(entity)] = (number, entity.name)
+            if isinstance(entity, Subprogram):
+                body = visit(entity.scope, number) if entity.scope is not None else -1
+                records.append((entity.kind, entity.name, 0, "", body))
+            elif isinstance(entity, Parameter):
+                records.append(("parameter", entity.name, entity.offset, entity.mode, -1))
+            elif isinstance(entity, TemporaryVariable):
+                records.append(("temporary", entity.name, entity.offset, "", -1))
+            else:
+                records.append(("variable", entity.name, entity.offset, "", -1))
+        return number
+
+    visit(scope, -1)
+    return scopes, numbers
+
+def encode_quads(quads, numbers):
+    # Indices and jump targets become relative to the first quad; names of entities in `numbers`
+    # refer to their scope record, any other name is looked up again when the quads are decoded
+    def operand(value):
+        if isinstance(value, Constant):
+            return ("constant", value.value)
+        if isinstance(value, VariableRef):
+            if id(value.entity) in numbers:
+                number, name = numbers[id(value.entity)]
+                return ("local", number, name, isinstance(value, Temporary))
+            return ("outer", str(value))
+        return value
+
+    base = quads[0][0]
+    return base, [(index - base, op, operand(x), operand(y),
+                   z - base if op in JUMP_OPS and z != "_" else operand(z))
+                  for index, op, x, y, z in quads]
+
+def json_tuples(value):
+    # Encoded scopes, quads and operands come back from JSON with lists where they had tuples
+    return tuple(map(json_tuples, value)) if isinstance(value, list) else value
+
+def renumbered_temp(name, temp_delta):
+    return f"T_{int(name[2:]) + temp_delta}"
+
+def build_scope_tree(scope_records, symbol_table, outer, temp_delta, scopes=None, number=0):
+    # Recreates the scope `number` of an encoded tree (and the scopes below it) under `outer`
+    scopes = scopes if scopes is not None else [None] * len(scope_records)
+    parent_number, offset_counter, records = scope_records[number]
+    scope = scopes[number] = Scope(outer)
+    scope.offset_counter = offset_counter
+    for kind, name, offset, mode, body in records:
+        if kind in ("function", "procedure"):
+            entity = Subprogram(name, kind)
+            scope.add_entity(entity)
+            symbol_table.subprograms[name] = entity
+            if body >= 0:
+                entity.scope = build_scope_tree(scope_records, symbol_table, scope, temp_delta, scopes, body)[body]
+                entity.parameters = [parameter for parameter in entity.scope.entities.values()
+                                     if isinstance(parameter, Parameter)]
+            continue
+        if kind == "parameter":
+            entity = Parameter(name, "int", offset, mode)
+        elif kind == "temporary":
+            entity = TemporaryVariable(renumbered_temp(name, temp_delta), "int", offset)
+        else:
+            entity = Variable(name, "int", offset)
+        scope.add_entity(entity)
+    return scopes
+
+def decode_quads(encoded, intermediate, scopes, outer, temp_delta):
+    # Appends encoded quads at the next quad number
+    def operand(value):
+        if not isinstance(value, tuple):
+            return value
+        if value[0] == "constant":
+            return Constant(value[1])
+        if value[0] == "outer":
+            return VariableRef(value[1], outer.find_entity(value[1]))
+        kind, number, name, temporary = value
+        if temporary:
+            name = renumbered_temp(name, temp_delta)
+            return Temporary(name, scopes[number].entities[name])
+        return VariableRef(name, scopes[number].entities[name])
+
+    base = intermediate.nextquad()
+    for index, op, x, y, z in encoded:
+        z = z + base if op in JUMP_OPS and z != "_" else operand(z)
+        intermediate.quads.append((index + base, op, operand(x), operand(y), z))
+    intermediate.next_quad_index += len(encoded)
+
+class SubprogramSnapshot:
+    def __init__(self, name, kind, fingerprint, token_count, base, temp_base, temp_count, scopes, quads):
+        self.name = name
+        self.kind = kind
+        self.fingerprint = fingerprint
+        self.token_count = token_count
+        self.base = base             # Index of the begin_block quad when it was recorded
+        self.temp_base = temp_base   # Temporaries T_(temp_base+1) .. T_(temp_base+temp_count)
+        self.temp_count = temp_count
+        self.scopes = scopes         # Encoded scope tree of the body, see encode_scope_tree
+        self.quads = quads           # Quads encoded by encode_quads
+        self.asm = None              # (operand offsets, base, asm lines, data lines)
+
+    @classmethod
+    def record(cls, subprogram, tokens, quads, temp_base, temp_count):
+        scopes, numbers = encode_scope_tree(subprogram.scope)
+        base, encoded = encode_quads(quads, numbers)
+        return cls(subprogram.name, subprogram.kind, token_fingerprint(tokens), len(tokens), base,
+                   temp_base, temp_count, scopes, encoded)
+
+    def to_data(self):
+        return {"name": self.name, "kind": self.kind, "fingerprint": self.fingerprint,
+                "token_count": self.token_count, "base": self.base, "temp_base": self.temp_base,
+                "temp_count": self.temp_count, "scopes": self.scopes, "quads": self.quads, "asm": self.asm}
+
+    @classmethod
+    def from_data(cls, data):
+        snapshot = cls(data["name"], data["kind"], data["fingerprint"], data["token_count"], data["base"],
+                       data["temp_base"], data["temp_count"], json_tuples(data["scopes"]),
+                       json_tuples(data["quads"]))
+        if data["asm"] is not None:
+            offsets, base, asm_lines, data_lines = data["asm"]
+            snapshot.asm = (list(json_tuples(offsets)), base, asm_lines, data_lines)
+        return snapshot
+
+    def parameter_modes(self):
+        return [mode for kind, name, offset, mode, body in self.scopes[0][2] if kind == "parameter"]
+
+    def subprogram_names(self):
+        # The snapshot's own name and those of the subprograms nested in it
+        return [self.name] + [name for parent, counter, records in self.scopes
+                              for kind, name, offset, mode, body in records if kind in ("function", "procedure")]
+
+def replay_snapshot(snapshot, symbol_table, intermediate):
+    # Declares the subprogram in the current scope and appends its quads at the current quad and
+    # temporary numbers
+    temp_delta = intermediate.temp_count - snapshot.temp_base
+    outer = symbol_table.current_scope()
+    subprogram = Subprogram(snapshot.name, snapshot.kind)
+    symbol_table.declare_subprogram(subprogram)
+    scopes = build_scope_tree(snapshot.scopes, symbol_table, outer, temp_delta)
+    subprogram.scope = scopes[0]
+    subprogram.parameters = [entity for entity in subprogram.scope.entities.values()
+                             if isinstance(entity, Parameter)]
+    decode_quads(snapshot.quads, intermediate, scopes, outer, temp_delta)
+    intermediate.temp_count += snapshot.temp_count
+
+def spans_asm(quads, spans, symbol_table, frames):
+    # Assembly of top-level subprogram spans (first, end, snapshot, reused).  A replayed span
+    # reuses its snapshot's assembly with the labels moved, as long as every operand still has
+    # the same level and offset; other spans are translated and their assembly is kept.  The
+    # frames of the spans' blocks are added to `frames`.
+    results = []
+    for first, end, snapshot, reused in spans:
+        span = quads[first:end]
+        span_frames = block_frames(span, symbol_table, main_index=0)
+        frames.update(span_frames)
+        offsets = [(operand_level(operand), operand_offset(operand)) for quad in span
+                   for operand in quad[2:] if isinstance(operand, VariableRef)]
+        if reused and snapshot.asm is not None and snapshot.asm[0] == offsets:
+            delta = span[0][0] - snapshot.asm[1]
+            results.append(([rebase_asm_line(line, delta) for line in snapshot.asm[2]],
+                            [rebase_asm_line(line, delta) for line in snapshot.asm[3]]))
+            continue
+        asm_lines, data_lines = [], []
+        for chunk_asm, chunk_data in map(generate_chunk_asm, asm_chunks(span, span_frames)):
+            asm_lines += chunk_asm
+            data_lines += chunk_data
+        snapshot.asm = (offsets, span[0][0], asm_lines, data_lines)
+        results.append((asm_lines, data_lines))
+    return results
+
+class IncrementalParser(Parser):
+    # Top-level subprograms whose tokens match a snapshot are replayed at the current quad and
+    # temporary numbers; everything else is parsed as usual and recorded.
+    def __init__(self, tokens, intermediate, snapshots=None):
+        super().__init__(tokens, intermediate)
+        self.cached = snapshots or {}
+        self.snapshots = {}
+        self.spans = []              # (first position, end position, snapshot, reused)
+
+    def subprogram(self):
+        start = self.current_token_index
+        if len(self.symbol_table.scopes) != 1 or start + 1 >= len(self.tokens):
+            return super().subprogram()
+        name = self.tokens[start + 1].recognized_string
+        first = len(self.intermediate.quads)
+        snapshot = self.cached.get(name)
+        reused = snapshot is not None and token_fingerprint(
+            self.tokens[start:start + snapshot.token_count]) == snapshot.fingerprint
+        if reused:
+            replay_snapshot(snapshot, self.symbol_table, self.intermediate)
+            self.current_token_index = start + snapshot.token_count
+            self.current_token = self.tokens[self.current_token_index] if self.current_token_index < len(self.tokens) else None
+        else:
+            temp_base = self.intermediate.temp_count
+            super().subprogram()
+            snapshot = SubprogramSnapshot.record(
+                self.symbol_table.current_scope().entities[name], self.tokens[start:self.current_token_index],
+                self.intermediate.quads[first:], temp_base, self.intermediate.temp_count - temp_base)
+        self.snapshots[name] = snapshot
+        self.spans.append((first, len(self.intermediate.quads), snapshot, reused))
+
+class IncrementalCompiler:
+    # Keeps the snapshots of the last compile, with the assembly of each subprogram
+    def __init__(self, snapshots=None):
+        self.snapshots = snapshots or {}
+        self.reused = []
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict) or data.get("version") != INCREMENTAL_VERSION:
+                raise ValueError("unknown version")
+            return cls({name: SubprogramSnapshot.from_data(snapshot) for name, snapshot in data["snapshots"].items()})
+        except (ValueError, KeyError, TypeError, AttributeError) as error:
+            print(f"Warning: {path} is not a current incremental cache ({error}); starting over")
+            return cls()
+
+    def save(self, path):
+        data = {"version": INCREMENTAL_VERSION,
+                "snapshots": {name: snapshot.to_data() for name, snapshot in self.snapshots.items()}}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    def compile(self, source, name):
+        tokens = LexerFSM(name).tokenize(source)
+        intermediate = IntermediateCodeGenerator()
+        parser = IncrementalParser(tokens, intermediate, self.snapshots)
+        parser.program()
+        self.snapshots = parser.snapshots
+        self.reused = [snapshot.name for first, end, snapshot, reused in parser.spans if reused]
+        quads = intermediate.quads
+        frames = {}
+        results = spans_asm(quads, parser.spans, parser.symbol_table, frames)
+        # The main program follows the last top-level subprogram
+        main = quads[parser.spans[-1][1] if parser.spans else 0:]
+        frames.update(block_frames(main, parser.symbol_table))
+        results += map(generate_chunk_asm, asm_chunks(main, frames, 0 if main else None))
+        return intermediate, parser.symbol_table, link_asm(results, frames, program_stack_size(quads, frames))
+
+def compile_incremental(input_path, cache_path):
+    with open(input_path, "r", encoding="utf-8") as f:
+        source = f.read()
+    compiler = IncrementalCompiler.load(cache_path)
+    intermediate, symbol_table, asm_lines = compiler.compile(source, os.path.basename(input_path))
+    compiler.save(cache_path)
+    print(f"Reused {len(compiler.reused)} of {len(compiler.snapshots)} subprograms: {', '.join(compiler.reused) or '-'}")
+    write_int_file(intermediate, input_path)
+    write_asm_lines(asm_lines, input_path)
+    return intermediate, symbol_table
+
+###################################### SEPARATE COMPILATION AND LINKING #########################################
+# An object unit is one compiled source file: its top-level subprograms as relocatable snapshots
+# with their assembly, its globals and main block, and a record of every call to a subprogram
+# the file does not define.  The linker places the subprograms of all units in front of the main
+# block of the last unit, which is the program; the main blocks of the other units are dropped.
+OBJECT_VERSION = 2
+
+class ObjectUnit:
+    def __init__(self, name, source_hash, subprograms, global_scope, main, imports):
+        self.name = name
+        self.source_hash = source_hash
+        self.subprograms = subprograms     # SubprogramSnapshot per top-level subprogram
+        self.global_scope = global_scope   # Encoded global scope, variables and temporaries only
+        self.main = main                   # (temp base, temp count, encoded quads) of the main block
+        self.imports = imports             # (caller, callee, par modes) per external call
+
+    def to_data(self):
+        return {"name": self.name, "source_hash": self.source_hash,
+                "subprograms": [snapshot.to_data() for snapshot in self.subprograms],
+                "global_scope": self.global_scope, "main": self.main, "imports": self.imports}
+
+    @classmethod
+    def from_data(cls, data):
+        temp_base, temp_count, main_quads = data["main"]
+        return cls(data["name"], data["source_hash"],
+                   [SubprogramSnapshot.from_data(snapshot) for snapshot in data["subprograms"]],
+                   json_tuples(data["global_scope"]), (temp_base, temp_count, json_tuples(main_quads)),
+                   [(caller, callee, modes) for caller, callee, modes in data["imports"]])
+
+    def exports(self):
+        return {snapshot.name: snapshot for snapshot in self.subprograms}
+
+    def global_names(self):
+        return {record[1] for record in self.global_scope[2] if record[0] == "variable"}
+
+def call_records(quads):
+    # (calling block, callee, modes of the par quads in front of the call) for every call
+    records = []
+    blocks = []
+    for position, (index, op, x, y, z) in enumerate(quads):
+        if op == "begin_block":
+            blocks.append(x)
+        elif op == "end_block":
+            blocks.pop()
+        elif op == "call":
+            first = position
+            while first > 0 and quads[first - 1][1] == "par":
+                first -= 1
+            records.append((blocks[-1] if blocks else "", x, [quads[p][3] for p in range(first, position)]))
+    return records
+
+def call_modes(snapshot):
+    modes = ["cv" if mode == "in" else "ref" for mode in snapshot.parameter_modes()]
+    return modes + (["ret"] if snapshot.kind == "function" else [])
+
+def compile_unit(source, name):
+    tokens = LexerFSM(name).tokenize(source)
+    intermediate = IntermediateCodeGenerator()
+    parser = IncrementalParser(tokens, intermediate)
+    parser.program()
+    quads = intermediate.quads
+    spans_asm(quads, parser.spans, parser.symbol_table, {})   # Keeps each subprogram's assembly in its snapshot
+    global_scope = parser.symbol_table.scopes[0]
+    variables = [entity for entity in global_scope.entities.values() if isinstance(entity, Variable)]
+    records = [("temporary" if isinstance(entity, TemporaryVariable) else "variable", entity.name,
+                entity.offset, "", -1) for entity in variables]
+    main_temps = len([entity for entity in variables if isinstance(entity, TemporaryVariable)])
+    main_start = parser.spans[-1][1] if parser.spans else 0
+    base, main_quads = encode_quads(quads[main_start:], {id(entity): (0, entity.name) for entity in variables})
+    defined = set(parser.symbol_table.subprograms)
+    imports = [record for record in call_records(quads) if record[1] not in defined]
+    return ObjectUnit(name, source_hash(source), [snapshot for first, end, snapshot, reused in parser.spans],
+                      (-1, global_scope.offset_counter, records),
+                      (intermediate.temp_count - main_temps, main_temps, main_quads), imports)
+
+def write_object_unit(unit, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": OBJECT_VERSION, "unit": unit.to_data()}, f)
+
+def read_object_unit(path):
+    # The version is checked before anything else in the file is used
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get("version") != OBJECT_VERSION:
+            raise ValueError("unknown version")
+        return ObjectUnit.from_data(data["unit"])
+    except (ValueError, KeyError, TypeError, AttributeError) as error:
+        raise ValueError(f"{path} is not a current object unit") from error
+
+def build_unit(path):
+    # A .cio file is used as it is; a source file is compiled to obj/<name>.cio unless that file
+    # was already built from the same text
+    if path.endswith(".cio"):
+        return read_object_unit(path)
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    object_path = output_path_for(path, "obj", ".cio")
+    if os.path.exists(object_path):
+        try:
+            unit = read_object_unit(object_path)
+        except ValueError:
+            unit = None
+        if unit is not None and unit.source_hash == source_hash(source):
+            print(f"{object_path} is up to date")
+            return unit
+    with contextlib.redirect_stdout(io.StringIO()):
+        unit = compile_unit(source, os.path.basename(path))
+    write_object_unit(unit, object_path)
+    print(f"Object unit written to {object_path}")
+    return unit
+
+def link_units(units):
+    program = units[-1]
+    intermediate = IntermediateCodeGenerator()
+    symbol_table = SymbolTable()
+    symbol_table.open_scope()
+    global_scope = symbol_table.current_scope()
+    parent, offset_counter, records = program.global_scope
+    for kind, name, offset, mode, body in records:
+        if kind == "variable":
+            global_scope.add_entity(Variable(name, "int", offset))
+    global_scope.offset_counter = offset_counter
+
+    owners = {}
+    exports = {}
+    spans = []
+    for unit in units:
+        # Library subprograms cannot see their unit's globals: only the program's exist
+        private = unit.global_names() if unit is not program else set()
+        for snapshot in unit.subprograms:
+            for name in snapshot.subprogram_names():
+                if name in owners:
+                    raise ValueError(f"Subprogram '{name}' is defined in both {owners[name]} and {unit.name}")
+                owners[name] = unit.name
+            used = {operand[1] for quad in snapshot.quads for operand in quad[2:]
+                    if isinstance(operand, tuple) and operand[0] == "outer"} & private
+            if used:
+                raise ValueError(f"{unit.name}: subprogram '{snapshot.name}' uses the global "
+                                 f"'{sorted(used)[0]}' of its unit")
+            exports[snapshot.name] = snapshot
+            first = len(intermediate.quads)
+            replay_snapshot(snapshot, symbol_table, intermediate)
+            spans.append((first, len(intermediate.quads), snapshot, True))
+
+    for unit in units:
+        for caller, callee, modes in unit.imports:
+            if callee not in exports:
+                raise ValueError(f"{unit.name}: unresolved call to '{callee}' in '{caller}'")
+            # callStat emits no par quads, so a procedure call may carry none
+            if modes != call_modes(exports[callee]) and (modes or exports[callee].kind != "procedure"):
+                raise ValueError(f"{unit.name}: call to '{callee}' in '{caller}' does not match its "
+                                 f"definition in {owners[callee]}")
+
+    temp_base, temp_count, main_quads = program.main
+    temp_delta = intermediate.temp_count - temp_base
+    for kind, name, offset, mode, body in records:
+        if kind == "temporary":
+            global_scope.add_entity(TemporaryVariable(renumbered_temp(name, temp_delta), "int", offset))
+    main_start = len(intermediate.quads)
+    decode_quads(main_quads, intermediate, [global_scope], global_scope, temp_delta)
+    intermediate.temp_count += temp_count
+    frames = {}
+    results = spans_asm(intermediate.quads, spans, symbol_table, frames)
+    main = intermediate.quads[main_start:]
+    frames.update(block_frames(main, symbol_table))
+    results += map(generate_chunk_asm, asm_chunks(main, frames, 0))
+    return intermediate, symbol_table, link_asm(results, frames, program_stack_size(intermediate.quads, frames))
+
+def link_program(paths):
+    # The last path holds the main program and names the output files
+    units = [build_unit(path) for path in paths]
+    intermediate, symbol_table, asm_lines = link_units(units)
+    write_int_file(intermediate, paths[-1])
+    write_asm_lines(asm_lines, paths[-1])
+    return intermediate, symbol_table
+
+###################################### MAIN #########################################
+STDIN_BLOCK_SIZE = 1 << 16  # Characters of input read at a time
+
+def read_input_values(stream=None, block_size=STDIN_BLOCK_SIZE):
+    # input() values from a text stream, read in blocks rather than lines; a number cut by
+    # the end of a block is completed by the next one
+    stream = stream or sys.stdin
+    rest = ""
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        tokens = (rest + block).split()
+        rest = "" if block[-1].isspace() else tokens.pop()
+        yield from map(int, tokens)
+    if rest:
+        yield int(rest)
+
+def write_output_values(values, stream=None):
+    # One write for the whole output instead of a print() per value
+    (stream or sys.stdout).write("".join(f"{value}\n" for value in values))
+
+def run_interpreter(intermediate, symbol_table, memo_size=None):
+    inputs = read_input_values()
+    memo = MemoTable(memo_size) if memo_size else None
+    interpreter = interpret_quads(intermediate, symbol_table, inputs, memo=memo)
+    print("\nProgram output:")
+    write_output_values(interpreter.output)
+    stats = {"steps": interpreter.steps}
+    if memo is not None:
+        stats["memoized"] = sorted(interpreter.memoized)
+        stats["memo"] = memo.stats()
+    print(json.dumps(stats, indent=2))
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Cimple compiler")
+    arg_parser.add_argument("input_file", nargs="?")
+    arg_parser.add_argument("-O", "--optimize", action="store_true",
+                            help="run the quad optimizer before writing .int and .asm")
+    arg_parser.add_argument("--unroll", type=int, default=UNROLL_FACTOR, metavar="FACTOR",
+                            help="body copies per trip of an unrolled counted loop with -O (1 disables)")
+    arg_parser.add_argument("--server", metavar="SOCKET",
+                            help="run a compile server listening on a Unix socket")
+    arg_parser.add_argument("--connect", metavar="SOCKET",
+                            help="compile input_file through a running compile server")
+    arg_parser.add_argument("--workers", type=int, help="worker processes of the compile server")
+    arg_parser.add_argument("--binary-int", action="store_true",
+                            help="also write the quads and symbol data as int/<name>.intb")
+    arg_parser.add_argument("--from-int", action="store_true",
+                            help="input_file is a .intb file; run code generation only")
+    arg_parser.add_argument("--backend", choices=sorted(BACKENDS), default="asm",
+                            help="code generator used with --from-int")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=1,
+                            help="worker processes for chunked lexing of large files and "
+                                 "per-subprogram code generation")
+    arg_parser.add_argument("--elf", action="store_true",
+                            help="also encode the assembly as RV32IM machine code in elf/<name>.elf")
+    arg_parser.add_argument("--schedule", action="store_true",
+                            help="reorder the assembly for an in-order pipeline and report estimated cycles")
+    arg_parser.add_argument("--latency", metavar="SPEC", type=LatencyModel.parse,
+                            help="latencies for --schedule (implies it), e.g. load=2,mul=3,div=20")
+    arg_parser.add_argument("--cost-report", action="store_true",
+                            help="write instruction counts, frame sizes, the call graph, stack depth and "
+                                 "cycles per loop iteration of every block to asm/<name>.cost.json")
+    arg_parser.add_argument("--buffered-io", action="store_true",
+                            help="link the runtime that reads input and writes output in blocks of "
+                                 f"{IO_BUFFER_SIZE} bytes instead of one ecall per value")
+    arg_parser.add_argument("--simulate", action="store_true",
+                            help="run the generated assembly in the built-in RISC-V simulator, "
+                                 "reading input() values from stdin")
+    arg_parser.add_argument("--profile-generate", metavar="PROFILE",
+                            help="interpret the program on stdin input and record execution counts")
+    arg_parser.add_argument("--profile-use", metavar="PROFILE",
+                            help="optimize (implies -O) with counts recorded by --profile-generate")
+    arg_parser.add_argument("--interpret", action="store_true",
+                            help="run the quads in the quad interpreter, reading input() values from stdin")
+    arg_parser.add_argument("--memoize", metavar="SIZE", type=int, nargs="?", const=MEMO_TABLE_SIZE,
+                            help="with --interpret, cache results of pure recursive functions in a "
+                                 f"table of SIZE entries (default {MEMO_TABLE_SIZE})")
+    arg_parser.add_argument("--batch", metavar="RECORDS",
+                            help="run the quads over every line of RECORDS (the input() values of one "
+                                 "run per line) in the NumPy batch interpreter")
+    arg_parser.add_argument("--incremental", metavar="CACHE",
+                            help="reuse quads and assembly of subprograms unchanged since the last "
+                                 "build recorded in CACHE")
+    arg_parser.add_argument("--stream", metavar="WINDOW", type=int, nargs="?", const=STREAM_WINDOW,
+                            help="write .int and .asm while parsing, holding back only quads inside open "
+                                 f"control structures and at most WINDOW others (default {STREAM_WINDOW})")
+    arg_parser.add_argument("--link", metavar="UNIT", nargs="+",
+                            help="link .ci sources (compiled to obj/) and .cio object units; the last "
+                                 "unit is the main program")
+    arg_parser.add_argument("--benchmark", metavar="DIR",
+                            help="simulate every .ci program in DIR with and without -O and print "
+                                 "the instruction counts as JSON")
+    arg_parser.add_argument("--io-benchmark", metavar="COUNT", type=int,
+                            help="simulate echoing COUNT numbers with the ecall-per-value and the "
+                                 "buffered I/O runtime and print system calls and instructions as JSON")
+    args = arg_parser.parse_args(argv)
+
+    if args.server:
+        asyncio.run(CompileServer(args.server, args.workers).serve())
+        return
+    if args.benchmark:
+        print(json.dumps(benchmark_corpus(args.benchmark), indent=2))
+        return
+    if args.io_benchmark:
+        print(json.dumps(benchmark_io(args.io_benchmark), indent=2))
+        return
+    if args.link:
+        intermediate, symbol_table = link_program(args.link)
+        if args.binary_int:
+            write_binary_int_file(intermediate, symbol_table, args.link[-1])
+        if args.interpret:
+            run_interpreter(intermediate, symbol_table, args.memoize)
+        return
+    if args.input_file is None:
+        arg_parser.error("input_file is required")
+    if args.connect:
+        response = compile_with_server(args.connect, args.input_file, args.optimize)
+        sys.exit(0 if response["ok"] else 1)
+    if args.from_int:
+        compile_binary_int(args.input_file, args.backend, args.jobs)
+        return
+    if args.incremental:
+        compile_incremental(args.input_file, args.incremental)
+        return
+    if args.stream:
+        compile_streaming(args.input_file, args.stream)
+        return
+
+    input_path = args.input_file
+    lexer = LexerFSM(input_path)
+    print("Lexical analysis completed successfully.")
+    tokens = lexer.tokenize_parallel(jobs=args.jobs)
+    intermediate = IntermediateCodeGenerator()
+    parser = Parser(tokens, intermediate)
+    parser.program()
+    print("Parsing completed successfully.")
+    profile = None
+    if args.profile_generate or args.profile_use:
+        with open(input_path, "r", encoding="utf-8") as f:
+            source = f.read()
+    if args.profile_generate:
+        interpreter = interpret_quads(intermediate, parser.symbol_table, read_input_values())
+        print("\nProgram output:")
+        write_output_values(interpreter.output)
+        write_profile(args.profile_generate, interpreter.profile(), source)
+    if args.profile_use:
+        profile = read_profile(args.profile_use, source)
+    if args.optimize or args.profile_use:
+        optimize(intermediate, parser.symbol_table, profile, args.unroll)
+    print("\nGenerated Intermediate Code (Quads):")
+    intermediate.print_quads()
+    write_int_file(intermediate, input_path)
+    if args.binary_int:
+        write_binary_int_file(intermediate, parser.symbol_table, input_path)
+    latency = args.latency or (LatencyModel() if args.schedule else None)
+    write_asm_file(intermediate, parser.symbol_table, input_path, args.jobs, latency, args.buffered_io)
+    if latency is not None:
+        print("\nInstruction scheduling (estimated cycles):")
+        print(json.dumps(schedule_report(intermediate, parser.symbol_table, latency), indent=2))
+    if args.cost_report:
+        write_cost_report(intermediate, parser.symbol_table, input_path, latency)
+    if args.elf:
+        elf_path = write_elf_file(intermediate, parser.symbol_table, input_path, args.jobs, latency, args.buffered_io)
+    if args.simulate:
+        inputs = read_input_values()
+        if args.elf:
+            # Runs the encoded machine code rather than the assembly text
+            with open(elf_path, "rb") as f:
+                simulator = simulate_elf(f.read(), inputs)
+        else:
+            name_without_ext = os.path.splitext(os.path.basename(input_path))[0]
+            asm_lines = generate_asm(intermediate, parser.symbol_table, name_without_ext, latency=latency,
+                                     buffered_io=args.buffered_io)
+            simulator = simulate_asm(asm_lines, inputs)
+        stats = simulator.stats()
+        if latency is not None and not args.elf:
+            stats["cycles"] = estimate_cycles(asm_lines, latency, simulator.executed)
+        print("\nSimulator output:")
+        print("".join(simulator.output), end="")
+        print(json.dumps(stats, indent=2))
+    if args.interpret:
+        run_interpreter(intermediate, parser.symbol_table, args.memoize)
+    if args.batch:
+        batch = interpret_batch(intermediate, parser.symbol_table, read_batch_records(args.batch))
+        print("\nBatch output:")
+        for lane in range(batch.size):
+            if lane in batch.errors:
+                print(f"error: {batch.errors[lane]}")
+            else:
+                print(" ".join(str(value) for value in batch.record_output(lane)))
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,49 @@
 import unittest
 import os
+import io
+import time
+import shutil
+import socket
+import asyncio
+import tempfile
+import subprocess
+import contextlib
+import threading
 from cimple_compiler_2025 import LexerFSM, Parser, IntermediateCodeGenerator  # Replace with your actual module name
+from cimple_compiler_2025 import inline_subprograms, simplify_algebra, reduce_induction_variables
+from cimple_compiler_2025 import signed_magic, constant_multiply_asm, find_switch_dispatches, switch_dispatch_asm
+from cimple_compiler_2025 import layout_code, INVERTED_RELOPS, unroll_loops, UNROLL_MAX_QUADS
+from cimple_compiler_2025 import subprogram_regions, ssa_variables, build_ssa, leave_ssa, propagate_constants, RELOPS
+from cimple_compiler_2025 import CompileServer, compile_source, request_server
+from cimple_compiler_2025 import encode_binary_int, BinaryIntReader, generate_asm, quad_chunks
+from cimple_compiler_2025 import Constant, VariableRef, Temporary, FRAME_HEADER
+from cimple_compiler_2025 import interpret_quads, optimize, write_profile, read_profile
+from cimple_compiler_2025 import simulate_asm, SimulatorError, benchmark_program, constant_divide_asm, cimple_divide, wrap_int32
+from cimple_compiler_2025 import LatencyModel, schedule_asm, estimate_cycles, schedule_report
+from cimple_compiler_2025 import RV32Assembler, AssemblerError, assemble_elf, simulate_elf, read_elf
+from cimple_compiler_2025 import MemoTable, pure_functions, memoizable_functions
+from cimple_compiler_2025 import interpret_batch, InterpreterError, np
+from cimple_compiler_2025 import IncrementalCompiler, format_int
+from cimple_compiler_2025 import StreamingIntermediateCodeGenerator, QuadStreamWriter
+from cimple_compiler_2025 import compile_unit, link_units, write_object_unit, read_object_unit
+from cimple_compiler_2025 import cost_report, stack_depths, RECURSIVE_STACK_SIZE
+from cimple_compiler_2025 import lex_chunks
+from cimple_compiler_2025 import specialize_subprograms, ExecutionProfile
+from cimple_compiler_2025 import read_input_values, benchmark_io, IO_BENCHMARK_SOURCE, IO_BUFFER_SIZE
+
+
+def compile_file(input_file):
+    lexer = LexerFSM(input_file)
+    tokens = lexer.tokenize()
+    intermediate = IntermediateCodeGenerator()
+    parser = Parser(tokens, intermediate)
+    parser.program()
+    return intermediate, parser.symbol_table
+
+
+def format_quads(quads):
+    return "".join(f"{quad[0]}: {quad[1]}, {quad[2]}, {quad[3]}, {quad[4]}\n" for quad in quads)
+
 
 class TestCompiler(unittest.TestCase):
     
@@ -426,5 +469,1128 @@ class TestCompiler(unittest.TestCase):
             with open(expected_filename, "r", encoding="utf-8") as file:
                 expected_output = file.read()        
             self.assertEqual(file_content, expected_output)
+
+
+class TestInliner(unittest.TestCase):
+
+    def test_calculator_inlined(self):
+        intermediate, symbol_table = compile_file("tests/ci/calculator.ci")
+        inline_subprograms(intermediate, symbol_table)
+        with open("tests/int/exp_calculator_inlined.int", "r", encoding="utf-8") as file:
+            expected_output = file.read()
+        self.assertEqual(format_quads(intermediate.quads), expected_output)
+
+    def test_written_in_parameter_is_copied(self):
+        # absvalue assigns to its in parameter, so the caller's x must not be touched
+        intermediate, symbol_table = compile_file("tests/ci/abs_value.ci")
+        inline_subprograms(intermediate, symbol_table)
+        ops = [quad[1] for quad in intermediate.quads]
+        self.assertNotIn("call", ops)
+        self.assertIn((":=", "x", "_"), [quad[1:4] for quad in intermediate.quads])
+        self.assertNotIn("x", [quad[4] for quad in intermediate.quads if quad[1] != "in"])
+
+    def test_in_argument_also_passed_inout_is_copied(self):
+        # h writes its inout c, which is the caller's g, so `in a` must keep the value g had
+        intermediate, symbol_table = compile_file("tests/ci/inlineAlias.ci")
+        self.assertEqual(interpret_quads(intermediate, symbol_table).output, [1, 5])
+        optimize(intermediate, symbol_table)
+        self.assertNotIn("call", [quad[1] for quad in intermediate.quads])
+        self.assertEqual(interpret_quads(intermediate, symbol_table).output, [1, 5])
+        simulator = simulate_asm(generate_asm(intermediate, symbol_table, "inlineAlias"))
+        self.assertEqual([line for line in simulator.output if line != "\n"], ["1", "5"])
+
+    def test_recursive_function_not_inlined(self):
+        intermediate, symbol_table = compile_file("tests/ci/fibonacci.ci")
+        before = list(intermediate.quads)
+        self.assertFalse(inline_subprograms(intermediate, symbol_table))
+        self.assertEqual(intermediate.quads, before)
+
+
+class TestSpecialization(unittest.TestCase):
+
+    def test_constant_arguments_get_clones(self):
+        intermediate, symbol_table = compile_file("tests/ci/specialize.ci")
+        self.assertTrue(specialize_subprograms(intermediate, symbol_table))
+        main = subprogram_regions(intermediate.quads)[-1]
+        calls = [intermediate.quads[p][2] for p in main.own_positions() if intermediate.quads[p][1] == "call"]
+        # power(in x, in 3) and digits(in x, in 2) are single calls and keep the generic body
+        self.assertEqual(calls, ["power_s1", "power_s1", "power", "scale_s1", "scale_s1", "scale",
+                                 "digits_s1", "digits_s1", "digits"])
+        power = symbol_table.subprograms["power_s1"]
+        self.assertEqual([(p.name, p.offset) for p in power.parameters], [("e", FRAME_HEADER)])
+        self.assertNotIn(("par", "10", "cv"), [quad[1:4] for quad in intermediate.quads])
+        # The recursive call of digits stays in its clone
+        digits = next(region for region in subprogram_regions(intermediate.quads) if region.name == "digits_s1")
+        self.assertIn(("call", "digits_s1"), [intermediate.quads[p][1:3] for p in digits.own_positions()])
+
+    def test_clones_fold_and_match_the_interpreter(self):
+        intermediate, symbol_table = compile_file("tests/ci/specialize.ci")
+        expected = interpret_quads(intermediate, symbol_table, [5]).output
+        self.assertEqual(expected, [32, 64, 125, 50, 65, 4, 7])
+        optimize(intermediate, symbol_table)
+        scale = next(region for region in subprogram_regions(intermediate.quads) if region.name == "scale_s1")
+        self.assertEqual([intermediate.quads[p][1] for p in scale.own_positions()], ["*", ":=", "retv"])
+        self.assertEqual(interpret_quads(intermediate, symbol_table, [5]).output, expected)
+        simulator = simulate_asm(generate_asm(intermediate, symbol_table, "specialize"), [5])
+        self.assertEqual([line for line in simulator.output if line != "\n"], [str(value) for value in expected])
+
+    def test_profile_weights_call_sites(self):
+        # With a profile only calls that ran count, so nothing here is worth a clone
+        intermediate, symbol_table = compile_file("tests/ci/specialize.ci")
+        before = list(intermediate.quads)
+        self.assertFalse(specialize_subprograms(intermediate, symbol_table, ExecutionProfile()))
+        self.assertEqual(intermediate.quads, before)
+
+
+class TestStrengthReduction(unittest.TestCase):
+
+    def test_identities_become_copies(self):
+        intermediate, symbol_table = compile_file("tests/ci/strengthReduction.ci")
+        simplify_algebra(intermediate)
+        quads = [quad[1:] for quad in intermediate.quads]
+        self.assertIn((":=", "0", "_", "T_1"), quads)
+        self.assertIn((":=", "avg", "_", "T_6"), quads)
+
+    def test_induction_variable_multiply_becomes_add(self):
+        intermediate, symbol_table = compile_file("tests/ci/strengthReductionCounted.ci")
+        self.assertTrue(reduce_induction_variables(intermediate, symbol_table))
+        quads = intermediate.quads
+        multiplies = [quad for quad in quads if quad[1] == "*"]
+        self.assertEqual(len(multiplies), 1)
+        running = multiplies[0][4]
+        header = next(quad for quad in quads if quad[1] == "<")
+        # The initial product is computed once, before the loop header, and read in place
+        self.assertLess(multiplies[0][0], header[0])
+        self.assertIn(("+", running, "21", running), [quad[1:] for quad in quads])
+        self.assertNotIn((":=", running), [quad[1:3] for quad in quads])
+        self.assertEqual(interpret_quads(intermediate, symbol_table, []).output, [945])
+
+    def test_short_and_unknown_loops_keep_the_multiply(self):
+        for inputs in (None, [7]):
+            intermediate, symbol_table = compile_file("tests/ci/strengthReduction.ci")
+            profile = None if inputs is None else interpret_quads(intermediate, symbol_table, inputs).profile()
+            self.assertFalse(reduce_induction_variables(intermediate, symbol_table, profile))
+
+    def test_profiled_reduction_saves_cycles(self):
+        cycles = []
+        for reduce in (False, True):
+            intermediate, symbol_table = compile_file("tests/ci/strengthReduction.ci")
+            if reduce:
+                profile = interpret_quads(intermediate, symbol_table, [100]).profile()
+                self.assertTrue(reduce_induction_variables(intermediate, symbol_table, profile))
+            asm_lines = generate_asm(intermediate, symbol_table, "strengthReduction")
+            simulator = simulate_asm(asm_lines, [100])
+            self.assertEqual("".join(simulator.output).split(), ["3750", "-3750", "3000"])
+            cycles.append(estimate_cycles(asm_lines, LatencyModel(), simulator.executed))
+        self.assertLess(cycles[1], cycles[0])
+
+    def test_division_magic_numbers(self):
+        self.assertEqual(signed_magic(7), (-1840700269, 2))
+        self.assertEqual(signed_magic(10), (1717986919, 2))
+        self.assertEqual(constant_multiply_asm(-1), ["    neg t2, t0"])
+        self.assertEqual(constant_multiply_asm(8), ["    slli t2, t0, 3"])
+
+
+class TestSwitchDispatch(unittest.TestCase):
+
+    def test_equality_chain_detected(self):
+        intermediate, symbol_table = compile_file("tests/ci/switchDispatch.ci")
+        dispatches = find_switch_dispatches(intermediate.quads)
+        self.assertEqual(list(dispatches), [2])
+        variable, cases, default = dispatches[2]
+        self.assertEqual(variable, "op")
+        self.assertEqual(cases, [(1, 5), (2, 9), (3, 13), (5, 17), (6, 21)])
+        self.assertEqual(default, 23)
+
+    def test_relational_cases_are_not_dispatched(self):
+        intermediate, symbol_table = compile_file("tests/ci/testSwitchcase.ci")
+        self.assertEqual(find_switch_dispatches(intermediate.quads), {})
+
+    def test_dense_cases_use_jump_table(self):
+        code, data = switch_dispatch_asm(3, [(1, 5), (2, 9), (3, 13), (5, 17)], 23)
+        self.assertIn("    jr t1", code)
+        self.assertEqual(data, ["_jt3: .word L5, L9, L13, L23, L17"])
+
+    def test_sparse_cases_use_decision_tree(self):
+        cases = [(1, 10), (100, 20), (1000, 30), (10000, 40), (100000, 50)]
+        code, data = switch_dispatch_asm(3, cases, 60)
+        self.assertEqual(data, [])
+        self.assertNotIn("    jr t1", code)
+        # The root test splits the cases in half
+        self.assertEqual(code[:3], ["    li t1, 1000", "    beq t0, t1, L30", "    blt t0, t1, L3_bs1"])
+
+
+class TestBlockLayout(unittest.TestCase):
+
+    def test_while_loop_is_rotated(self):
+        intermediate, symbol_table = compile_file("tests/ci/factorial.ci")
+        layout_code(intermediate)
+        quads = intermediate.quads
+        test = next(quad for quad in quads if quad[1] == "<=")
+        # The loop test sits after the body and branches back to it; the body needs no jump
+        self.assertLess(test[4], test[0])
+        self.assertEqual([quad[1] for quad in quads if test[4] <= quad[0] < test[0]], ["*", ":=", "+", ":="])
+        self.assertEqual(len([quad for quad in quads if quad[1] == "jump"]), 1)
+
+    def test_condition_needs_one_branch(self):
+        intermediate, symbol_table = compile_file("tests/ci/testSwitchcase.ci")
+        layout_code(intermediate)
+        with open("tests/int/exp_testSwitchcase_layout.int", "r", encoding="utf-8") as file:
+            expected_output = file.read()
+        self.assertEqual(format_quads(intermediate.quads), expected_output)
+
+    def test_loop_exit_branch_is_inverted(self):
+        intermediate, symbol_table = compile_file("tests/ci/layoutWhileAnd.ci")
+        expected = [interpret_quads(intermediate, symbol_table, [n]).output for n in (0, 5, 50)]
+        layout_code(intermediate)
+        quads = intermediate.quads
+        position = next(p for p, quad in enumerate(quads) if quad[1] in RELOPS and quad[2] == "i")
+        exit_test, back_test = quads[position], quads[position + 1]
+        # `i < n` branches out of the loop when it fails and falls through to `sum < 100`, which
+        # branches back to the body; the loop needs no jump of its own
+        self.assertEqual(exit_test[1:4], (INVERTED_RELOPS["<"], "i", "n"))
+        self.assertEqual(exit_test[4], back_test[0] + 1)
+        self.assertEqual(back_test[1:4], ("<", "sum", "100"))
+        self.assertLess(back_test[4], exit_test[0])
+        self.assertEqual(len([quad for quad in quads if quad[1] == "jump"]), 1)
+        self.assertEqual([interpret_quads(intermediate, symbol_table, [n]).output for n in (0, 5, 50)], expected)
+
+
+class TestSSA(unittest.TestCase):
+
+    def build(self, intermediate, symbol_table):
+        quads = intermediate.quads
+        regions = subprogram_regions(quads)
+        variables = ssa_variables(quads, regions, symbol_table)
+        return {region.name: (region, build_ssa(quads, region, variables[region.begin])) for region in regions}
+
+    def test_phis_at_loop_header(self):
+        intermediate, symbol_table = compile_file("tests/ci/factorial.ci")
+        region, ssa = self.build(intermediate, symbol_table)["factorial"]
+        header = ssa.by_label[next(quad[0] for quad in intermediate.quads if quad[1] == "<=")]
+        self.assertEqual(sorted(header.phis), ["fact", "i"])
+        # Every version has a single definition
+        defined = [phi[0] for block in ssa.blocks for phi in block.phis.values()]
+        defined += [quad[4] for block in ssa.blocks for quad in block.quads if quad[1] in (":=", "*", "+")]
+        self.assertEqual(len(defined), len(set(defined)))
+
+    def test_leaving_ssa_restores_the_quads(self):
+        for name in ("calculator", "factorial", "memoFibonacci", "testIncase", "switchDispatch"):
+            intermediate, symbol_table = compile_file(f"tests/ci/{name}.ci")
+            for region, ssa in self.build(intermediate, symbol_table).values():
+                self.assertEqual(leave_ssa(ssa), intermediate.quads[region.start:region.end + 1], name)
+
+    def test_constant_branches_are_folded(self):
+        intermediate, symbol_table = compile_file("tests/ci/constantBranches.ci")
+        expected = [interpret_quads(intermediate, symbol_table, [x]).output for x in (3, 7)]
+        self.assertTrue(propagate_constants(intermediate, symbol_table))
+        quads = intermediate.quads
+        # Only clamp's test on its parameter is left; the dead switchcase arms are gone
+        self.assertEqual([(quad[1], quad[2], quad[3]) for quad in quads if quad[1] in RELOPS], [(">", "v", "10")])
+        self.assertEqual([quad[2] for quad in quads if quad[1] == "out"], ["T_3", "200"])
+        self.assertIn(("*", "x", "2"), [quad[1:4] for quad in quads])
+        self.assertEqual([interpret_quads(intermediate, symbol_table, [x]).output for x in (3, 7)], expected)
+
+    def test_optimized_programs_behave_the_same(self):
+        for name in ("calculator", "factorial", "memoFibonacci", "testIncase", "testWhile_and", "constantBranches"):
+            intermediate, symbol_table = compile_file(f"tests/ci/{name}.ci")
+            plain = interpret_quads(intermediate, symbol_table, [4, 2, 8, 3]).output
+            optimize(intermediate, symbol_table)
+            self.assertEqual(interpret_quads(intermediate, symbol_table, [4, 2, 8, 3]).output, plain, name)
+
+
+class TestLoopUnrolling(unittest.TestCase):
+
+    def outputs(self, intermediate, symbol_table, values):
+        return [interpret_quads(intermediate, symbol_table, [n]).output for n in values]
+
+    def retired(self, name, factor, inputs, profile_inputs=None):
+        intermediate, symbol_table = compile_file(f"tests/ci/{name}.ci")
+        profile = None
+        if profile_inputs is not None:
+            profile = interpret_quads(intermediate, symbol_table, profile_inputs).profile()
+        expected = interpret_quads(intermediate, symbol_table, inputs).output
+        optimize(intermediate, symbol_table, profile, unroll_factor=factor)
+        simulator = simulate_asm(generate_asm(intermediate, symbol_table, name), inputs)
+        self.assertEqual("".join(simulator.output).split(), [str(value) for value in expected])
+        return simulator.stats()["retired"]
+
+    def test_partial_unroll_keeps_a_remainder_loop(self):
+        for name in ("factorial", "strengthReduction", "countedLoops"):
+            intermediate, symbol_table = compile_file(f"tests/ci/{name}.ci")
+            expected = self.outputs(intermediate, symbol_table, range(15))
+            # A long run makes the trips pay for the checks
+            profile = interpret_quads(intermediate, symbol_table, [200]).profile()
+            self.assertTrue(unroll_loops(intermediate, symbol_table, 4, profile))
+            # The unrolled trip and the remainder loop each jump back
+            jumps_back = [quad for quad in intermediate.quads if quad[1] == "jump" and quad[4] < quad[0]]
+            self.assertGreaterEqual(len(jumps_back), 2, name)
+            self.assertEqual(self.outputs(intermediate, symbol_table, range(15)), expected, name)
+
+    def test_constant_trip_count_is_unrolled_fully(self):
+        intermediate, symbol_table = compile_file("tests/ci/countedLoops.ci")
+        unroll_loops(intermediate, symbol_table, 4)
+        quads = intermediate.quads
+        # Only the loop bounded by n keeps its test, and without a profile it gets no check
+        self.assertEqual([quad[1:4] for quad in quads if quad[1] in RELOPS], [("<=", "i", "n")])
+        self.assertEqual(len([quad for quad in quads if quad[1:4] == ("+", "square", "n")]), 4)
+        self.assertEqual(self.outputs(intermediate, symbol_table, [3]), [[6, 12]])
+
+    def test_short_loops_are_left_alone(self):
+        # Too few known trips to pay for the checks, and none known at all
+        for name in ("strengthReductionCounted", "factorial"):
+            intermediate, symbol_table = compile_file(f"tests/ci/{name}.ci")
+            self.assertFalse(unroll_loops(intermediate, symbol_table, 4), name)
+        # A profile of short runs
+        intermediate, symbol_table = compile_file("tests/ci/factorial.ci")
+        profile = interpret_quads(intermediate, symbol_table, [12]).profile()
+        self.assertFalse(unroll_loops(intermediate, symbol_table, 4, profile))
+
+    def test_size_budget(self):
+        intermediate, symbol_table = compile_file("tests/ci/factorial.ci")
+        before = len(intermediate.quads)
+        profile = interpret_quads(intermediate, symbol_table, [200]).profile()
+        self.assertTrue(unroll_loops(intermediate, symbol_table, 100, profile))
+        self.assertLessEqual(len(intermediate.quads) - before, UNROLL_MAX_QUADS + 6)
+        # A factor of 1 leaves the loops alone
+        intermediate, symbol_table = compile_file("tests/ci/factorial.ci")
+        self.assertFalse(unroll_loops(intermediate, symbol_table, 1))
+
+    def test_fewer_retired_instructions(self):
+        self.assertLess(self.retired("countedLoops", 4, [100], [100]), self.retired("countedLoops", 1, [100], [100]))
+
+    def test_factorial_retired_instructions_do_not_grow(self):
+        for n in (3, 7, 12):
+            self.assertEqual(self.retired("factorial", 4, [n]), self.retired("factorial", 1, [n]), n)
+            self.assertEqual(self.retired("factorial", 4, [n], [n]), self.retired("factorial", 1, [n], [n]), n)
+
+
+@unittest.skipUnless(hasattr(socket, "AF_UNIX"), "the compile server needs Unix domain sockets")
+class TestCompileServer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, "cimple.sock")
+        self.server = CompileServer(self.socket_path, workers=1)
+        self.thread = threading.Thread(target=asyncio.run, args=(self.server.serve(),))
+        self.thread.start()
+        for _ in range(100):
+            if os.path.exists(self.socket_path):
+                break
+            time.sleep(0.05)
+
+    def tearDown(self):
+        request_server(self.socket_path, {"command": "shutdown"})
+        self.thread.join(10)
+        shutil.rmtree(self.directory)
+
+    def test_compile_matches_local_pipeline(self):
+        with open("tests/ci/factorial.ci", "r", encoding="utf-8") as file:
+            source = file.read()
+        request = {"command": "compile", "source": source, "name": "factorial.ci"}
+        first = request_server(self.socket_path, request)
+        second = request_server(self.socket_path, request)
+        with open("tests/int/exp_factorial.int", "r", encoding="utf-8") as file:
+            self.assertEqual(first["int"], file.read())
+        self.assertEqual(first["asm"], compile_source(source, "factorial.ci")["asm"])
+        self.assertFalse(first["cached"])
+        self.assertTrue(second["cached"])
+        self.assertEqual(second["asm"], first["asm"])
+
+    def test_syntax_error_is_reported(self):
+        response = request_server(self.socket_path, {"source": "program broken {x := ;}."})
+        self.assertFalse(response["ok"])
+        self.assertEqual(response["diagnostics"], ["Unexpected token in factor"])
+
+    def test_request_that_is_not_an_object_is_rejected(self):
+        for request in ([1], "x", 3):
+            response = request_server(self.socket_path, request)
+            self.assertFalse(response["ok"])
+            self.assertEqual(response["diagnostics"], ["Bad request: expected a JSON object"])
+        # The connection handler survived: the server still answers
+        self.assertTrue(request_server(self.socket_path, {"command": "stats"})["ok"])
+
+    def test_fields_that_are_not_strings_are_rejected(self):
+        for request in ({"source": 5}, {"source": "program p {}.", "name": 5}, {"source": None}):
+            response = request_server(self.socket_path, request)
+            self.assertFalse(response["ok"])
+            self.assertEqual(response["diagnostics"], ["Bad request: 'source' and 'name' must be strings"])
+        self.assertTrue(request_server(self.socket_path, {"command": "stats"})["ok"])
+
+
+class TestBinaryIntermediate(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def round_trip(self, input_file):
+        intermediate, symbol_table = compile_file(input_file)
+        path = os.path.join(self.directory, "program.intb")
+        with open(path, "wb") as file:
+            file.write(encode_binary_int(intermediate, symbol_table))
+        return intermediate, symbol_table, BinaryIntReader(path)
+
+    def test_quads_round_trip(self):
+        intermediate, symbol_table, reader = self.round_trip("tests/ci/testIncase.ci")
+        with reader:
+            self.assertEqual(len(reader), len(intermediate.quads))
+            self.assertEqual(reader[len(reader) - 1], intermediate.quads[-1])
+            self.assertEqual(reader.intermediate().quads, intermediate.quads)
+            self.assertEqual(reader.temp_count, intermediate.temp_count)
+
+    def test_asm_from_binary_matches_source_pipeline(self):
+        for input_file in ["tests/ci/calculator.ci", "tests/ci/fibonacci.ci"]:
+            intermediate, symbol_table, reader = self.round_trip(input_file)
+            with reader:
+                loaded = generate_asm(reader.intermediate(), reader.symbol_table(), "program")
+            self.assertEqual(loaded, generate_asm(intermediate, symbol_table, "program"))
+
+    def test_symbol_table_round_trip(self):
+        intermediate, symbol_table, reader = self.round_trip("tests/ci/calculator.ci")
+        with reader:
+            loaded = reader.symbol_table()
+        self.assertEqual(sorted(loaded.subprograms), sorted(symbol_table.subprograms))
+        for name, subprogram in symbol_table.subprograms.items():
+            copy = loaded.subprograms[name]
+            self.assertEqual(copy.kind, subprogram.kind)
+            self.assertEqual([(p.name, p.mode, p.offset) for p in copy.parameters],
+                             [(p.name, p.mode, p.offset) for p in subprogram.parameters])
+        self.assertEqual({name: entity.offset for name, entity in loaded.scopes[0].entities.items()
+                          if hasattr(entity, "offset")},
+                         {name: entity.offset for name, entity in symbol_table.scopes[0].entities.items()
+                          if hasattr(entity, "offset")})
+
+    def test_rejects_other_files(self):
+        path = os.path.join(self.directory, "program.int")
+        with open(path, "wb") as file:
+            file.write(b"1: begin_block, x, _, _" + bytes(64))
+        with self.assertRaises(ValueError):
+            BinaryIntReader(path)
+
+
+class TestParallelCodegen(unittest.TestCase):
+
+    def test_chunks_start_at_blocks(self):
+        intermediate, symbol_table = compile_file("tests/ci/calculator.ci")
+        chunks = quad_chunks(intermediate.quads)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], len(intermediate.quads))
+        self.assertEqual(len(chunks), len([quad for quad in intermediate.quads if quad[1] == "begin_block"]))
+        for start, end in chunks:
+            self.assertEqual(intermediate.quads[start][1], "begin_block")
+
+    def test_parallel_output_is_identical(self):
+        for input_file in ["tests/ci/calculator.ci", "tests/ci/switchDispatch.ci"]:
+            intermediate, symbol_table = compile_file(input_file)
+            name = os.path.splitext(os.path.basename(input_file))[0]
+            self.assertEqual(generate_asm(intermediate, symbol_table, name, jobs=2),
+                             generate_asm(intermediate, symbol_table, name))
+
+
+class TestParallelLexing(unittest.TestCase):
+
+    def tokens(self, lexer_tokens):
+        return [(token.recognized_string, token.family, token.line_number) for token in lexer_tokens]
+
+    def test_chunk_boundaries(self):
+        text = ("program p declare alpha,beta;# a comment\nover two lines #\n{alpha:=12345;"
+                "if(alpha<>beta){beta:=alpha+1}else{print(beta)};#x#\n\n#\n#while(beta<=9){beta:=beta*2}\n}.")
+        chunks = lex_chunks(text, 4)
+        self.assertEqual("".join(chunk[0] for chunk in chunks), text)
+        self.assertTrue(any(in_comment for _, in_comment, _ in chunks))
+        for chunk_size in (1, 4, 9):
+            self.assertEqual(self.tokens(LexerFSM("p.ci").tokenize_parallel(text, 2, chunk_size)),
+                             self.tokens(LexerFSM("p.ci").tokenize(text)), chunk_size)
+
+    def test_corpus_and_errors_match(self):
+        for name in ("calculator", "nestedScopes", "testIncase"):
+            with open(f"tests/ci/{name}.ci", "r", encoding="utf-8") as file:
+                text = file.read()
+            self.assertEqual(self.tokens(LexerFSM(name).tokenize_parallel(text, 2, 16)),
+                             self.tokens(LexerFSM(name).tokenize(text)), name)
+        text = "program p\n# ! #\ndeclare x;\n{ x := 1 ! 2; y ? 3 }."
+        with self.assertRaises(ValueError) as sequential:
+            LexerFSM("p.ci").tokenize(text)
+        with self.assertRaises(ValueError) as parallel:
+            LexerFSM("p.ci").tokenize_parallel(text, 2, 8)
+        self.assertEqual(str(parallel.exception), str(sequential.exception))
+
+
+class TestOperands(unittest.TestCase):
+
+    def test_operands_are_resolved_by_the_parser(self):
+        intermediate, symbol_table = compile_file("tests/ci/abs_value.ci")
+        function_scope = symbol_table.subprograms["absvalue"].scope
+        for index, op, x, y, z in intermediate.quads:
+            for operand in (x, y, z):
+                if isinstance(operand, Temporary):
+                    self.assertEqual(operand.entity.name, operand)
+                elif isinstance(operand, VariableRef):
+                    self.assertIsNotNone(operand.entity)
+        negate = next(quad for quad in intermediate.quads if quad[1] == "*")
+        self.assertIsInstance(negate[3], Constant)
+        self.assertEqual(negate[3].value, -1)
+        self.assertIs(negate[2].entity, function_scope.entities[negate[2]])
+        self.assertIsInstance(negate[4], Temporary)
+
+    def test_incase_flags_are_constants(self):
+        intermediate, symbol_table = compile_file("tests/ci/testIncase.ci")
+        flags = [quad[2] for quad in intermediate.quads if quad[1] == ":=" and quad[2] in ("0", "1")]
+        self.assertTrue(flags)
+        self.assertTrue(all(isinstance(flag, Constant) for flag in flags))
+
+    def test_binary_round_trip_keeps_operand_types(self):
+        intermediate, symbol_table = compile_file("tests/ci/calculator.ci")
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "program.intb")
+            with open(path, "wb") as file:
+                file.write(encode_binary_int(intermediate, symbol_table))
+            with BinaryIntReader(path) as reader:
+                loaded = reader.intermediate().quads
+        finally:
+            shutil.rmtree(directory)
+        for original, copy in zip(intermediate.quads, loaded):
+            self.assertEqual([type(operand) for operand in original], [type(operand) for operand in copy])
+            for before, after in zip(original, copy):
+                if isinstance(before, VariableRef):
+                    self.assertEqual(after.entity.offset, before.entity.offset)
+
+
+class TestNestedScopes(unittest.TestCase):
+
+    def test_entities_carry_level_and_offset(self):
+        intermediate, symbol_table = compile_file("tests/ci/nestedScopes.ci")
+        outer = symbol_table.scopes[0].entities["outer"]
+        step = outer.scope.entities["step"]
+        deepest = step.scope.entities["deepest"]
+        self.assertEqual([scope.level for scope in (symbol_table.scopes[0], outer.scope, step.scope, deepest.scope)],
+                         [0, 1, 2, 3])
+        self.assertEqual((outer.level, step.level, deepest.level), (0, 1, 2))
+        self.assertEqual([(p.name, p.level, p.offset) for p in step.parameters],
+                         [("k", 2, FRAME_HEADER), ("acc", 2, FRAME_HEADER + 4)])
+        count = next(quad[2] for quad in intermediate.quads if quad[1] == "+" and quad[2] == "count")
+        self.assertIs(count.entity, symbol_table.scopes[0].entities["count"])
+        self.assertEqual(count.entity.level, 0)
+
+    def test_non_locals_match_the_interpreter(self):
+        for optimize_code in (False, True):
+            intermediate, symbol_table = compile_file("tests/ci/nestedScopes.ci")
+            if optimize_code:
+                optimize(intermediate, symbol_table)
+            expected = [str(value) for value in interpret_quads(intermediate, symbol_table, [10]).output]
+            self.assertEqual(expected, ["26", "82", "248", "6", "2907", "2907", "3"])
+            asm = generate_asm(intermediate, symbol_table, "nestedScopes")
+            simulator = simulate_asm(asm, [10])
+            self.assertEqual([line for line in simulator.output if line != "\n"], expected, optimize_code)
+            self.assertEqual(simulate_elf(assemble_elf(asm), [10]).output, simulator.output)
+
+    def test_non_locals_cost_one_display_load(self):
+        intermediate, symbol_table = compile_file("tests/ci/nestedScopes.ci")
+        asm = generate_asm(intermediate, symbol_table, "nestedScopes")
+        body = asm[asm.index("deepest: # begin_block deepest"):asm.index("    ret")]
+        # depth (level 1) through the display, count and base (level 0) from the main frame
+        self.assertIn("    lw t3, 4(gp)", body)
+        self.assertIn("    lw t0, -20(t3)", body)
+        self.assertIn("L4: lw t0, -16(s0)", body)
+
+
+class TestSimulator(unittest.TestCase):
+
+    def test_program_output_and_counts(self):
+        intermediate, symbol_table = compile_file("tests/ci/factorial.ci")
+        simulator = simulate_asm(generate_asm(intermediate, symbol_table, "factorial"), [7])
+        self.assertEqual("".join(simulator.output), "5040\n")
+        self.assertEqual(simulator.exit_code, 0)
+        stats = simulator.stats()
+        self.assertEqual(stats["labels"]["Lmain"], 1)
+        self.assertEqual(stats["labels"]["print_int"], 1)
+        self.assertGreater(stats["loads"], 0)
+        self.assertGreater(stats["stores"], 0)
+        self.assertGreater(stats["retired"], stats["loads"] + stats["stores"])
+
+    def test_strength_reduced_sequences_match_arithmetic(self):
+        exit_sequence = ["    mv a0, t2", "    li a7, 1", "    ecall", "    li a7, 10", "    ecall"]
+        for constant in [3, 5, 7, -6, 10, 16, -1]:
+            for value in [0, 1, -1, 17, -17, 100, -2147483648, 2147483647]:
+                for code, expected in [(constant_divide_asm(constant), cimple_divide(value, constant)),
+                                       (constant_multiply_asm(constant), value * constant)]:
+                    if code is None:
+                        continue
+                    simulator = simulate_asm([f"    li t0, {value}"] + code + exit_sequence)
+                    self.assertEqual(int("".join(simulator.output)), wrap_int32(expected), (value, constant))
+
+    def test_jump_table_and_taken_branches(self):
+        asm = [
+            "    li t0, 1",
+            "    la t1, table",
+            "    slli t0, t0, 2",
+            "    add t1, t1, t0",
+            "    lw t1, 0(t1)",
+            "    jr t1",
+            "first: li a0, 10",
+            "second: li a0, 20",
+            "    li t2, 0",
+            "loop: addi t2, t2, 1",
+            "    blt t2, a0, loop",
+            "    mv a0, t2",
+            "    li a7, 93",
+            "    ecall",
+            ".data",
+            "table: .word first, second",
+        ]
+        simulator = simulate_asm(asm)
+        self.assertEqual(simulator.exit_code, 20)
+        self.assertEqual(simulator.taken_branches, 19)
+        self.assertEqual(simulator.stats()["labels"], {"first": 0, "second": 1, "loop": 20})
+        # la expands to two instructions
+        self.assertEqual(simulator.retired, 7 + 2 + 40 + 3)
+
+    def test_step_limit(self):
+        with self.assertRaises(SimulatorError):
+            simulate_asm(["spin: j spin"], max_steps=1000)
+
+    def test_benchmark_row(self):
+        row = benchmark_program("tests/ci/strengthReduction.ci", optimize_code=True)
+        self.assertEqual(row["status"], "ok")
+        self.assertEqual(row["output"], "24\n-24\n19\n")
+        for key in ("retired", "loads", "stores", "branches", "taken_branches"):
+            self.assertIn(key, row)
+
+
+class TestBufferedIO(unittest.TestCase):
+
+    def echo_program(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            intermediate = IntermediateCodeGenerator()
+            parser = Parser(LexerFSM("echoNumbers.ci").tokenize(IO_BENCHMARK_SOURCE), intermediate)
+            parser.program()
+        return intermediate, parser.symbol_table
+
+    def test_same_output_with_fewer_ecalls(self):
+        for path, inputs in [("tests/ci/factorial.ci", [7]), ("tests/ci/nestedScopes.ci", [10]),
+                             ("tests/ci/countedLoops.ci", [100])]:
+            intermediate, symbol_table = compile_file(path)
+            plain = simulate_asm(generate_asm(intermediate, symbol_table, "plain"), inputs)
+            for latency in (None, LatencyModel()):
+                asm = generate_asm(intermediate, symbol_table, "buffered", latency=latency, buffered_io=True)
+                buffered = simulate_asm(asm, inputs)
+                self.assertEqual("".join(buffered.output), "".join(plain.output), path)
+                self.assertEqual(buffered.exit_code, 0)
+                self.assertLess(buffered.ecalls, plain.ecalls, path)
+            self.assertEqual(simulate_elf(assemble_elf(asm), inputs).output, buffered.output)
+
+    def test_values_cross_buffer_boundaries(self):
+        # Enough values that input and output both take several blocks
+        values = [-2147483648, 2147483647, 0, -7, 1000000] * 400
+        intermediate, symbol_table = self.echo_program()
+        simulator = simulate_asm(generate_asm(intermediate, symbol_table, "echo", buffered_io=True),
+                                 [len(values)] + values)
+        text = "".join(simulator.output)
+        self.assertEqual(text, "".join(f"{value}\n" for value in values))
+        self.assertGreater(len(text), 2 * IO_BUFFER_SIZE)
+        self.assertTrue(all(len(chunk) <= IO_BUFFER_SIZE for chunk in simulator.output))
+
+    def test_output_flushed_when_input_runs_out(self):
+        intermediate, symbol_table = self.echo_program()
+        simulator = simulate_asm(generate_asm(intermediate, symbol_table, "echo", buffered_io=True), [3, 5, 6])
+        self.assertEqual("".join(simulator.output), "5\n6\n")
+        self.assertEqual(simulator.exit_code, 1)
+
+    def test_stdin_read_in_blocks(self):
+        stream = io.StringIO("12 34\n-5   6789\n\n7")
+        self.assertEqual(list(read_input_values(stream, block_size=3)), [12, 34, -5, 6789, 7])
+
+    def test_benchmark_rows(self):
+        plain, buffered = benchmark_io(300)
+        self.assertTrue(plain["ok"] and buffered["ok"])
+        self.assertEqual(plain["ecalls"], 3 * 300 + 2)
+        self.assertLess(buffered["ecalls"], 10)
+        self.assertLess(buffered["estimated_cycles"], plain["estimated_cycles"])
+
+
+class TestInstructionScheduling(unittest.TestCase):
+
+    def test_loads_fill_load_use_stalls(self):
+        asm = [
+            "    la sp, _stack",
+            "    addi sp, sp, 1024",
+            "    li t0, 5",
+            "    sw t0, -4(sp)",
+            "    li t0, 7",
+            "    sw t0, -8(sp)",
+            "L1: lw t0, -4(sp)",
+            "    lw t1, -8(sp)",
+            "    add t2, t0, t1",
+            "    sw t2, -12(sp)",
+            "L2: lw t0, -8(sp)",
+            "    lw t1, -12(sp)",
+            "    mul t2, t0, t1",
+            "    sw t2, -16(sp)",
+            "L3: lw a0, -16(sp)",
+            "    li a7, 1",
+            "    ecall",
+            "    li a7, 10",
+            "    ecall",
+            ".data",
+            "_stack: .space 1024",
+        ]
+        model = LatencyModel()
+        scheduled = schedule_asm(asm, model)
+        self.assertEqual(simulate_asm(scheduled).output, ["84"])
+        self.assertLess(estimate_cycles(scheduled, model), estimate_cycles(asm, model))
+        # The second block's loads no longer wait for the add to read t0 and t1
+        load = next(position for position, line in enumerate(scheduled) if line.startswith("L2: lw"))
+        add = next(position for position, line in enumerate(scheduled) if line.startswith("    add t"))
+        self.assertLess(load, add)
+
+    def test_scheduled_programs_behave_the_same(self):
+        model = LatencyModel()
+        for name in ("calculator", "factorial", "countedLoops", "strengthReduction", "testIncase", "switchDispatch"):
+            for optimize_code in (False, True):
+                intermediate, symbol_table = compile_file(f"tests/ci/{name}.ci")
+                if optimize_code:
+                    optimize(intermediate, symbol_table)
+                asm = generate_asm(intermediate, symbol_table, name)
+                scheduled = generate_asm(intermediate, symbol_table, name, latency=model)
+                self.assertEqual(scheduled, schedule_asm(asm, model))
+                plain, fast = simulate_asm(asm, [9, 4, 6]), simulate_asm(scheduled, [9, 4, 6])
+                self.assertEqual(fast.output, plain.output, name)
+                self.assertEqual(fast.retired, plain.retired, name)
+                self.assertLessEqual(estimate_cycles(scheduled, model, fast.executed),
+                                     estimate_cycles(asm, model, plain.executed), name)
+
+    def test_latency_model(self):
+        model = LatencyModel.parse("load=3, div=34")
+        self.assertEqual((model.load, model.mul, model.div), (3, 3, 34))
+        for spec in ("load=0", "cache=2", "mul"):
+            with self.assertRaises(ValueError):
+                LatencyModel.parse(spec)
+        intermediate, symbol_table = compile_file("tests/ci/factorial.ci")
+        report = schedule_report(intermediate, symbol_table, LatencyModel())
+        self.assertEqual([row["block"] for row in report["blocks"]], ["factorial"])
+        self.assertLess(report["after"], report["before"])
+        self.assertGreater(schedule_report(intermediate, symbol_table, LatencyModel(load=4))["before"], report["before"])
+
+
+class TestCostReport(unittest.TestCase):
+
+    def test_stack_is_sized_from_the_call_graph(self):
+        intermediate, symbol_table = compile_file("tests/ci/calculator.ci")
+        report = cost_report(intermediate, symbol_table)
+        blocks = {block["block"]: block for block in report["blocks"]}
+        self.assertEqual(blocks["calculator"]["calls"], ["add", "divide", "mul", "sub"])
+        self.assertEqual(blocks["add"]["max_stack"], blocks["add"]["frame_size"])
+        self.assertEqual(report["stack_size"], blocks["calculator"]["max_stack"])
+        self.assertEqual(report["unbounded"], [])
+        asm = generate_asm(intermediate, symbol_table, "calculator")
+        self.assertIn(f"_stack: .space {report['stack_size'] - 4}", asm)
+        self.assertEqual([line for line in simulate_asm(asm, [8, 2, 1]).output if line != "\n"],
+                         [str(value) for value in interpret_quads(intermediate, symbol_table, [8, 2, 1]).output])
+
+    def test_recursion_is_unbounded(self):
+        intermediate, symbol_table = compile_file("tests/ci/nestedScopes.ci")
+        report = cost_report(intermediate, symbol_table)
+        blocks = {block["block"]: block for block in report["blocks"]}
+        self.assertEqual(sorted(report["unbounded"]), ["down", "nestedScopes", "outer"])
+        self.assertEqual(blocks["step"]["max_stack"], blocks["step"]["frame_size"] + blocks["deepest"]["frame_size"])
+        self.assertEqual(report["stack_size"], RECURSIVE_STACK_SIZE)
+        self.assertEqual(stack_depths({"a": ["b"], "b": ["c"], "c": ["b"], "d": []}, {"a": 8, "b": 8, "c": 8, "d": 4}),
+                         {"a": None, "b": None, "c": None, "d": 4})
+
+    def test_loop_iteration_cost(self):
+        intermediate, symbol_table = compile_file("tests/ci/nestedScopes.ci")
+        outer = cost_report(intermediate, symbol_table)["blocks"][0]
+        self.assertEqual(outer["block"], "outer")
+        loop, = outer["loops"]
+        self.assertEqual(loop["calls"], ["step"])
+        self.assertLess(loop["instructions"], outer["instructions"])
+        self.assertGreaterEqual(loop["cycles"], loop["instructions"])
+        slow = cost_report(intermediate, symbol_table, LatencyModel(load=5))["blocks"][0]["loops"][0]
+        self.assertGreater(slow["cycles"], loop["cycles"])
+
+
+class TestMachineCode(unittest.TestCase):
+
+    def words(self, line):
+        return RV32Assembler([line]).encode(0)
+
+    def test_known_encodings(self):
+        expected = {
+            "addi sp, sp, 1024": [0x40010113],
+            "lw t0, -4(sp)": [0xffc12283],
+            "sw t0, -4(sp)": [0xfe512e23],
+            "mul t2, t0, t1": [0x026283b3],
+            "srai t0, t0, 31": [0x41f2d293],
+            "ret": [0x00008067],
+            "ecall": [0x00000073],
+            # lui + addi, with the upper part rounded up because the low part is negative
+            "li t0, 0x12345fff": [0x123462b7, 0xfff28293],
+        }
+        for line, words in expected.items():
+            self.assertEqual(self.words(line), words, line)
+        with self.assertRaises(AssemblerError):
+            self.words("addi t0, t0, 4096")
+
+    def test_elf_runs_like_the_assembly(self):
+        for name, inputs in [("factorial", [7]), ("calculator", [2, 6, 3]), ("switchDispatch", [5]),
+                             ("strengthReduction", [4])]:
+            intermediate, symbol_table = compile_file(f"tests/ci/{name}.ci")
+            asm_lines = generate_asm(intermediate, symbol_table, name)
+            expected = simulate_asm(asm_lines, inputs)
+            image = assemble_elf(asm_lines)
+            simulator = simulate_elf(image, inputs)
+            self.assertEqual(simulator.output, expected.output, name)
+            self.assertEqual(simulator.stats()["retired"], expected.stats()["retired"], name)
+            entry, segments, symbols = read_elf(image)
+            self.assertEqual(symbols["_start"], entry)
+            self.assertIn("print_int", symbols)
+
+    def test_far_branches_are_relaxed(self):
+        asm = ["    li t0, 1", "    bnez t0, far"] + ["    nop"] * 1100 + ["far: li a0, 7", "    li a7, 93", "    ecall"]
+        assembler = RV32Assembler(asm)
+        self.assertEqual(assembler.long_branches, {1})
+        self.assertEqual(simulate_elf(assemble_elf(asm)).exit_code, 7)
+
+    @unittest.skipUnless(shutil.which("readelf"), "readelf is not installed")
+    def test_readelf_accepts_the_executable(self):
+        intermediate, symbol_table = compile_file("tests/ci/factorial.ci")
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "factorial.elf")
+            with open(path, "wb") as file:
+                file.write(assemble_elf(generate_asm(intermediate, symbol_table, "factorial")))
+            report = subprocess.run(["readelf", "-h", "-l", "-s", path], capture_output=True, text=True, check=True)
+        finally:
+            shutil.rmtree(directory)
+        self.assertIn("RISC-V", report.stdout)
+        self.assertIn("EXEC (Executable file)", report.stdout)
+        self.assertIn("Lmain", report.stdout)
+        self.assertEqual(report.stderr, "")
+
+
+class TestProfileGuided(unittest.TestCase):
+
+    def profiled(self, input_file, inputs):
+        intermediate, symbol_table = compile_file(input_file)
+        interpreter = interpret_quads(intermediate, symbol_table, inputs)
+        return intermediate, symbol_table, interpreter
+
+    def test_interpreter_counts(self):
+        intermediate, symbol_table, interpreter = self.profiled("tests/ci/factorial.ci", [7])
+        self.assertEqual(interpreter.output, [5040])
+        profile = interpreter.profile()
+        multiply = next(quad[0] for quad in intermediate.quads if quad[1] == "*")
+        test = next(quad[0] for quad in intermediate.quads if quad[1] == "<=")
+        self.assertEqual(profile.count(multiply), 7)
+        self.assertEqual(profile.count(test), 8)
+        self.assertEqual(profile.taken_count(test), 7)
+
+    def test_interpreter_passes_parameters(self):
+        intermediate, symbol_table, interpreter = self.profiled("tests/ci/profileGuided.ci", [50])
+        self.assertEqual(interpreter.output, [sum(3 * i + 1 for i in range(1, 50)) - 100])
+
+    def test_profile_puts_hot_path_on_fall_through(self):
+        intermediate, symbol_table, interpreter = self.profiled("tests/ci/profileGuided.ci", [50])
+        profile = interpreter.profile()
+        optimize(intermediate, symbol_table, profile, unroll_factor=1)
+        quads = intermediate.quads
+        position = next(p for p, quad in enumerate(quads) if quad[1] in ("=", "<>") and quad[3] == "0")
+        # The branch to the cold i = 0 arm is the one taken; the hot arm follows it
+        self.assertEqual(quads[position][1], "=")
+        self.assertEqual(profile.count(quads[position + 1][0]), 49)
+        self.assertEqual(interpret_quads(intermediate, symbol_table, [50]).output, interpreter.output)
+
+    def test_calls_that_never_ran_are_not_inlined(self):
+        intermediate, symbol_table, interpreter = self.profiled("tests/ci/profileGuided.ci", [0])
+        optimize(intermediate, symbol_table, interpreter.profile())
+        self.assertEqual(len([quad for quad in intermediate.quads if quad[1] == "call"]), 2)
+        intermediate, symbol_table = compile_file("tests/ci/profileGuided.ci")
+        optimize(intermediate, symbol_table)
+        self.assertEqual([quad for quad in intermediate.quads if quad[1] == "call"], [])
+
+    def test_profile_file_is_tied_to_the_source(self):
+        intermediate, symbol_table, interpreter = self.profiled("tests/ci/factorial.ci", [3])
+        with open("tests/ci/factorial.ci", "r", encoding="utf-8") as file:
+            source = file.read()
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "factorial.profile")
+            with contextlib.redirect_stdout(io.StringIO()):
+                write_profile(path, interpreter.profile(), source)
+                loaded = read_profile(path, source)
+                stale = read_profile(path, source + "\n")
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(loaded.counts, interpreter.profile().counts)
+        self.assertEqual(loaded.taken, interpreter.profile().taken)
+        self.assertIsNone(stale)
+
+
+class TestMemoization(unittest.TestCase):
+
+    def test_purity_analysis(self):
+        intermediate, symbol_table = compile_file("tests/ci/memoFibonacci.ci")
+        # scaled reads the global n and shown prints, so only fib qualifies
+        self.assertEqual(pure_functions(intermediate.quads, symbol_table), {"fib": {"fib"}})
+        self.assertEqual(memoizable_functions(intermediate.quads, symbol_table), {"fib"})
+        intermediate, symbol_table = compile_file("tests/ci/calculator.ci")
+        self.assertEqual(sorted(pure_functions(intermediate.quads, symbol_table)), ["add", "divide", "mul", "sub"])
+        self.assertEqual(memoizable_functions(intermediate.quads, symbol_table), set())
+
+    def test_memoized_recursion_is_linear(self):
+        intermediate, symbol_table = compile_file("tests/ci/memoFibonacci.ci")
+        plain = interpret_quads(intermediate, symbol_table, [20])
+        memo = MemoTable()
+        memoized = interpret_quads(intermediate, symbol_table, [20], memo=memo)
+        self.assertEqual(memoized.output, plain.output)
+        self.assertEqual(memoized.output[0], 6765)
+        fib = next(position for position, quad in enumerate(intermediate.quads) if quad[1] == "begin_block")
+        self.assertEqual(memoized.counts[fib], 21)
+        self.assertEqual(memo.stats()["misses"], 21)
+        self.assertLess(memoized.steps * 100, plain.steps)
+
+    def test_table_is_bounded(self):
+        memo = MemoTable(2)
+        for key in [("f", 1), ("f", 2), ("f", 1), ("f", 3)]:
+            if memo.lookup(key) is None:
+                memo.store(key, key[1])
+        # ("f", 2) was the least recently used entry when ("f", 3) arrived
+        self.assertEqual(list(memo.entries), [("f", 1), ("f", 3)])
+        self.assertEqual(memo.stats(), {"size": 2, "entries": 2, "hits": 1, "misses": 3, "evictions": 1})
+        intermediate, symbol_table = compile_file("tests/ci/memoFibonacci.ci")
+        small = MemoTable(4)
+        self.assertEqual(interpret_quads(intermediate, symbol_table, [18], memo=small).output[0], 2584)
+        self.assertLessEqual(len(small.entries), 4)
+
+
+@unittest.skipUnless(np is not None, "batch execution needs NumPy")
+class TestBatchExecution(unittest.TestCase):
+
+    def assert_matches_scalar(self, input_file, records):
+        intermediate, symbol_table = compile_file(input_file)
+        batch = interpret_batch(intermediate, symbol_table, records)
+        for lane, record in enumerate(records):
+            try:
+                expected = interpret_quads(intermediate, symbol_table, record).output
+            except InterpreterError as error:
+                self.assertEqual(batch.errors.get(lane), str(error), record)
+                continue
+            self.assertNotIn(lane, batch.errors)
+            self.assertEqual(batch.record_output(lane), expected, record)
+        return batch
+
+    def test_divergent_branches(self):
+        records = [[choice, x, y] for choice in (0, 1, 2) for x in (-7, 0, 12) for y in (-2, 0, 3)]
+        batch = self.assert_matches_scalar("tests/ci/calculator.ci", records)
+        # Lanes with choice <> 1 and y = 0 stop at the division, the others finish
+        self.assertEqual(len(batch.errors), 6)
+
+    def test_loops_and_recursion(self):
+        self.assert_matches_scalar("tests/ci/factorial.ci", [[n] for n in range(13)])
+        self.assert_matches_scalar("tests/ci/profileGuided.ci", [[n] for n in range(0, 40, 3)])
+        self.assert_matches_scalar("tests/ci/memoFibonacci.ci", [[n] for n in range(10)])
+
+    def test_lanes_run_in_lockstep(self):
+        intermediate, symbol_table = compile_file("tests/ci/factorial.ci")
+        batch = interpret_batch(intermediate, symbol_table, [[7]] * 1000)
+        scalar = interpret_quads(intermediate, symbol_table, [7])
+        self.assertEqual(batch.steps, scalar.steps)
+        self.assertEqual(batch.counts, [count * 1000 for count in scalar.counts])
+
+    def test_missing_input(self):
+        intermediate, symbol_table = compile_file("tests/ci/factorial.ci")
+        batch = interpret_batch(intermediate, symbol_table, [[3], [], [4, 9]])
+        self.assertEqual(batch.errors, {1: "input: no more values"})
+        self.assertEqual(batch.record_output(2), [24])
+
+
+class TestStreamingEmission(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def stream(self, tokens, window):
+        int_file, asm_file = io.StringIO(), io.StringIO()
+        writer = QuadStreamWriter(int_file, asm_file)
+        intermediate = StreamingIntermediateCodeGenerator(writer, window)
+        with contextlib.redirect_stdout(io.StringIO()):
+            parser = Parser(tokens, intermediate)
+            writer.symbol_table = parser.symbol_table
+            parser.program()
+        intermediate.close()
+        return intermediate, int_file.getvalue(), asm_file.getvalue()
+
+    def whole(self, tokens):
+        intermediate = IntermediateCodeGenerator()
+        with contextlib.redirect_stdout(io.StringIO()):
+            parser = Parser(tokens, intermediate)
+            parser.program()
+        asm = "".join(line + "\n" for line in generate_asm(intermediate, parser.symbol_table, "program"))
+        return format_int(intermediate), asm
+
+    def test_output_matches_whole_program_build(self):
+        for name in ("calculator", "memoFibonacci", "switchDispatch", "testForcase", "testIncase", "linkMain",
+                     "nestedScopes"):
+            tokens = LexerFSM(f"tests/ci/{name}.ci").tokenize()
+            for window in (1, 5, 4096):
+                intermediate, int_text, asm_text = self.stream(tokens, window)
+                self.assertEqual((int_text, asm_text), self.whole(tokens), (name, window))
+
+    def test_memory_is_bounded_by_nesting(self):
+        statement = "while (i < n) { if (i = 3) { total := total + i } else { total := total - 1 }; i := i + 1 };\n"
+        path = os.path.join(self.tmp, "long.ci")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("program long\ndeclare i, n, total;\n{\ninput(n);\n")
+            f.write("i := 0;\n" + statement * 500)
+            f.write("print(total)\n}.\n")
+        tokens = LexerFSM(path).tokenize()
+        intermediate, int_text, asm_text = self.stream(tokens, 32)
+        self.assertGreater(intermediate.next_quad_index, 5000)
+        self.assertLess(intermediate.peak, 64)
+        self.assertEqual((int_text, asm_text), self.whole(tokens))
+
+
+class TestIncrementalCompilation(unittest.TestCase):
+
+    def compile(self, compiler, source):
+        with contextlib.redirect_stdout(io.StringIO()):
+            intermediate, symbol_table, asm_lines = compiler.compile(source, "program.ci")
+            expected = compile_source(source, "program.ci")
+        # Whatever was reused, the result is what a full compile produces
+        self.assertEqual(format_int(intermediate), expected["int"])
+        self.assertEqual("".join(line + "\n" for line in asm_lines), expected["asm"])
+        return intermediate, symbol_table
+
+    def test_only_changed_subprograms_are_parsed(self):
+        with open("tests/ci/calculator.ci", "r", encoding="utf-8") as file:
+            source = file.read()
+        compiler = IncrementalCompiler()
+        self.compile(compiler, source)
+        self.assertEqual(compiler.reused, [])
+        # add grows by two quads and a temporary, so everything after it moves
+        intermediate, symbol_table = self.compile(compiler, source.replace("return (x + y)", "return (x + y + 1)"))
+        self.assertEqual(compiler.reused, ["sub", "mul", "divide"])
+        self.assertEqual([p.name for p in symbol_table.subprograms["mul"].parameters], ["x", "y"])
+        self.assertEqual(interpret_quads(intermediate, symbol_table, [2, 6, 3]).output, [18, 2])
+
+    def test_global_changes_reach_replayed_subprograms(self):
+        with open("tests/ci/memoFibonacci.ci", "r", encoding="utf-8") as file:
+            source = file.read()
+        compiler = IncrementalCompiler()
+        self.compile(compiler, source)
+        intermediate, symbol_table = self.compile(compiler, source.replace("declare n;", "declare m, n;"))
+        self.assertEqual(compiler.reused, ["fib", "scaled", "shown"])
+        scaled = next(quad for quad in intermediate.quads if quad[1] == "*")
+        self.assertIs(scaled[3].entity, symbol_table.scopes[0].entities["n"])
+
+    def test_cache_file_round_trip(self):
+        with open("tests/ci/profileGuided.ci", "r", encoding="utf-8") as file:
+            source = file.read()
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "cache")
+            compiler = IncrementalCompiler.load(path)
+            self.compile(compiler, source)
+            compiler.save(path)
+            loaded = IncrementalCompiler.load(path)
+        finally:
+            shutil.rmtree(directory)
+        asm = loaded.snapshots["weight"].asm
+        self.compile(loaded, source.replace("(v - 100)", "(v - 99)"))
+        self.assertEqual(loaded.reused, ["weight"])
+        # The loaded snapshot's assembly is reused rather than generated again
+        self.assertIs(loaded.snapshots["weight"].asm, asm)
+
+    def test_cache_that_is_not_current_is_ignored(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "cache")
+            for content in (b"\x80\x04K\x01.", b"[1, 2]", b'{"version": 0, "snapshots": {}}',
+                            b'{"version": 1, "snapshots": {"f": {"name": "f"}}}'):
+                with open(path, "wb") as file:
+                    file.write(content)
+                with contextlib.redirect_stdout(io.StringIO()) as stdout:
+                    compiler = IncrementalCompiler.load(path)
+                self.assertEqual(compiler.snapshots, {})
+                self.assertIn("not a current incremental cache", stdout.getvalue())
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestSeparateCompilation(unittest.TestCase):
+
+    def read(self, path):
+        with open(path, "r", encoding="utf-8") as file:
+            return file.read()
+
+    def units(self, *sources):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [compile_unit(source, f"unit{number}.ci") for number, source in enumerate(sources)]
+
+    def test_link_matches_single_file_build(self):
+        library = self.read("tests/ci/linkMathLib.ci")
+        program = self.read("tests/ci/linkMain.ci")
+        intermediate, symbol_table, asm_lines = link_units(self.units(library, program))
+        # The same subprograms pasted in front of the program's own
+        subprograms = library[library.index("function square"):library.index("# main #")]
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = compile_source(program.replace("declare x, y;\n", "declare x, y;\n" + subprograms), "linkMain.ci")
+        self.assertEqual(format_int(intermediate), expected["int"])
+        self.assertEqual("".join(line + "\n" for line in asm_lines), expected["asm"])
+        self.assertEqual(interpret_quads(intermediate, symbol_table, [4]).output, [4, 64, 20])
+
+    def test_object_file_round_trip(self):
+        library, program = self.units(self.read("tests/ci/linkMathLib.ci"), self.read("tests/ci/linkMain.ci"))
+        directory = tempfile.mkdtemp()
+        try:
+            loaded = []
+            for unit in (library, program):
+                path = os.path.join(directory, unit.name.replace(".ci", ".cio"))
+                write_object_unit(unit, path)
+                loaded.append(read_object_unit(path))
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(sorted(loaded[0].exports()), ["power", "square", "swap"])
+        intermediate, symbol_table, asm_lines = link_units(loaded)
+        expected = link_units([library, program])
+        self.assertEqual(format_int(intermediate), format_int(expected[0]))
+        self.assertEqual(asm_lines, expected[2])
+
+    def test_object_file_that_is_not_current_is_rejected(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "unit.cio")
+            for content in (b"\x80\x04K\x01.", b"[1, 2]", b'{"version": 1, "unit": {}}',
+                            b'{"version": 2, "unit": {"name": "unit.ci"}}'):
+                with open(path, "wb") as file:
+                    file.write(content)
+                with self.assertRaises(ValueError) as raised:
+                    read_object_unit(path)
+                self.assertIn("is not a current object unit", str(raised.exception))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_link_errors(self):
+        library = self.read("tests/ci/linkMathLib.ci")
+        program = self.read("tests/ci/linkMain.ci")
+        cases = [
+            ([program], "unresolved call to 'square' in 'sumSquares'"),
+            ([library, library, program], "defined in both"),
+            ([library, program.replace("power(in x, in 3)", "power(in x, inout y)")], "does not match"),
+            ([library.replace("return (k * k)", "return (k * unused)"), program], "uses the global 'unused'"),
+        ]
+        for sources, message in cases:
+            with self.assertRaises(ValueError) as raised:
+                link_units(self.units(*sources))
+            self.assertIn(message, str(raised.exception))
+
+
 if __name__ == "__main__":
     unittest.main()